@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='starting_balance',
+            field=models.DecimalField(decimal_places=2, default=100000, max_digits=20),
+        ),
+    ]
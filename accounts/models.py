@@ -7,6 +7,8 @@ from django.conf import settings
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     balance = models.DecimalField(max_digits=20, decimal_places=2, default=settings.INITIAL_BALANCE)
+    # Cash the account opened with; the ledger replays transactions from it
+    starting_balance = models.DecimalField(max_digits=20, decimal_places=2, default=settings.INITIAL_BALANCE)
     date_joined = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
@@ -3,7 +3,7 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .forms import UserRegisterForm, UserUpdateForm
-from market.models import Portfolio, Transaction, StockHolding
+from market.models import Portfolio, Transaction
 
 
 @login_required
@@ -21,10 +21,12 @@ def profile(request):
     # Get user's portfolio and transactions
     try:
         portfolio = Portfolio.objects.get(user=request.user)
-        holdings = StockHolding.objects.filter(portfolio=portfolio)
+        valuation = portfolio.valuation(request.user.profile.balance)
+        holdings = valuation.holdings
         transactions = Transaction.objects.filter(portfolio=portfolio).order_by('-timestamp')[:10]
     except Portfolio.DoesNotExist:
         portfolio = None
+        valuation = None
         holdings = []
         transactions = []
     
@@ -32,6 +34,7 @@ def profile(request):
         'form': form,
         'user_profile': request.user.profile,
         'portfolio': portfolio,
+        'valuation': valuation,
         'holdings': holdings,
         'transactions': transactions,
     }
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Portfolio, StockHolding, Transaction, Challenge, ChallengeParticipant
+from .models import Portfolio, StockHolding, Transaction, Challenge, ChallengeParticipant, StockQuote, LeaderboardEntry, Order
 
 @admin.register(Portfolio)
 class PortfolioAdmin(admin.ModelAdmin):
@@ -30,3 +30,19 @@ class ChallengeParticipantAdmin(admin.ModelAdmin):
     list_display = ('user', 'challenge', 'join_date', 'final_portfolio_value')
     list_filter = ('challenge',)
     search_fields = ('user__username', 'challenge__name')
+
+@admin.register(StockQuote)
+class StockQuoteAdmin(admin.ModelAdmin):
+    list_display = ('symbol', 'name', 'current_price', 'change_percent', 'volume', 'fetched_at')
+    search_fields = ('symbol', 'name')
+
+@admin.register(LeaderboardEntry)
+class LeaderboardEntryAdmin(admin.ModelAdmin):
+    list_display = ('rank', 'username', 'net_worth', 'portfolio_value', 'cash_balance', 'computed_at')
+    search_fields = ('username',)
+
+@admin.register(Order)
+class OrderAdmin(admin.ModelAdmin):
+    list_display = ('user', 'order_type', 'transaction_type', 'stock_symbol', 'quantity', 'trigger_price', 'status', 'created_at')
+    list_filter = ('status', 'order_type', 'transaction_type')
+    search_fields = ('user__username', 'stock_symbol')
@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class MarketConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'market'
+
+    def ready(self):
+        # Build the search index at startup rather than on the first query
+        from .instruments import get_instrument_index
+        get_instrument_index()
@@ -0,0 +1,296 @@
+"""
+Non-blocking quote lookups for the async views.
+
+These mirror get_stock_infos, search_stocks and get_nifty50_stocks in
+market.utils, but wait on upstream with an httpx.AsyncClient, so one ASGI
+worker can have many page loads waiting on Yahoo at once. The async client
+shares the circuit breaker and counters of the process-wide UpstreamClient,
+so both paths back off together and show up in the same stats.
+
+Everything else that can block runs in a worker thread: quote cache calls
+(the sqlite backend can wait on a write lock, the django backend may be a
+network cache), the simulated market behind fallback quotes (which builds a
+whole session at day rollover) and instrument searches. Only the in-memory
+quote cache is called directly, since it never waits on I/O.
+"""
+
+import asyncio
+import logging
+import time
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .quote_cache import MemoryQuoteCache, get_quote_cache
+from .upstream import CircuitOpenError, RateLimitedError, UpstreamError, get_upstream_client
+from .utils import (
+    NIFTY50_STOCKS, add_search_prices, get_fallback_nifty50_data, get_fallback_stock_infos,
+    get_search_url, get_yahoo_finance_url, local_search_results, normalize_symbol, parse_quote_response,
+    parse_search_response, quote_feed_enabled, record_requested_symbols, search_fallback_stocks,
+    store_quotes, stored_quote_max_age
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncUpstreamClient:
+    """httpx counterpart of UpstreamClient, sharing its retry settings, breaker and stats"""
+
+    def __init__(self, client, pool_size=10, concurrency=4):
+        self.client = client
+        self.breaker = client.breaker
+        self.stats = client.stats
+        self.http = httpx.AsyncClient(
+            timeout=client.timeout,
+            headers={'User-Agent': client.session.headers['User-Agent']},
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+        # Caps concurrent upstream calls from this worker, like QUOTE_FETCH_CONCURRENCY does for threads
+        self.limit = asyncio.Semaphore(concurrency)
+
+    async def get_json(self, url):
+        """GET url and return the decoded JSON body, raising UpstreamError on failure"""
+        allowed, probe = self.breaker.acquire()
+        if not allowed:
+            self.stats.incr('rejected')
+            raise CircuitOpenError(f"Circuit open, not calling {url}")
+        try:
+            return await self._fetch(url)
+        finally:
+            # Cancellation or an unexpected exception must not leave the breaker half-open forever
+            if probe:
+                self.breaker.release_probe()
+
+    async def _fetch(self, url):
+        """Run the retry loop for get_json, recording the outcome on the breaker"""
+        last_error = None
+        for attempt in range(self.client.max_retries + 1):
+            if attempt:
+                self.stats.incr('retries')
+                await asyncio.sleep(self.client.backoff(attempt - 1))
+
+            start = time.monotonic()
+            try:
+                async with self.limit:
+                    response = await self.http.get(url)
+            except httpx.RequestError as e:
+                self.stats.record_latency(time.monotonic() - start)
+                last_error = e
+                continue
+            self.stats.record_latency(time.monotonic() - start)
+
+            if response.status_code == 429:
+                self.stats.incr('failures')
+                self.breaker.trip()
+                raise RateLimitedError(f"Rate limited by upstream for {url}")
+
+            if response.status_code >= 500:
+                last_error = UpstreamError(f"Upstream returned {response.status_code} for {url}")
+                continue
+
+            if response.status_code != 200:
+                # Client errors are not upstream health problems, don't retry or count them
+                self.breaker.record_success()
+                raise UpstreamError(f"Upstream returned {response.status_code} for {url}")
+
+            try:
+                data = response.json()
+            except ValueError as e:
+                last_error = e
+                continue
+            self.stats.incr('successes')
+            self.breaker.record_success()
+            return data
+
+        self.stats.incr('failures')
+        self.breaker.record_failure()
+        raise UpstreamError(f"Upstream request failed after {self.client.max_retries + 1} attempts: {last_error}")
+
+
+# httpx connections belong to the event loop that opened them, so each loop
+# gets its own client. Under uvicorn that is one per worker process.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_upstream_client():
+    """Return the async upstream client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.client is not get_upstream_client():
+        client = _async_clients[loop] = AsyncUpstreamClient(
+            get_upstream_client(),
+            pool_size=getattr(settings, 'UPSTREAM_POOL_SIZE', 10),
+            concurrency=getattr(settings, 'QUOTE_FETCH_CONCURRENCY', 4),
+        )
+    return client
+
+
+def in_thread(func):
+    """func as a coroutine function run in a worker thread, for blocking calls that don't use the ORM"""
+    return sync_to_async(func, thread_sensitive=False)
+
+
+async def acache_call(method, *args, **kwargs):
+    """Call a quote cache method without blocking the event loop"""
+    if isinstance(getattr(method, '__self__', None), MemoryQuoteCache):
+        return method(*args, **kwargs)
+    return await in_thread(method)(*args, **kwargs)
+
+
+async def aget_stock_info(symbol):
+    """Async get_stock_info"""
+    return (await aget_stock_infos([symbol]))[symbol]
+
+
+async def aget_stock_infos(symbols, deadline=None):
+    """Async get_stock_infos: cache, then stored snapshots, then batched upstream requests"""
+    requested = {symbol: normalize_symbol(symbol) for symbol in symbols}
+    wanted = list(dict.fromkeys(requested.values()))
+
+    cache = get_quote_cache()
+    found = await acache_call(cache.get_many, wanted)
+    missing = [symbol for symbol in wanted if symbol not in found]
+
+    if missing:
+        stored = await aload_stored_quotes(missing)
+        if stored:
+            await acache_call(cache.update_many, stored)
+            found.update(stored)
+            missing = [symbol for symbol in missing if symbol not in stored]
+
+    if missing and quote_feed_enabled():
+        await in_thread(record_requested_symbols)(missing)
+        fallback = await in_thread(get_fallback_stock_infos)(missing)
+        await acache_call(cache.update_many, fallback, ttl=getattr(settings, 'QUOTE_CACHE_FALLBACK_TTL', 15))
+        found.update(fallback)
+    elif missing:
+        fetched, pending = await afetch_stock_infos_within(missing, deadline)
+        if fetched:
+            await acache_call(cache.update_many, fetched)
+            await sync_to_async(store_quotes)(list(fetched.values()))
+            found.update(fetched)
+
+        fallback = await in_thread(get_fallback_stock_infos)([
+            symbol for symbol in missing if symbol not in fetched and symbol not in pending
+        ])
+        if fallback:
+            await acache_call(cache.update_many, fallback, ttl=getattr(settings, 'QUOTE_CACHE_FALLBACK_TTL', 15))
+            found.update(fallback)
+
+    return {
+        symbol: found[normalized]
+        for symbol, normalized in requested.items() if normalized in found
+    }
+
+
+async def aload_stored_quotes(symbols):
+    """Async load_stored_quotes"""
+    from .models import StockQuote
+    try:
+        quotes = StockQuote.objects.fresh(stored_quote_max_age()).filter(symbol__in=symbols)
+        return {quote.symbol: quote.to_stock_info() async for quote in quotes}
+    except Exception as e:
+        logger.error(f"Error loading stored quotes: {e}")
+        return {}
+
+
+async def afetch_stock_infos_within(symbols, deadline):
+    """
+    Fetch quote chunks concurrently. Returns (results, pending) like
+    fetch_stock_infos_within; chunks still running at the deadline cache
+    their quotes when they complete.
+    """
+    batch_size = getattr(settings, 'QUOTE_BATCH_SIZE', 50)
+    chunks = [symbols[start:start + batch_size] for start in range(0, len(symbols), batch_size)]
+    if not chunks:
+        return {}, set()
+
+    client = get_async_upstream_client()
+    tasks = {asyncio.ensure_future(_afetch_quote_batch(client, chunk)): chunk for chunk in chunks}
+    done, not_done = await asyncio.wait(tasks, timeout=deadline)
+
+    results = {}
+    for task in done:
+        results.update(task.result())
+
+    pending = set()
+    for task in not_done:
+        pending.update(tasks[task])
+        late = asyncio.ensure_future(_acache_late_quotes(task))
+        _late_tasks.add(late)
+        late.add_done_callback(_late_tasks.discard)
+    return results, pending
+
+
+# The event loop only keeps weak references to tasks
+_late_tasks = set()
+
+
+async def _acache_late_quotes(task):
+    """Cache quotes from a chunk that finished after its caller stopped waiting"""
+    try:
+        fetched = await task
+        if fetched:
+            await acache_call(get_quote_cache().update_many, fetched)
+    except Exception as e:
+        logger.error(f"Error caching late quotes: {e}")
+
+
+async def _afetch_quote_batch(client, symbols):
+    """Fetch and parse one multi-symbol quote request"""
+    try:
+        url = get_yahoo_finance_url("quote", {"symbols": ",".join(symbols)})
+        return parse_quote_response(await client.get_json(url), symbols)
+    except CircuitOpenError:
+        return {}
+    except RateLimitedError:
+        logger.warning(f"Rate limit exceeded for Yahoo Finance API. Using fallback data.")
+        return {}
+    except Exception as e:
+        logger.error(f"Error fetching stock data for {','.join(symbols)}: {e}")
+        return {}
+
+
+async def asearch_stocks(query):
+    """Async search_stocks"""
+    try:
+        results = await in_thread(local_search_results)(query)
+        if not results:
+            data = await get_async_upstream_client().get_json(get_search_url(query))
+            results = parse_search_response(data)
+
+        detailed_infos = await aget_stock_infos(
+            [stock_info['symbol'] for stock_info in results],
+            deadline=getattr(settings, 'SEARCH_QUOTE_DEADLINE', 1.5)
+        )
+        add_search_prices(results, detailed_infos)
+
+        if results:
+            await in_thread(record_requested_symbols)([stock_info['symbol'] for stock_info in results])
+            return results
+        return await in_thread(search_fallback_stocks)(query)
+
+    except CircuitOpenError:
+        return await in_thread(search_fallback_stocks)(query)
+    except RateLimitedError:
+        logger.warning(f"Rate limit exceeded when searching stocks. Using fallback data.")
+        return await in_thread(search_fallback_stocks)(query)
+    except Exception as e:
+        logger.error(f"Error searching stocks for {query}: {e}")
+        return await in_thread(search_fallback_stocks)(query)
+
+
+async def aget_nifty50_stocks():
+    """Async get_nifty50_stocks"""
+    try:
+        stock_infos = await aget_stock_infos([stock['symbol'] for stock in NIFTY50_STOCKS])
+        nifty50_data = [stock_info for stock_info in stock_infos.values() if stock_info]
+        if nifty50_data:
+            return nifty50_data
+        logger.warning("Using fallback data for Nifty 50 stocks due to API limitations")
+        return await in_thread(get_fallback_nifty50_data)()
+    except Exception as e:
+        logger.error(f"Error fetching Nifty 50 stocks: {e}")
+        return await in_thread(get_fallback_nifty50_data)()
@@ -0,0 +1,148 @@
+"""
+Async versions of the views that wait on upstream quotes.
+
+Served instead of their counterparts in market.views when ASYNC_VIEWS is
+enabled and the project runs under an ASGI server (see the README). Quotes
+and database reads are awaited; templates are rendered in a worker thread
+because base.html reads request.user and the profile lazily.
+
+quote_stream holds its connection open, so it is only served (and linked
+from pages) when ASYNC_VIEWS is enabled.
+"""
+
+import json
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
+
+from accounts.models import UserProfile
+
+from . import views
+from .async_quotes import acache_call, aget_nifty50_stocks, aget_stock_info, asearch_stocks
+from .models import StockHolding
+from .quote_cache import get_quote_cache
+from .streaming import get_quote_broadcaster
+from .utils import normalize_symbol
+from .valuation import value_holding
+
+arender = sync_to_async(render)
+
+
+async def _balance(user):
+    return await UserProfile.objects.filter(user=user).values_list('balance', flat=True).afirst()
+
+
+async def index(request):
+    """Home page view"""
+    version = await acache_call(get_quote_cache().quote_version)
+    context = views.index_context(version)
+    if len(await cache.aget_many(views.index_fragment_keys(version))) == len(views.INDEX_FRAGMENTS):
+        return await arender(request, 'market/index.html', context)
+
+    nifty50_data = await aget_nifty50_stocks()
+
+    gainers, losers = views.top_movers(nifty50_data)
+
+    context.update({
+        'nifty50_data': nifty50_data[:10],
+        'gainers': gainers,
+        'losers': losers
+    })
+    return await arender(request, 'market/index.html', context)
+
+
+@login_required
+async def stock_detail(request, symbol):
+    """View details of a specific stock"""
+    user = await request.auser()
+    stock_info = await aget_stock_info(symbol)
+
+    if not stock_info:
+        messages.error(request, "Could not retrieve stock information. Please try again later.")
+        return redirect('market:dashboard')
+
+    holding = await StockHolding.objects.filter(portfolio__user=user, stock_symbol=symbol).afirst()
+    if holding is not None:
+        holding = value_holding(holding, Decimal(str(stock_info['current_price'])))
+
+    context = {
+        'stock': stock_info,
+        'holding': holding,
+        'balance': await _balance(user)
+    }
+    return await arender(request, 'market/stock_detail.html', context)
+
+
+@login_required
+async def trade(request):
+    """View for trading stocks; orders are placed by the sync view"""
+    if request.method == 'POST':
+        return await sync_to_async(views.trade)(request)
+
+    user = await request.auser()
+    query = request.GET.get('q', '')
+    if query:
+        stocks = await asearch_stocks(query)
+    else:
+        stocks = await aget_nifty50_stocks()
+
+    context = {
+        'stocks': stocks,
+        'query': query,
+        'balance': await _balance(user)
+    }
+    return await arender(request, 'market/trade.html', context)
+
+
+@login_required
+async def search_stock_api(request):
+    """API endpoint for searching stocks"""
+    query = request.GET.get('q', '')
+    if not query:
+        return JsonResponse({'results': []})
+
+    return JsonResponse({'results': await asearch_stocks(query)})
+
+
+@login_required
+async def quote_stream(request):
+    """Server-Sent Events stream of price changes for ?symbols=A.NS,B.NS"""
+    # Under WSGI the endless stream would be buffered and hold a worker forever
+    if not getattr(settings, 'ASYNC_VIEWS', False):
+        raise Http404("Live quotes need ASYNC_VIEWS")
+
+    max_symbols = getattr(settings, 'STREAM_MAX_SYMBOLS', 100)
+    symbols = {
+        normalize_symbol(symbol.strip().upper())
+        for symbol in request.GET.get('symbols', '').split(',') if symbol.strip()
+    }
+    if not symbols or len(symbols) > max_symbols:
+        return JsonResponse({'error': f"Pass between 1 and {max_symbols} comma-separated symbols."}, status=400)
+
+    heartbeat = getattr(settings, 'STREAM_HEARTBEAT', 15)
+
+    async def events():
+        broadcaster = get_quote_broadcaster()
+        subscription = broadcaster.subscribe(symbols)
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                changes = await subscription.next(timeout=heartbeat)
+                if changes:
+                    yield f'data: {json.dumps(changes)}\n\n'
+                else:
+                    # Keeps proxies from closing an idle connection
+                    yield ': keepalive\n\n'
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
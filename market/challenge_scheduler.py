@@ -0,0 +1,95 @@
+"""
+Challenge lifecycle scheduler used by the run_challenge_scheduler command.
+
+Moves challenges from pending to active at start_date and from active to
+completed at end_date. Closing a challenge values every participant not
+yet valued with one bulk valuation and stores the results in
+final_portfolio_value, so completed standings come straight from the
+database from then on and frozen values are never overwritten.
+"""
+
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Challenge, ChallengeParticipant
+from .rankings import invalidate_standings
+from .utils import get_current_stock_prices
+from .valuation import HoldingsMatrix, to_money
+
+logger = logging.getLogger(__name__)
+
+
+def start_due_challenges(now=None):
+    """Activate pending challenges whose start date has passed; returns how many"""
+    now = now or timezone.now()
+    return Challenge.objects.filter(
+        status=Challenge.PENDING, start_date__lte=now, end_date__gt=now
+    ).update(status=Challenge.ACTIVE)
+
+
+def close_challenge(challenge):
+    """Freeze the current net worth of participants not yet valued and mark the challenge completed"""
+    # Values already frozen stay as they are, only unvalued participants are priced
+    unvalued = ChallengeParticipant.objects.filter(challenge=challenge, final_portfolio_value__isnull=True)
+    # Price before taking the row locks so an upstream call never holds them
+    matrix = HoldingsMatrix.load(user_ids=unvalued.values('user_id'))
+    valuation = matrix.value(get_current_stock_prices(matrix.symbols) if matrix.symbols else {})
+    net_worth = dict(zip(valuation.user_ids.tolist(), valuation.net_worth.tolist()))
+
+    with transaction.atomic():
+        participants = list(
+            unvalued.select_for_update()
+            .only('id', 'user_id', 'final_portfolio_value')
+        )
+        for participant in participants:
+            value = net_worth.get(participant.user_id)
+            # Participants without a portfolio never traded
+            participant.final_portfolio_value = to_money(value) if value is not None else challenge.initial_balance
+        ChallengeParticipant.objects.bulk_update(participants, ['final_portfolio_value'], batch_size=1000)
+        Challenge.objects.filter(id=challenge.id).update(status=Challenge.COMPLETED)
+
+    invalidate_standings(challenge)
+    return len(participants)
+
+
+def close_due_challenges(now=None):
+    """Close every challenge whose end date has passed; returns how many"""
+    now = now or timezone.now()
+    # Challenge.save marks challenges saved after their end date completed
+    # straight away, so those still need their final values frozen
+    due = Challenge.objects.filter(
+        Q(status__in=[Challenge.PENDING, Challenge.ACTIVE])
+        | Q(status=Challenge.COMPLETED, participants__final_portfolio_value__isnull=True),
+        end_date__lte=now,
+    ).distinct().order_by('end_date')
+
+    closed = 0
+    for challenge in due:
+        frozen = close_challenge(challenge)
+        logger.info(f"Closed challenge {challenge.id} ({challenge.name}) with {frozen} participants")
+        closed += 1
+    return closed
+
+
+def run_scheduler(interval, once=False):
+    """Apply due status transitions every interval seconds"""
+    while True:
+        started = time.monotonic()
+        now = timezone.now()
+        closed = started_count = 0
+        try:
+            closed = close_due_challenges(now)
+            started_count = start_due_challenges(now)
+        except Exception as e:
+            # Keep the scheduler alive; the next pass retries whatever is still due
+            logger.error(f"Error applying challenge transitions: {e}")
+        if closed or started_count:
+            logger.info(f"Started {started_count} and closed {closed} challenges")
+
+        if once:
+            return started_count, closed
+        time.sleep(max(0, interval - (time.monotonic() - started)))
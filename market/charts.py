@@ -0,0 +1,102 @@
+"""
+JSON data behind the dashboard charts, with validators for conditional GETs.
+
+A portfolio's chart data only changes when it trades, when a cached price
+changes (the quote version) or, for the history, when the snapshot job
+writes or rewrites a row. The chart endpoints derive their ETag and Last-Modified from
+those alone, so a repeat request for unchanged data is answered with a 304
+before any holding is priced or snapshot read.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Count, Max
+
+from .models import Portfolio
+from .quote_cache import get_quote_cache
+from .snapshots import get_portfolio_history, snapshot_portfolios
+
+
+def chart_state(request):
+    """(portfolio, (last transaction id, timestamp), quote version) of the requesting user, looked up once per request"""
+    if not hasattr(request, '_chart_state'):
+        # Read the version before any data so a response is never tagged newer than its contents
+        version = get_quote_cache().quote_version()
+        portfolio = Portfolio.objects.filter(user=request.user).first()
+        last_transaction = None
+        if portfolio is not None:
+            last_transaction = portfolio.transactions.order_by('-id').values_list('id', 'timestamp').first()
+        request._chart_state = (portfolio, last_transaction, version)
+    return request._chart_state
+
+
+def holdings_etag(request):
+    portfolio, last_transaction, version = chart_state(request)
+    if portfolio is None:
+        return 'empty'
+    return f"{portfolio.id}-{last_transaction[0] if last_transaction else 0}-{version}"
+
+
+def history_etag(request):
+    portfolio = chart_state(request)[0]
+    if portfolio is None:
+        return 'empty'
+    # The snapshot job upserts rows in place, keeping their ids, so the tag
+    # follows the row count and the latest rewrite instead
+    snapshots = portfolio.snapshots.aggregate(count=Count('id'), updated=Max('updated_at'))
+    updated = snapshots['updated'].timestamp() if snapshots['updated'] else 0
+    return f"{holdings_etag(request)}-{snapshots['count']}-{updated}"
+
+
+def holdings_last_modified(request):
+    _, last_transaction, version = chart_state(request)
+    changed = datetime.fromtimestamp(version / 1e9, tz=dt_timezone.utc)
+    if last_transaction is not None:
+        changed = max(changed, last_transaction[1])
+    return changed
+
+
+def portfolio_history_data(portfolio):
+    """Daily net worth, building the snapshots first if the snapshot job has not covered the portfolio yet"""
+    history = get_portfolio_history(portfolio)
+    if not history and portfolio.transactions.exists():
+        snapshot_portfolios([portfolio.id])
+        history = get_portfolio_history(portfolio)
+    return history
+
+
+def allocation_data(valuation):
+    """Share of the holdings value in each symbol"""
+    total = float(valuation.total_value)
+    return [
+        {
+            'symbol': holding.stock_symbol,
+            'value': float(holding.current_value),
+            'weight': round(float(holding.current_value) / total * 100, 2) if total else 0.0,
+        }
+        for holding in valuation.holdings
+    ]
+
+
+def holdings_data(valuation):
+    """Every priced holding plus the portfolio totals"""
+    return {
+        'holdings': [
+            {
+                'symbol': holding.stock_symbol,
+                'name': holding.stock_name,
+                'quantity': holding.quantity,
+                'average_buy_price': float(holding.average_buy_price),
+                'current_price': float(holding.current_price),
+                'current_value': float(holding.current_value),
+                'profit_loss': float(holding.profit_loss),
+                'profit_loss_percentage': float(holding.profit_loss_percentage),
+            }
+            for holding in valuation.holdings
+        ],
+        'total_value': float(valuation.total_value),
+        'invested_value': float(valuation.invested_value),
+        'total_profit': float(valuation.total_profit),
+        'cash_balance': float(valuation.cash_balance),
+        'net_worth': float(valuation.net_worth),
+    }
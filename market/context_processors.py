@@ -0,0 +1,9 @@
+from django.conf import settings
+from django.urls import reverse
+
+
+def quote_stream(request):
+    """Expose the live quote stream URL to templates when async views can serve it"""
+    if not getattr(settings, 'ASYNC_VIEWS', False):
+        return {}
+    return {'quote_stream_url': reverse('market:quote_stream')}
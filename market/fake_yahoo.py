@@ -0,0 +1,150 @@
+"""
+Local stand-in for the Yahoo Finance endpoints used by market.utils.
+
+Serves v8/finance/quote, v8/finance/chart and v1/finance/search from the
+simulated market, with configurable latency, server errors and 429 rate
+limiting. Point YAHOO_FINANCE_BASE_URL at it to exercise the real HTTP path
+(pooling, retries, circuit breaker) without network access.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from .instruments import get_instrument_index
+from .simulation import SECONDS_PER_DAY, MarketSimulator
+
+YAHOO_FIELDS = {
+    'regularMarketPrice': 'current_price',
+    'regularMarketChange': 'change',
+    'regularMarketChangePercent': 'change_percent',
+    'regularMarketPreviousClose': 'previous_close',
+    'regularMarketOpen': 'open',
+    'regularMarketDayHigh': 'day_high',
+    'regularMarketDayLow': 'day_low',
+    'regularMarketVolume': 'volume',
+    'marketCap': 'market_cap',
+    'trailingPE': 'pe_ratio',
+    'dividendYield': 'dividend_yield',
+    'fiftyTwoWeekHigh': 'fifty_two_week_high',
+    'fiftyTwoWeekLow': 'fifty_two_week_low',
+}
+
+
+class FakeYahooHandler(BaseHTTPRequestHandler):
+    """Request handler; behaviour is configured on the owning FakeYahooServer"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.count_request()
+        delay = server.latency + random.uniform(0, server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        roll = server.random.random()
+        if roll < server.rate_limit_rate:
+            return self._send(429, {'error': 'Too Many Requests'})
+        if roll < server.rate_limit_rate + server.error_rate:
+            return self._send(500, {'error': 'Internal Server Error'})
+
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path == '/v8/finance/quote':
+            return self._send(200, self._quote(params))
+        if url.path.startswith('/v8/finance/chart/'):
+            return self._send(200, self._chart(url.path.rsplit('/', 1)[-1], params))
+        if url.path == '/v1/finance/search':
+            return self._send(200, self._search(params))
+        return self._send(404, {'error': 'Not Found'})
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _quote(self, params):
+        symbols = [symbol for symbol in params.get('symbols', '').split(',') if symbol]
+        quotes = self.server.simulator.quotes(symbols)
+        index = get_instrument_index()
+        result = []
+        for symbol in symbols:
+            instrument = index.get(symbol)
+            quote = {'symbol': symbol, 'longName': instrument.name if instrument else symbol}
+            quote.update({field: quotes[symbol][key] for field, key in YAHOO_FIELDS.items()})
+            result.append(quote)
+        return {'quoteResponse': {'result': result, 'error': None}}
+
+    def _chart(self, symbol, params):
+        days = {'5d': 5, '1mo': 30, '3mo': 90, '6mo': 180, '1y': 365, '2y': 730, '5y': 1825}
+        today = int(time.time() // SECONDS_PER_DAY)
+        bars = self.server.simulator.daily_bars([symbol], today - days.get(params.get('range'), 365), today - 1)[symbol]
+        return {'chart': {'result': [{
+            'meta': {'symbol': symbol},
+            'timestamp': bars['timestamp'],
+            'indicators': {'quote': [{column: bars[column] for column in ('open', 'high', 'low', 'close', 'volume')}]},
+        }], 'error': None}}
+
+    def _search(self, params):
+        matches = get_instrument_index().search(params.get('q', ''), limit=int(params.get('quotesCount', 10)))
+        quotes = [
+            {'symbol': instrument.symbol, 'longname': instrument.name, 'shortname': instrument.name, 'exchange': 'NSI'}
+            for instrument in matches
+        ]
+        return {'quotes': quotes, 'news': []}
+
+
+class FakeYahooServer(ThreadingHTTPServer):
+    """
+    Threaded fake Yahoo Finance server.
+
+    latency/jitter are seconds added to every response; error_rate and
+    rate_limit_rate are the probabilities of answering 500 or 429.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 rate_limit_rate=0.0, seed=0):
+        super().__init__((host, port), FakeYahooHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.random = random.Random(seed)
+        self.simulator = MarketSimulator(seed=seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def start(self):
+        """Serve in a background thread and return the base URL"""
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-yahoo', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
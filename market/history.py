@@ -0,0 +1,131 @@
+"""
+On-disk historical OHLCV bar store.
+
+Bars are kept per symbol and interval as one fixed-width binary file per
+column (timestamp, open, high, low, close, volume) under HISTORY_ROOT:
+
+    <HISTORY_ROOT>/<interval>/<symbol>/<column>.bin
+
+Reads memory-map the column files and slice them by timestamp, so a range
+query returns views into the page cache instead of parsing or copying data.
+"""
+
+import os
+import re
+import threading
+
+import numpy as np
+from django.conf import settings
+
+COLUMNS = (
+    ('timestamp', np.dtype('<i8')),  # Unix seconds, strictly increasing
+    ('open', np.dtype('<f8')),
+    ('high', np.dtype('<f8')),
+    ('low', np.dtype('<f8')),
+    ('close', np.dtype('<f8')),
+    ('volume', np.dtype('<i8')),
+)
+INTERVALS = ('1m', '5m', '15m', '1h', '1d')
+
+_SYMBOL_RE = re.compile(r'^[A-Za-z0-9&._^-]{1,20}$')
+
+
+class BarStore:
+    """Append-only columnar bar files read through memory maps"""
+
+    def __init__(self, root):
+        self.root = str(root)
+        self._write_lock = threading.Lock()
+
+    def _path(self, symbol, interval, column=None):
+        if interval not in INTERVALS:
+            raise ValueError(f"Unknown interval: {interval}")
+        if not _SYMBOL_RE.match(symbol) or symbol.startswith('.'):
+            raise ValueError(f"Invalid symbol: {symbol}")
+        path = os.path.join(self.root, interval, symbol)
+        return os.path.join(path, f"{column}.bin") if column else path
+
+    def _map(self, symbol, interval, column, dtype, length):
+        if length == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._path(symbol, interval, column), dtype=dtype, mode='r', shape=(length,))
+
+    def count(self, symbol, interval):
+        """Number of complete bars stored for a symbol"""
+        try:
+            size = os.path.getsize(self._path(symbol, interval, 'timestamp'))
+        except FileNotFoundError:
+            return 0
+        return size // COLUMNS[0][1].itemsize
+
+    def last_timestamp(self, symbol, interval):
+        """Timestamp of the newest stored bar, or None"""
+        length = self.count(symbol, interval)
+        if not length:
+            return None
+        return int(self._map(symbol, interval, 'timestamp', COLUMNS[0][1], length)[-1])
+
+    def append(self, symbol, interval, bars):
+        """
+        Append bars (a dict of equal-length column sequences) for a symbol.
+        Bars not newer than the last stored timestamp are skipped; returns the
+        number of bars written.
+        """
+        timestamps = np.asarray(bars['timestamp'], dtype=COLUMNS[0][1])
+        if len(timestamps) and np.any(np.diff(timestamps) <= 0):
+            raise ValueError("Bar timestamps must be strictly increasing")
+
+        with self._write_lock:
+            last = self.last_timestamp(symbol, interval)
+            keep = timestamps > last if last is not None else np.ones(len(timestamps), dtype=bool)
+            if not keep.any():
+                return 0
+
+            os.makedirs(self._path(symbol, interval), exist_ok=True)
+            self._truncate_partial(symbol, interval)
+            # Timestamps are written last: readers size everything off that
+            # column, so a partially appended batch is never visible
+            for column, dtype in COLUMNS[1:] + COLUMNS[:1]:
+                values = np.asarray(bars[column], dtype=dtype)[keep]
+                with open(self._path(symbol, interval, column), 'ab') as f:
+                    f.write(values.tobytes())
+            return int(keep.sum())
+
+    def _truncate_partial(self, symbol, interval):
+        """Cut every column back to the stored bar count, dropping what a crashed append left behind"""
+        length = self.count(symbol, interval)
+        for column, dtype in COLUMNS:
+            path = self._path(symbol, interval, column)
+            try:
+                if os.path.getsize(path) > length * dtype.itemsize:
+                    os.truncate(path, length * dtype.itemsize)
+            except FileNotFoundError:
+                pass
+
+    def read(self, symbol, interval, start=None, end=None):
+        """
+        Return a dict of column arrays for bars with start <= timestamp <= end.
+        The arrays are memory-mapped views; nothing is copied until used.
+        """
+        length = self.count(symbol, interval)
+        timestamps = self._map(symbol, interval, 'timestamp', COLUMNS[0][1], length)
+        lo = 0 if start is None else int(np.searchsorted(timestamps, start, side='left'))
+        hi = length if end is None else int(np.searchsorted(timestamps, end, side='right'))
+        return {
+            column: self._map(symbol, interval, column, dtype, length)[lo:hi]
+            for column, dtype in COLUMNS
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_bar_store():
+    """Return the process-wide bar store rooted at HISTORY_ROOT"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = BarStore(getattr(settings, 'HISTORY_ROOT', 'history'))
+    return _store
@@ -0,0 +1,199 @@
+"""
+Instrument master list and the in-memory index used for symbol search.
+
+The master list is a CSV in the format of NSE's EQUITY_L.csv (SYMBOL,
+NAME OF COMPANY, SERIES, ...). A small list ships in market/data; point
+INSTRUMENTS_PATH at a current EQUITY_L.csv to search the full universe.
+
+The index is built once per process. Matches are ranked in tiers:
+
+    0. exact symbol            (tcs -> TCS.NS)
+    1. symbol prefix           (hdfc -> HDFCBANK.NS, HDFCLIFE.NS, ...)
+    2. company name prefix     (tata con -> Tata Consumer, Tata Consultancy)
+    3. name word prefixes      (motors -> Tata Motors, Eicher Motors, ...)
+    4. substring anywhere      (ndus -> IndusInd Bank, Indus Towers, ...)
+
+Tiers 0-3 come from prefix tries and tier 4 from a trigram index, and every
+posting list is kept in rank order, so a search stops as soon as it has
+enough results instead of scanning the universe.
+"""
+
+import csv
+import logging
+import os
+import re
+import threading
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+Instrument = namedtuple('Instrument', ['symbol', 'name', 'series'])
+
+DEFAULT_INSTRUMENTS_PATH = os.path.join(os.path.dirname(__file__), 'data', 'instruments.csv')
+NGRAM = 3
+
+_NON_WORD_RE = re.compile(r'[^a-z0-9&]+')
+
+
+def _words(text):
+    return _NON_WORD_RE.sub(' ', text.lower()).split()
+
+
+def _code(symbol):
+    """Lowercased exchange code of a symbol (TCS.NS -> tcs)"""
+    code = symbol.strip().lower()
+    return code[:-3] if code.endswith('.ns') else code
+
+
+def _ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class _TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = []
+
+
+class PrefixTrie:
+    """Maps every prefix of the inserted keys to the ids inserted under it"""
+
+    def __init__(self):
+        self.root = _TrieNode()
+
+    def insert(self, key, id_):
+        """Insert a key; ids must be inserted in non-decreasing order"""
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, _TrieNode())
+            if not node.ids or node.ids[-1] != id_:
+                node.ids.append(id_)
+
+    def lookup(self, prefix):
+        """Ids of all keys starting with prefix, in insertion order"""
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.ids
+
+
+class InstrumentIndex:
+    """Ranked symbol and company-name search over a list of instruments"""
+
+    def __init__(self, instruments):
+        unique = {instrument.symbol: instrument for instrument in instruments}
+        # Ids are assigned in tie-break order (short symbols first), so
+        # every posting list below is already sorted by rank within a tier
+        self.instruments = sorted(unique.values(), key=lambda instrument: (len(instrument.symbol), instrument.symbol))
+        self.by_symbol = {instrument.symbol: instrument for instrument in self.instruments}
+        self._codes = {}
+        self._names = []
+        self._words = []
+        self._symbol_trie = PrefixTrie()
+        self._name_trie = PrefixTrie()
+        self._word_trie = PrefixTrie()
+        grams = defaultdict(set)
+
+        for id_, instrument in enumerate(self.instruments):
+            code = _code(instrument.symbol)
+            words = _words(instrument.name)
+            name = ' '.join(words)
+            self._codes.setdefault(code, id_)
+            self._names.append(f"{code} {name}")
+            self._words.append(words)
+            self._symbol_trie.insert(code, id_)
+            self._name_trie.insert(name, id_)
+            for word in words:
+                self._word_trie.insert(word, id_)
+            for gram in _ngrams(self._names[-1]):
+                grams[gram].add(id_)
+
+        self._grams = {gram: frozenset(ids) for gram, ids in grams.items()}
+
+    def __len__(self):
+        return len(self.instruments)
+
+    def get(self, symbol):
+        """Return the Instrument for a symbol, or None"""
+        return self.by_symbol.get(symbol)
+
+    def search(self, query, limit=10):
+        """Return up to limit Instruments matching query, best match first"""
+        code = _code(query)
+        terms = _words(query)
+        if not code or not terms:
+            return []
+        text = ' '.join(terms)
+
+        ranked = []
+        seen = set()
+
+        def take(ids, accept=None):
+            for id_ in ids:
+                if len(ranked) >= limit:
+                    return True
+                if id_ not in seen and (accept is None or accept(id_)):
+                    seen.add(id_)
+                    ranked.append(id_)
+            return len(ranked) >= limit
+
+        def words_match(id_):
+            words = self._words[id_]
+            return all(any(word.startswith(term) for word in words) for term in terms[1:])
+
+        done = (
+            take([self._codes[code]] if code in self._codes else [])
+            or take(self._symbol_trie.lookup(code))
+            or take(self._name_trie.lookup(text))
+            or take(self._word_trie.lookup(terms[0]), words_match)
+        )
+        if not done and len(text) >= NGRAM:
+            postings = sorted((self._grams.get(gram, frozenset()) for gram in _ngrams(text)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            take(sorted(candidates), lambda id_: text in self._names[id_])
+
+        return [self.instruments[id_] for id_ in ranked]
+
+
+def load_instruments(path):
+    """Read instruments from an EQUITY_L.csv style file"""
+    instruments = []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            # NSE pads some header names with spaces
+            row = {key.strip().upper(): (value or '').strip() for key, value in row.items() if key}
+            symbol = row.get('SYMBOL')
+            if not symbol:
+                continue
+            if '.' not in symbol:
+                symbol = f"{symbol}.NS"
+            instruments.append(Instrument(symbol, row.get('NAME OF COMPANY') or row.get('NAME') or symbol,
+                                          row.get('SERIES', '')))
+    return instruments
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_instrument_index():
+    """Return the process-wide instrument index, loading it on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = getattr(settings, 'INSTRUMENTS_PATH', None) or DEFAULT_INSTRUMENTS_PATH
+                try:
+                    instruments = load_instruments(path)
+                except OSError as e:
+                    logger.error(f"Could not load instrument list from {path}: {e}")
+                    instruments = []
+                _index = InstrumentIndex(instruments)
+                logger.info(f"Loaded {len(_index)} instruments from {path}")
+    return _index
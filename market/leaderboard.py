@@ -0,0 +1,120 @@
+"""
+Materialized leaderboard maintained by the refresh_leaderboard command.
+
+Each cycle prices every held symbol with one batched lookup, then
+recomputes LeaderboardEntry rows only for portfolios that are dirty:
+
+- no entry yet
+- cash balance differs from the stored one
+- a transaction or holding change newer than the entry
+- a held symbol whose price moved since the previous cycle
+
+Ranks are then reassigned by net worth, writing only the rows whose rank
+changed. The leaderboard view reads pages of entries by rank.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+
+from .models import LeaderboardEntry, Portfolio, StockHolding, Transaction
+from .utils import get_current_stock_prices
+from .valuation import HoldingsMatrix, to_money
+
+logger = logging.getLogger(__name__)
+
+
+def dirty_portfolios(changed_symbols=()):
+    """Return ids of portfolios whose leaderboard entry is missing or stale"""
+    computed_at = OuterRef('user__leaderboard_entry__computed_at')
+    newer_trades = Transaction.objects.filter(portfolio=OuterRef('pk'), timestamp__gt=computed_at)
+    newer_holdings = StockHolding.objects.filter(portfolio=OuterRef('pk'), last_updated__gt=computed_at)
+    ticked = StockHolding.objects.filter(portfolio=OuterRef('pk'), stock_symbol__in=list(changed_symbols))
+
+    stale = (
+        Q(user__leaderboard_entry__isnull=True)
+        | ~Q(user__profile__balance=F('user__leaderboard_entry__cash_balance'))
+        | Exists(newer_trades)
+        | Exists(newer_holdings)
+    )
+    if changed_symbols:
+        stale |= Exists(ticked)
+    return list(Portfolio.objects.filter(stale).values_list('id', flat=True))
+
+
+def build_entries(portfolio_ids, prices, computed_at):
+    """Value the given portfolios at prices and return unsaved LeaderboardEntry objects"""
+    valuation = HoldingsMatrix.load(portfolio_ids).value(prices)
+    return [
+        LeaderboardEntry(
+            user_id=int(valuation.user_ids[i]),
+            username=valuation.usernames[i],
+            portfolio_value=to_money(valuation.portfolio_value[i]),
+            cash_balance=to_money(valuation.cash_balance[i]),
+            net_worth=to_money(valuation.net_worth[i]),
+            computed_at=computed_at,
+        )
+        for i in range(len(valuation))
+    ]
+
+
+def assign_ranks():
+    """Rank entries by net worth and save the ranks that changed; returns how many"""
+    changed = []
+    ordered = LeaderboardEntry.objects.order_by('-net_worth', 'user_id').values_list('id', 'rank')
+    for rank, (entry_id, old_rank) in enumerate(ordered.iterator(), start=1):
+        if rank != old_rank:
+            changed.append(LeaderboardEntry(id=entry_id, rank=rank))
+    LeaderboardEntry.objects.bulk_update(changed, ['rank'], batch_size=1000)
+    return len(changed)
+
+
+class LeaderboardRefresher:
+    """Incremental leaderboard refresh; remembers the prices used last cycle"""
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or getattr(settings, 'LEADERBOARD_BATCH_SIZE', 1000)
+        self.prices = {}
+
+    def refresh(self):
+        """Run one cycle and return the number of entries recomputed"""
+        # Taken before reading anything, so trades made during the cycle are
+        # newer than computed_at and get picked up by the next one
+        computed_at = timezone.now()
+
+        symbols = list(StockHolding.objects.values_list('stock_symbol', flat=True).distinct())
+        prices = get_current_stock_prices(symbols) if symbols else {}
+        changed_symbols = [symbol for symbol in symbols if self.prices.get(symbol) != prices.get(symbol)]
+        self.prices = prices
+
+        portfolio_ids = dirty_portfolios(changed_symbols)
+        for start in range(0, len(portfolio_ids), self.batch_size):
+            entries = build_entries(portfolio_ids[start:start + self.batch_size], prices, computed_at)
+            LeaderboardEntry.objects.bulk_create(
+                entries,
+                update_conflicts=True,
+                unique_fields=['user'],
+                update_fields=['username', 'portfolio_value', 'cash_balance', 'net_worth', 'computed_at'],
+            )
+
+        removed, _ = LeaderboardEntry.objects.filter(user__portfolio__isnull=True).delete()
+        if portfolio_ids or removed:
+            assign_ranks()
+        return len(portfolio_ids)
+
+
+def run_leaderboard(interval, once=False):
+    """Refresh the leaderboard every interval seconds"""
+    refresher = LeaderboardRefresher()
+    while True:
+        started = time.monotonic()
+        updated = refresher.refresh()
+        elapsed = time.monotonic() - started
+        logger.info(f"Recomputed {updated} leaderboard entries in {elapsed:.2f}s")
+
+        if once:
+            return updated
+        time.sleep(max(0, interval - elapsed))
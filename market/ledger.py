@@ -0,0 +1,235 @@
+"""
+Event-sourced view of portfolios.
+
+Transactions are the source of truth: replaying a portfolio's transactions
+in timestamp order from the owner's starting balance derives its holdings (with
+average cost), cash and realized P&L. StockHolding rows and
+UserProfile.balance are caches of that state that can be audited against,
+or rebuilt from, the replay.
+
+Every LEDGER_CHECKPOINT_INTERVAL transactions the replay state is saved as
+a LedgerCheckpoint, so a later rebuild resumes from the newest checkpoint
+and only streams the transactions after it. rebuild_all fans portfolios
+out over worker processes.
+"""
+
+import logging
+import multiprocessing
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+
+from .models import LedgerCheckpoint, Portfolio, StockHolding, Transaction
+from .trading import average_price
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+
+
+@dataclass
+class Position:
+    quantity: int
+    average_cost: Decimal
+    name: str
+
+
+@dataclass
+class LedgerState:
+    """Holdings, cash and realized P&L after replaying some transactions"""
+    cash: Decimal
+    positions: dict = field(default_factory=dict)
+    realized_pnl: Decimal = Decimal('0.00')
+    transaction_count: int = 0
+    last_transaction_id: int = 0
+    last_timestamp: object = None
+
+    def apply(self, txn):
+        """Apply one Transaction, mirroring how market.trading.execute_order updates holdings"""
+        amount = txn.quantity * txn.price
+        position = self.positions.get(txn.stock_symbol)
+        if txn.transaction_type == Transaction.BUY:
+            self.cash -= amount
+            if position is None:
+                position = self.positions[txn.stock_symbol] = Position(0, Decimal('0.00'), txn.stock_name)
+            total = position.quantity * position.average_cost + amount
+            position.quantity += txn.quantity
+            position.average_cost = average_price(total, position.quantity)
+        else:
+            self.cash += amount
+            if position is not None:
+                self.realized_pnl += txn.quantity * (txn.price - position.average_cost)
+                position.quantity -= txn.quantity
+                if position.quantity <= 0:
+                    del self.positions[txn.stock_symbol]
+        self.transaction_count += 1
+        self.last_transaction_id = txn.id
+        self.last_timestamp = txn.timestamp
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint):
+        return cls(
+            cash=checkpoint.cash,
+            positions={
+                symbol: Position(quantity, Decimal(average_cost), name)
+                for symbol, (quantity, average_cost, name) in checkpoint.positions.items()
+            },
+            realized_pnl=checkpoint.realized_pnl,
+            transaction_count=checkpoint.transaction_count,
+            last_transaction_id=checkpoint.last_transaction_id,
+            last_timestamp=checkpoint.last_timestamp,
+        )
+
+    def to_checkpoint(self, portfolio_id):
+        return LedgerCheckpoint(
+            portfolio_id=portfolio_id,
+            transaction_count=self.transaction_count,
+            last_transaction_id=self.last_transaction_id,
+            last_timestamp=self.last_timestamp,
+            cash=self.cash,
+            realized_pnl=self.realized_pnl,
+            positions={
+                symbol: [position.quantity, str(position.average_cost), position.name]
+                for symbol, position in self.positions.items()
+            },
+        )
+
+
+def stream_transactions(portfolio_id, after=None):
+    """Yield a portfolio's transactions in (timestamp, id) order, after a checkpoint if given"""
+    transactions = Transaction.objects.filter(portfolio_id=portfolio_id)
+    if after is not None:
+        transactions = transactions.filter(
+            Q(timestamp__gt=after.last_timestamp)
+            | Q(timestamp=after.last_timestamp, id__gt=after.last_transaction_id)
+        )
+    yield from transactions.order_by('timestamp', 'id').iterator(chunk_size=2000)
+
+
+def replay(state, transactions):
+    """Apply transactions to state one at a time, yielding the state after each"""
+    for txn in transactions:
+        state.apply(txn)
+        yield state
+
+
+def rebuild_portfolio(portfolio_id, checkpoint_interval=None, starting_balance=None):
+    """
+    Replay a portfolio's ledger from its newest checkpoint, saving new
+    checkpoints along the way, and return the final LedgerState. Without a
+    checkpoint the replay starts from starting_balance, looked up from the
+    owner's profile when not given.
+    """
+    checkpoint_interval = checkpoint_interval or getattr(settings, 'LEDGER_CHECKPOINT_INTERVAL', 500)
+    checkpoint = LedgerCheckpoint.objects.filter(portfolio_id=portfolio_id).order_by('-transaction_count').first()
+    if checkpoint:
+        state = LedgerState.from_checkpoint(checkpoint)
+    else:
+        if starting_balance is None:
+            starting_balance = Portfolio.objects.filter(id=portfolio_id).values_list(
+                'user__profile__starting_balance', flat=True
+            ).first()
+        if starting_balance is None:
+            starting_balance = Decimal(str(settings.INITIAL_BALANCE))
+        state = LedgerState(cash=starting_balance)
+
+    checkpoints = []
+    for state in replay(state, stream_transactions(portfolio_id, after=checkpoint)):
+        if state.transaction_count % checkpoint_interval == 0:
+            checkpoints.append(state.to_checkpoint(portfolio_id))
+    LedgerCheckpoint.objects.bulk_create(checkpoints, ignore_conflicts=True)
+    return state
+
+
+def audit_portfolio(portfolio, state):
+    """Return human-readable differences between stored holdings/balance and the replayed state"""
+    problems = []
+    balance = portfolio.user.profile.balance
+    if balance != state.cash.quantize(CENT):
+        problems.append(f"balance is {balance}, ledger says {state.cash.quantize(CENT)}")
+
+    holdings = {holding.stock_symbol: holding for holding in portfolio.holdings.all()}
+    for symbol in sorted(set(holdings) | set(state.positions)):
+        holding, position = holdings.get(symbol), state.positions.get(symbol)
+        stored = (holding.quantity, holding.average_buy_price) if holding else (0, None)
+        derived = (position.quantity, position.average_cost) if position else (0, None)
+        if stored != derived:
+            problems.append(f"{symbol} is {stored[0]} @ {stored[1]}, ledger says {derived[0]} @ {derived[1]}")
+    return problems
+
+
+def apply_state(portfolio, state):
+    """Overwrite a portfolio's holdings and the owner's balance with the replayed state"""
+    with transaction.atomic():
+        profile = portfolio.user.profile
+        profile.balance = state.cash
+        profile.save(update_fields=['balance'])
+        portfolio.holdings.exclude(stock_symbol__in=list(state.positions)).delete()
+        StockHolding.objects.bulk_create(
+            [
+                StockHolding(portfolio=portfolio, stock_symbol=symbol, stock_name=position.name,
+                             quantity=position.quantity, average_buy_price=position.average_cost)
+                for symbol, position in state.positions.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['portfolio', 'stock_symbol'],
+            update_fields=['quantity', 'average_buy_price'],
+        )
+
+
+def rebuild_and_audit(portfolio_ids, fix=False):
+    """Rebuild each portfolio's ledger; returns {portfolio_id: [problems]} for mismatches"""
+    results = {}
+    portfolios = Portfolio.objects.select_related('user__profile').in_bulk(portfolio_ids)
+    for portfolio_id in portfolio_ids:
+        portfolio = portfolios.get(portfolio_id)
+        if portfolio is None:
+            continue
+        state = rebuild_portfolio(portfolio_id, starting_balance=portfolio.user.profile.starting_balance)
+        problems = audit_portfolio(portfolio, state)
+        if problems:
+            results[portfolio_id] = problems
+            if fix:
+                apply_state(portfolio, state)
+    return results
+
+
+def _init_worker():
+    # Each worker process opens its own database connections
+    import django
+    django.setup()
+    connections.close_all()
+
+
+def _rebuild_chunk(args):
+    portfolio_ids, fix = args
+    try:
+        return rebuild_and_audit(portfolio_ids, fix)
+    finally:
+        connections.close_all()
+
+
+def rebuild_all(workers=None, fix=False, chunk_size=200):
+    """
+    Rebuild every portfolio's ledger, spreading chunks of portfolios across
+    worker processes. Returns {portfolio_id: [problems]} for mismatches.
+    """
+    workers = workers or multiprocessing.cpu_count()
+    portfolio_ids = list(Portfolio.objects.order_by('id').values_list('id', flat=True))
+    chunks = [(portfolio_ids[i:i + chunk_size], fix) for i in range(0, len(portfolio_ids), chunk_size)]
+    if workers <= 1 or len(chunks) <= 1:
+        results = {}
+        for chunk in chunks:
+            results.update(rebuild_and_audit(*chunk))
+        return results
+
+    # Connections must not be shared with forked children
+    connections.close_all()
+    results = {}
+    with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+        for chunk_results in pool.imap_unordered(_rebuild_chunk, chunks):
+            results.update(chunk_results)
+    return results
@@ -0,0 +1,62 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from market.fake_yahoo import FakeYahooServer
+from market.upstream import get_upstream_client, reset_upstream_client
+from market.utils import NIFTY50_STOCKS, fetch_stock_infos
+
+
+class Command(BaseCommand):
+    help = "Measure throughput and tail latency of upstream quote fetches (fetch_stock_infos, bypassing the quote cache)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--symbols-per-request', type=int, default=1)
+        parser.add_argument(
+            '--fake', action='store_true',
+            help="Start an in-process fake Yahoo server instead of using YAHOO_FINANCE_BASE_URL"
+        )
+        parser.add_argument('--latency-ms', type=float, default=20, help="Fake server latency (with --fake)")
+        parser.add_argument('--error-rate', type=float, default=0, help="Fake server 500 rate (with --fake)")
+
+    def handle(self, *args, **options):
+        server = None
+        if options['fake']:
+            server = FakeYahooServer(latency=options['latency_ms'] / 1000, error_rate=options['error_rate'])
+            settings.YAHOO_FINANCE_BASE_URL = server.start()
+        reset_upstream_client()
+
+        symbols = [stock['symbol'] for stock in NIFTY50_STOCKS]
+        per_request = options['symbols_per_request']
+        batches = [
+            [symbols[(i * per_request + j) % len(symbols)] for j in range(per_request)]
+            for i in range(options['requests'])
+        ]
+
+        def timed_fetch(batch):
+            # fetch_stock_infos skips the quote cache, so every request reaches the upstream
+            start = time.perf_counter()
+            fetched = fetch_stock_infos(batch)
+            return time.perf_counter() - start, len(fetched)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            results = list(executor.map(timed_fetch, batches))
+        elapsed = time.perf_counter() - started
+
+        latencies = np.array([latency for latency, _ in results]) * 1000
+        quotes = sum(count for _, count in results)
+        self.stdout.write(f"{len(batches)} requests, {quotes} quotes in {elapsed:.2f}s")
+        self.stdout.write(f"Throughput: {len(batches) / elapsed:.1f} req/s, {quotes / elapsed:.1f} quotes/s")
+        self.stdout.write("Latency ms: p50 {:.1f}  p95 {:.1f}  p99 {:.1f}  max {:.1f}".format(
+            *np.percentile(latencies, [50, 95, 99]), latencies.max()
+        ))
+        self.stdout.write(f"Upstream: {get_upstream_client().stats.snapshot()}")
+
+        if server:
+            server.stop()
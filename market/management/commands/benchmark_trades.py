@@ -0,0 +1,134 @@
+import random
+import threading
+import time
+from collections import Counter
+from decimal import Decimal
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from accounts.models import UserProfile
+from market.models import StockHolding, Transaction
+from market.trading import TradeError, execute_order
+
+SYMBOL = 'BENCH.NS'
+
+
+class Command(BaseCommand):
+    help = "Place concurrent orders against a few accounts and check balances and holdings stay consistent"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=4, help="Accounts to trade on (fewer means more contention)")
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--orders', type=int, default=2000)
+        parser.add_argument('--price', type=Decimal, default=Decimal('100.00'))
+        parser.add_argument('--balance', type=Decimal, default=Decimal('50000.00'))
+        parser.add_argument('--sell-ratio', type=float, default=0.3, help="Fraction of orders that are sells")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite' and connection.settings_dict['NAME'] == ':memory:':
+            raise CommandError("In-memory SQLite cannot be shared between threads; use a file or Postgres")
+
+        price, balance = options['price'], options['balance']
+        users = self._create_users(options['users'], balance)
+        rng = random.Random(options['seed'])
+        orders = [
+            (
+                rng.choice(users),
+                Transaction.SELL if rng.random() < options['sell_ratio'] else Transaction.BUY,
+                rng.randint(1, 10),
+            )
+            for _ in range(options['orders'])
+        ]
+
+        lock = threading.Lock()
+        filled = Counter()
+        outcomes = Counter()
+
+        def place(order):
+            user, transaction_type, quantity = order
+            start = time.perf_counter()
+            try:
+                execute_order(user, SYMBOL, 'Benchmark Ltd', transaction_type, quantity, price)
+                outcome = 'filled'
+            except TradeError:
+                outcome = 'rejected'
+            except OperationalError:
+                outcome = 'db_error'
+            latency = time.perf_counter() - start
+            with lock:
+                outcomes[outcome] += 1
+                latencies.append(latency)
+                if outcome == 'filled':
+                    filled[user.id] += quantity if transaction_type == Transaction.BUY else -quantity
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        order = next(pending, None)
+                    if order is None:
+                        return
+                    place(order)
+            finally:
+                # Each worker thread opens its own connection, close it once when done
+                connections.close_all()
+
+        pending = iter(orders)
+        latencies = []
+        try:
+            started = time.perf_counter()
+            workers = [threading.Thread(target=worker) for _ in range(options['threads'])]
+            for thread in workers:
+                thread.start()
+            for thread in workers:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            latencies = np.array(latencies) * 1000
+
+            self.stdout.write(
+                f"{len(orders)} orders on {len(users)} accounts with {options['threads']} threads "
+                f"({connection.vendor}) in {elapsed:.2f}s"
+            )
+            self.stdout.write(f"Throughput: {len(orders) / elapsed:.1f} orders/s  {dict(outcomes)}")
+            self.stdout.write("Latency ms: p50 {:.1f}  p95 {:.1f}  p99 {:.1f}  max {:.1f}".format(
+                *np.percentile(latencies, [50, 95, 99]), latencies.max()
+            ))
+
+            problems = self._check(users, balance, price, filled, outcomes['filled'])
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(problem))
+            if not problems:
+                self.stdout.write(self.style.SUCCESS("Balances and holdings match the filled orders"))
+        finally:
+            User.objects.filter(id__in=[user.id for user in users]).delete()
+
+    def _create_users(self, count, balance):
+        User.objects.filter(username__startswith='bench_trader_').delete()
+        users = [User.objects.create(username=f'bench_trader_{i}') for i in range(count)]
+        UserProfile.objects.filter(user__in=users).update(balance=balance)
+        return users
+
+    def _check(self, users, balance, price, filled, filled_count):
+        problems = []
+        balances = dict(UserProfile.objects.filter(user__in=users).values_list('user_id', 'balance'))
+        quantities = dict(
+            StockHolding.objects.filter(portfolio__user__in=users, stock_symbol=SYMBOL)
+            .values_list('portfolio__user_id', 'quantity')
+        )
+        for user in users:
+            held = filled[user.id]
+            expected_balance = balance - held * price
+            if balances[user.id] != expected_balance:
+                problems.append(f"{user.username}: balance {balances[user.id]}, expected {expected_balance}")
+            if balances[user.id] < 0:
+                problems.append(f"{user.username}: negative balance {balances[user.id]}")
+            if quantities.get(user.id, 0) != held:
+                problems.append(f"{user.username}: holds {quantities.get(user.id, 0)}, expected {held}")
+        recorded = Transaction.objects.filter(portfolio__user__in=users).count()
+        if recorded != filled_count:
+            problems.append(f"{recorded} transactions recorded for {filled_count} filled orders")
+        return problems
@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from market.history import INTERVALS, get_bar_store
+from market.models import StockHolding
+from market.simulation import SECONDS_PER_DAY, get_market_simulator
+from market.utils import NIFTY50_STOCKS, fetch_price_history, normalize_symbol
+
+
+class Command(BaseCommand):
+    help = "Append historical OHLCV bars to the on-disk history store"
+
+    def add_arguments(self, parser):
+        parser.add_argument('symbols', nargs='*', help="Symbols to load (default: Nifty 50 and held symbols)")
+        parser.add_argument('--interval', default='1d', choices=INTERVALS)
+        parser.add_argument('--range', dest='period', default='1y', help="Yahoo Finance range, e.g. 5d, 1y, 5y")
+        parser.add_argument(
+            '--simulated', type=int, metavar='DAYS',
+            help="Generate DAYS of daily bars from the simulated market instead of calling Yahoo"
+        )
+
+    def handle(self, *args, **options):
+        symbols = options['symbols'] or (
+            [stock['symbol'] for stock in NIFTY50_STOCKS]
+            + list(StockHolding.objects.values_list('stock_symbol', flat=True).distinct())
+        )
+        symbols = list(dict.fromkeys(normalize_symbol(symbol) for symbol in symbols))
+        store = get_bar_store()
+
+        if options['simulated']:
+            if options['interval'] != '1d':
+                raise CommandError("--simulated only generates daily bars")
+            today = int(time.time() // SECONDS_PER_DAY)
+            history = get_market_simulator().daily_bars(symbols, today - options['simulated'], today - 1)
+        else:
+            history = {symbol: fetch_price_history(symbol, options['interval'], options['period']) for symbol in symbols}
+
+        for symbol, bars in history.items():
+            if bars is None:
+                self.stderr.write(self.style.WARNING(f"Could not fetch history for {symbol}"))
+                continue
+            written = store.append(symbol, options['interval'], bars)
+            self.stdout.write(f"{symbol}: {written} new bars")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from market.ledger import rebuild_all, rebuild_and_audit
+
+
+class Command(BaseCommand):
+    help = "Replay transaction ledgers and audit (or fix) stored holdings and balances"
+
+    def add_arguments(self, parser):
+        parser.add_argument('portfolio_ids', nargs='*', type=int, help="Portfolios to rebuild (default: all)")
+        parser.add_argument('--workers', type=int, help="Worker processes for a full rebuild (default: CPU count)")
+        parser.add_argument('--fix', action='store_true', help="Overwrite holdings and balances that disagree")
+
+    def handle(self, *args, **options):
+        if options['portfolio_ids']:
+            mismatches = rebuild_and_audit(options['portfolio_ids'], fix=options['fix'])
+        else:
+            mismatches = rebuild_all(workers=options['workers'], fix=options['fix'])
+
+        for portfolio_id, problems in sorted(mismatches.items()):
+            for problem in problems:
+                self.stdout.write(f"Portfolio {portfolio_id}: {problem}")
+        verb = "Fixed" if options['fix'] else "Found"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {len(mismatches)} portfolios out of line with their ledger"))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from market.leaderboard import run_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Keep the materialized leaderboard up to date, recomputing only changed portfolios"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=getattr(settings, 'LEADERBOARD_REFRESH_INTERVAL', 60),
+            help="Seconds between refresh cycles"
+        )
+        parser.add_argument('--once', action='store_true', help="Run a single refresh cycle and exit")
+
+    def handle(self, *args, **options):
+        try:
+            updated = run_leaderboard(options['interval'], once=options['once'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f"Recomputed {updated} leaderboard entries"))
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from market.challenge_scheduler import run_scheduler
+
+
+class Command(BaseCommand):
+    help = "Start and close challenges on schedule, freezing final portfolio values at close"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=getattr(settings, 'CHALLENGE_SCHEDULER_INTERVAL', 60),
+            help="Seconds between scheduler passes"
+        )
+        parser.add_argument('--once', action='store_true', help="Run a single pass and exit")
+
+    def handle(self, *args, **options):
+        try:
+            started, closed = run_scheduler(options['interval'], once=options['once'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f"Started {started} and closed {closed} challenges"))
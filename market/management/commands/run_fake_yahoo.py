@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from market.fake_yahoo import FakeYahooServer
+
+
+class Command(BaseCommand):
+    help = "Run a local fake of the Yahoo Finance quote, chart and search endpoints"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency-ms', type=float, default=0, help="Delay added to every response")
+        parser.add_argument('--jitter-ms', type=float, default=0, help="Extra random delay up to this many ms")
+        parser.add_argument('--error-rate', type=float, default=0, help="Fraction of requests answered with 500")
+        parser.add_argument('--rate-limit-rate', type=float, default=0, help="Fraction of requests answered with 429")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        server = FakeYahooServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency_ms'] / 1000,
+            jitter=options['jitter_ms'] / 1000,
+            error_rate=options['error_rate'],
+            rate_limit_rate=options['rate_limit_rate'],
+            seed=options['seed'],
+        )
+        self.stdout.write(f"Fake Yahoo Finance listening on {server.base_url}")
+        self.stdout.write(f"Use YAHOO_FINANCE_BASE_URL={server.base_url}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served {server.requests} requests")
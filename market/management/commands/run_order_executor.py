@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from market.order_queue import run_executor, run_executors
+
+
+class Command(BaseCommand):
+    help = "Execute queued market orders in batches (used with ORDER_INTAKE_ASYNC)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=getattr(settings, 'ORDER_EXECUTOR_INTERVAL', 0.5),
+            help="Seconds to wait after the queue runs empty"
+        )
+        parser.add_argument('--batch-size', type=int, help="Orders claimed per batch")
+        parser.add_argument('--workers', type=int, default=1, help="Executor processes to run")
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit")
+
+    def handle(self, *args, **options):
+        if options['workers'] > 1 and not options['once']:
+            run_executors(options['workers'], options['interval'], options['batch_size'])
+            return
+
+        try:
+            processed = run_executor(options['interval'], once=options['once'], batch_size=options['batch_size'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(processed)} queued orders"))
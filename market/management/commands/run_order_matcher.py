@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from market.orderbook import run_matcher
+
+
+class Command(BaseCommand):
+    help = "Fill resting limit and stop orders when quotes cross their trigger prices"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=getattr(settings, 'ORDER_MATCHER_INTERVAL', 5),
+            help="Seconds between matching passes"
+        )
+        parser.add_argument('--once', action='store_true', help="Run a single pass and exit")
+
+    def handle(self, *args, **options):
+        try:
+            processed = run_matcher(options['interval'], once=options['once'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f"Processed {len(processed)} triggered orders"))
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from market.quote_feed import run_feed
+
+
+class Command(BaseCommand):
+    help = "Keep the shared quote cache fresh for held, searched and Nifty 50 symbols"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=getattr(settings, 'QUOTE_FEED_INTERVAL', 15),
+            help="Seconds between refresh cycles"
+        )
+        parser.add_argument('--once', action='store_true', help="Run a single refresh cycle and exit")
+
+    def handle(self, *args, **options):
+        if getattr(settings, 'QUOTE_CACHE_BACKEND', 'memory') == 'memory':
+            self.stderr.write(self.style.WARNING(
+                "QUOTE_CACHE_BACKEND is 'memory', so web workers will not see these quotes. "
+                "Use the 'sqlite' or 'django' backend with a shared cache."
+            ))
+
+        try:
+            refreshed = run_feed(options['interval'], once=options['once'])
+        except KeyboardInterrupt:
+            return
+        self.stdout.write(self.style.SUCCESS(f"Refreshed {refreshed} quotes"))
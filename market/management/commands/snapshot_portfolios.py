@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from market.snapshots import snapshot_portfolios
+
+
+class Command(BaseCommand):
+    help = "Bring daily portfolio snapshots up to date by replaying new transactions against historical closes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('portfolio_ids', nargs='*', type=int, help="Portfolios to snapshot (default: all)")
+
+    def handle(self, *args, **options):
+        written = snapshot_portfolios(options['portfolio_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} snapshots"))
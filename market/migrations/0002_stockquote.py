@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockQuote',
+            fields=[
+                ('symbol', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('current_price', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('change', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('change_percent', models.FloatField(default=0)),
+                ('previous_close', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('open', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('day_high', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('day_low', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('volume', models.BigIntegerField(default=0)),
+                ('market_cap', models.BigIntegerField(default=0)),
+                ('pe_ratio', models.FloatField(default=0)),
+                ('dividend_yield', models.FloatField(default=0)),
+                ('fifty_two_week_high', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('fifty_two_week_low', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['change_percent'], name='market_stoc_change__0d84f7_idx'), models.Index(fields=['volume'], name='market_stoc_volume_c4a7dd_idx')],
+            },
+        ),
+    ]
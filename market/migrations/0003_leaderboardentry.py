@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0002_stockquote'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(max_length=150)),
+                ('portfolio_value', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('cash_balance', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('net_worth', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('rank', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField()),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='leaderboard_entry', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['rank'],
+                'indexes': [models.Index(fields=['rank'], name='market_lead_rank_1b65dc_idx'), models.Index(fields=['-net_worth', 'user'], name='market_lead_net_wor_715eca_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0003_leaderboardentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PortfolioSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('cash_balance', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('holdings_value', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('net_worth', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('positions', models.JSONField(default=dict)),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='market.portfolio')),
+            ],
+            options={
+                'ordering': ['date'],
+                'unique_together': {('portfolio', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0004_portfoliosnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_count', models.PositiveIntegerField()),
+                ('last_transaction_id', models.BigIntegerField()),
+                ('last_timestamp', models.DateTimeField()),
+                ('cash', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('realized_pnl', models.DecimalField(decimal_places=2, max_digits=20)),
+                ('positions', models.JSONField(default=dict)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('portfolio', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_checkpoints', to='market.portfolio')),
+            ],
+            options={
+                'unique_together': {('portfolio', 'transaction_count')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0006_order'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='order_type',
+            field=models.CharField(choices=[('market', 'Market'), ('limit', 'Limit'), ('stop', 'Stop')], max_length=6),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('open', 'Open'), ('executing', 'Executing'), ('filled', 'Filled'), ('cancelled', 'Cancelled'), ('rejected', 'Rejected')], default='open', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='trigger_price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=15, null=True),
+        ),
+    ]
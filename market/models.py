@@ -1,7 +1,11 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 from .utils import get_current_stock_price
+from .valuation import value_portfolio
 
 class Portfolio(models.Model):
     """Model representing a user's portfolio"""
@@ -12,24 +16,24 @@ class Portfolio(models.Model):
     def __str__(self):
         return f"{self.user.username}'s Portfolio"
     
+    def valuation(self, cash_balance=None):
+        """Price all holdings in one pass; see market.valuation"""
+        return value_portfolio(self, cash_balance)
+    
     @property
     def total_value(self):
         """Calculate the total value of all stock holdings"""
-        holdings = self.holdings.all()
-        total = sum(holding.current_value for holding in holdings)
-        return total
+        return self.valuation().total_value
     
     @property
     def total_profit(self):
         """Calculate the total profit/loss from all holdings"""
-        holdings = self.holdings.all()
-        total = sum(holding.profit_loss for holding in holdings)
-        return total
+        return self.valuation().total_profit
     
     @property
     def net_worth(self):
         """Calculate user's net worth (portfolio value + cash balance)"""
-        return self.total_value + self.user.profile.balance
+        return self.valuation().net_worth
 
 class StockHolding(models.Model):
     """Model representing stocks held in a portfolio"""
@@ -156,11 +160,205 @@ class ChallengeParticipant(models.Model):
     
     @property
     def current_rank(self):
-        """Calculate current rank in the challenge"""
-        if self.challenge.status == Challenge.COMPLETED and self.final_portfolio_value is not None:
-            better_performers = ChallengeParticipant.objects.filter(
-                challenge=self.challenge,
-                final_portfolio_value__gt=self.final_portfolio_value
-            ).count()
-            return better_performers + 1
-        return None
+        """Current rank in the challenge, from the shared challenge standings"""
+        from .rankings import challenge_standings
+        standing = challenge_standings(self.challenge).get(self.user_id)
+        return standing.rank if standing else None
+
+class StockQuoteQuerySet(models.QuerySet):
+    """Queries over the persisted quote snapshots"""
+    
+    def fresh(self, max_age):
+        """Snapshots fetched within the last max_age seconds"""
+        return self.filter(fetched_at__gte=timezone.now() - timedelta(seconds=max_age))
+    
+    def gainers(self):
+        return self.order_by('-change_percent')
+    
+    def losers(self):
+        return self.order_by('change_percent')
+    
+    def most_active(self):
+        return self.order_by('-volume')
+    
+    def bulk_upsert(self, stock_infos):
+        """Insert or update snapshots for a batch of stock info dicts in a single query"""
+        quotes = [StockQuote.from_stock_info(stock_info) for stock_info in stock_infos]
+        if not quotes:
+            return []
+        return self.bulk_create(
+            quotes,
+            update_conflicts=True,
+            unique_fields=['symbol'],
+            update_fields=[field for field in StockQuote.QUOTE_FIELDS if field != 'symbol'] + ['fetched_at'],
+        )
+
+class StockQuote(models.Model):
+    """Model holding the latest quote snapshot for a stock"""
+    QUOTE_FIELDS = [
+        'symbol', 'name', 'current_price', 'change', 'change_percent', 'previous_close',
+        'open', 'day_high', 'day_low', 'volume', 'market_cap', 'pe_ratio', 'dividend_yield',
+        'fifty_two_week_high', 'fifty_two_week_low',
+    ]
+    
+    symbol = models.CharField(max_length=20, primary_key=True)
+    name = models.CharField(max_length=255)
+    current_price = models.DecimalField(max_digits=15, decimal_places=2)
+    change = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    change_percent = models.FloatField(default=0)
+    previous_close = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    open = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    day_high = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    day_low = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    volume = models.BigIntegerField(default=0)
+    market_cap = models.BigIntegerField(default=0)
+    pe_ratio = models.FloatField(default=0)
+    dividend_yield = models.FloatField(default=0)
+    fifty_two_week_high = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    fifty_two_week_low = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    fetched_at = models.DateTimeField()
+    
+    objects = StockQuoteQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['change_percent']),
+            models.Index(fields=['volume']),
+        ]
+    
+    def __str__(self):
+        return f"{self.symbol} at ₹{self.current_price}"
+    
+    @classmethod
+    def from_stock_info(cls, stock_info):
+        """Build an unsaved snapshot from a stock info dict"""
+        fetched_at = stock_info.get('fetched_at')
+        quote = cls(
+            fetched_at=datetime.fromtimestamp(fetched_at, tz=dt_timezone.utc) if fetched_at else timezone.now()
+        )
+        for field in cls.QUOTE_FIELDS:
+            value = stock_info.get(field)
+            model_field = cls._meta.get_field(field)
+            if value is None:
+                value = model_field.get_default()
+            elif isinstance(model_field, models.DecimalField):
+                value = Decimal(str(value)).quantize(Decimal('0.01'))
+            elif isinstance(model_field, models.BigIntegerField):
+                value = int(value)
+            setattr(quote, field, value)
+        return quote
+    
+    def to_stock_info(self):
+        """Return the snapshot in the same dict format as get_stock_info"""
+        stock_info = {}
+        for field in self.QUOTE_FIELDS:
+            value = getattr(self, field)
+            stock_info[field] = float(value) if isinstance(value, Decimal) else value
+        stock_info['fetched_at'] = self.fetched_at.timestamp()
+        return stock_info
+
+class LeaderboardEntry(models.Model):
+    """Materialized leaderboard row, kept up to date by the refresh_leaderboard command"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='leaderboard_entry')
+    username = models.CharField(max_length=150)
+    portfolio_value = models.DecimalField(max_digits=20, decimal_places=2)
+    cash_balance = models.DecimalField(max_digits=20, decimal_places=2)
+    net_worth = models.DecimalField(max_digits=20, decimal_places=2)
+    rank = models.PositiveIntegerField(default=0)
+    computed_at = models.DateTimeField()
+    
+    class Meta:
+        ordering = ['rank']
+        indexes = [
+            models.Index(fields=['rank']),
+            models.Index(fields=['-net_worth', 'user']),
+        ]
+    
+    def __str__(self):
+        return f"#{self.rank} {self.username}"
+
+class PortfolioSnapshot(models.Model):
+    """End-of-day state of a portfolio, filled in by the snapshot_portfolios command"""
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='snapshots')
+    date = models.DateField()
+    cash_balance = models.DecimalField(max_digits=20, decimal_places=2)
+    holdings_value = models.DecimalField(max_digits=20, decimal_places=2)
+    net_worth = models.DecimalField(max_digits=20, decimal_places=2)
+    positions = models.JSONField(default=dict)  # symbol -> quantity at the end of the day
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['date']
+        unique_together = ('portfolio', 'date')
+    
+    def __str__(self):
+        return f"{self.portfolio} on {self.date}"
+
+class LedgerCheckpoint(models.Model):
+    """Ledger replay state of a portfolio after a given number of transactions"""
+    portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name='ledger_checkpoints')
+    transaction_count = models.PositiveIntegerField()
+    last_transaction_id = models.BigIntegerField()
+    last_timestamp = models.DateTimeField()
+    cash = models.DecimalField(max_digits=20, decimal_places=2)
+    realized_pnl = models.DecimalField(max_digits=20, decimal_places=2)
+    positions = models.JSONField(default=dict)  # symbol -> [quantity, average cost, name]
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        unique_together = ('portfolio', 'transaction_count')
+    
+    def __str__(self):
+        return f"{self.portfolio} after {self.transaction_count} transactions"
+
+class Order(models.Model):
+    """
+    Order waiting to be filled: a resting limit or stop order, filled by the
+    order matcher when its trigger price is crossed, or a queued market order
+    filled by the order executor
+    """
+    MARKET = 'market'
+    LIMIT = 'limit'
+    STOP = 'stop'
+    ORDER_TYPES = [
+        (MARKET, 'Market'),
+        (LIMIT, 'Limit'),
+        (STOP, 'Stop'),
+    ]
+    OPEN = 'open'
+    EXECUTING = 'executing'
+    FILLED = 'filled'
+    CANCELLED = 'cancelled'
+    REJECTED = 'rejected'
+    STATUS_CHOICES = [
+        (OPEN, 'Open'),
+        (EXECUTING, 'Executing'),
+        (FILLED, 'Filled'),
+        (CANCELLED, 'Cancelled'),
+        (REJECTED, 'Rejected'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
+    stock_symbol = models.CharField(max_length=20)
+    stock_name = models.CharField(max_length=255)
+    transaction_type = models.CharField(max_length=4, choices=Transaction.TRANSACTION_TYPES)
+    order_type = models.CharField(max_length=6, choices=ORDER_TYPES)
+    quantity = models.PositiveIntegerField()
+    trigger_price = models.DecimalField(max_digits=15, decimal_places=2, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=OPEN)
+    transaction = models.OneToOneField(Transaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='order')
+    reason = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'id']),
+            models.Index(fields=['status', 'updated_at']),
+        ]
+    
+    def __str__(self):
+        if self.order_type == self.MARKET:
+            return f"{self.order_type} {self.transaction_type} {self.quantity} {self.stock_symbol}"
+        return f"{self.order_type} {self.transaction_type} {self.quantity} {self.stock_symbol} at ₹{self.trigger_price}"
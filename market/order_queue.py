@@ -0,0 +1,173 @@
+"""
+Queued market order execution used by the run_order_executor command.
+
+With ORDER_INTAKE_ASYNC the trade view checks funds or shares against the
+current quote, records a market Order and returns. Executor processes drain
+the queue in batches:
+
+1. claim a batch of open market orders with SELECT ... FOR UPDATE SKIP
+   LOCKED and mark them executing, so concurrent executors never take the
+   same orders (SQLite serializes the claim through its write lock instead)
+2. price every symbol in the batch with one lookup, outside any transaction
+3. fill each order through execute_order in its own transaction, together
+   with its status update, so one failing order (a deadlock, a lock
+   timeout) is rejected on its own instead of rolling back the batch
+
+Orders left executing by an executor that died are put back on the queue
+after ORDER_EXECUTOR_STALE_AFTER seconds. Each fill and its status update
+commit together, so a requeued order has not been filled.
+"""
+
+import logging
+import multiprocessing
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+
+from .models import Order
+from .trading import TradeError, execute_order
+from .utils import get_current_stock_prices
+
+logger = logging.getLogger(__name__)
+
+
+def claim_batch(batch_size=None):
+    """Mark up to batch_size queued market orders as executing and return them, oldest first"""
+    batch_size = batch_size or getattr(settings, 'ORDER_EXECUTOR_BATCH_SIZE', 100)
+    with transaction.atomic():
+        orders = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .select_related('user')
+            .filter(order_type=Order.MARKET, status=Order.OPEN)
+            .order_by('id')[:batch_size]
+        )
+        now = timezone.now()
+        for order in orders:
+            order.status = Order.EXECUTING
+            order.updated_at = now
+        Order.objects.bulk_update(orders, ['status', 'updated_at'])
+    return orders
+
+
+def execute_batch(orders):
+    """Price claimed orders with one lookup and fill each in its own transaction"""
+    if not orders:
+        return orders
+    symbols = sorted({order.stock_symbol for order in orders})
+    prices = get_current_stock_prices(symbols)
+
+    for order in orders:
+        price = prices.get(order.stock_symbol)
+        try:
+            with transaction.atomic():
+                _execute(order, price)
+        except DatabaseError as e:
+            logger.error(f"Error executing order {order.id}: {e}")
+            order.status = Order.REJECTED
+            order.transaction = None
+            order.reason = "The order could not be executed. Please try again."
+            try:
+                _save_outcome(order)
+            except DatabaseError as e:
+                # Left executing; requeue_stale puts it back on the queue
+                logger.error(f"Error recording the outcome of order {order.id}: {e}")
+    return orders
+
+
+def _execute(order, price):
+    if not price or price <= 0:
+        order.status = Order.REJECTED
+        order.reason = f"Could not get a price for {order.stock_symbol}."
+    else:
+        try:
+            with transaction.atomic():
+                order.transaction = execute_order(
+                    order.user, order.stock_symbol, order.stock_name,
+                    order.transaction_type, order.quantity, price
+                )
+            order.status = Order.FILLED
+        except TradeError as e:
+            order.status = Order.REJECTED
+            order.reason = str(e)[:255]
+    _save_outcome(order)
+
+
+def _save_outcome(order):
+    order.updated_at = timezone.now()
+    order.save(update_fields=['status', 'transaction', 'reason', 'updated_at'])
+
+
+def requeue_stale(older_than=None):
+    """Put orders stuck executing for longer than older_than seconds back on the queue"""
+    older_than = older_than or getattr(settings, 'ORDER_EXECUTOR_STALE_AFTER', 300)
+    return Order.objects.filter(
+        order_type=Order.MARKET, status=Order.EXECUTING,
+        updated_at__lt=timezone.now() - timedelta(seconds=older_than)
+    ).update(status=Order.OPEN, updated_at=timezone.now())
+
+
+def drain(batch_size=None):
+    """Execute queued orders until the queue is empty; returns the orders processed"""
+    processed = []
+    while True:
+        orders = claim_batch(batch_size)
+        if not orders:
+            return processed
+        processed += execute_batch(orders)
+
+
+def run_executor(interval, once=False, batch_size=None):
+    """Drain the order queue, then poll it every interval seconds"""
+    while True:
+        started = time.monotonic()
+        processed = []
+        try:
+            requeued = requeue_stale()
+            if requeued:
+                logger.warning(f"Requeued {requeued} orders left executing by a stopped executor")
+            processed = drain(batch_size)
+        except Exception as e:
+            # Keep the executor alive; claimed orders are requeued once stale
+            logger.error(f"Error draining the order queue: {e}")
+        if processed:
+            filled = sum(1 for order in processed if order.status == Order.FILLED)
+            logger.info(
+                f"Filled {filled} and rejected {len(processed) - filled} orders "
+                f"in {time.monotonic() - started:.2f}s"
+            )
+
+        if once:
+            return processed
+        time.sleep(interval)
+
+
+def _run_worker(interval, batch_size):
+    # Each executor process opens its own database connections
+    import django
+    django.setup()
+    connections.close_all()
+    try:
+        run_executor(interval, batch_size=batch_size)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_executors(workers, interval, batch_size=None):
+    """Run workers executor processes until interrupted"""
+    # Connections must not be shared with the child processes
+    connections.close_all()
+    processes = [
+        multiprocessing.Process(target=_run_worker, args=(interval, batch_size), daemon=True)
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,212 @@
+"""
+Limit and stop order matching used by the run_order_matcher command.
+
+Open orders are held in memory in two heaps per symbol, keyed by trigger
+price:
+
+- orders that fire when the price falls to the trigger (limit buys, stop
+  sells) in a max-heap, so the highest trigger is on top
+- orders that fire when the price rises to the trigger (limit sells, stop
+  buys) in a min-heap, so the lowest trigger is on top
+
+On a tick only the tops of the two heaps are compared with the price, and
+orders are popped while they are crossed, so a tick costs O(k log n) for k
+triggered orders however many orders are resting. Cancelled orders are
+dropped from a live set and skipped lazily when they reach the top.
+
+Triggered orders become market orders at the tick price and are filled with
+market.trading.execute_order, the same ledger writes as the trade view.
+"""
+
+import heapq
+import logging
+import time
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Order, Transaction
+from .trading import TradeError, execute_order
+from .utils import get_current_stock_prices
+
+logger = logging.getLogger(__name__)
+
+
+def fires_below(transaction_type, order_type):
+    """Whether an order triggers when the price falls to its trigger (limit buys, stop sells)"""
+    return (transaction_type == Transaction.BUY) == (order_type == Order.LIMIT)
+
+
+class OrderBook:
+    """Per-symbol trigger-price heaps of open order ids"""
+
+    def __init__(self):
+        self._below = defaultdict(list)  # symbol -> [(-trigger, order_id)]
+        self._above = defaultdict(list)  # symbol -> [(trigger, order_id)]
+        self._live = {}  # order_id -> symbol
+        self._open = Counter()  # symbol -> live orders
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, order_id):
+        return order_id in self._live
+
+    def symbols(self):
+        """Symbols with at least one open order"""
+        return sorted(symbol for symbol, count in self._open.items() if count)
+
+    def add(self, order_id, symbol, trigger, below):
+        if order_id in self._live:
+            return
+        self._live[order_id] = symbol
+        self._open[symbol] += 1
+        if below:
+            heapq.heappush(self._below[symbol], (-trigger, order_id))
+        else:
+            heapq.heappush(self._above[symbol], (trigger, order_id))
+
+    def discard(self, order_id):
+        """Forget an order; its heap entry is skipped when it surfaces"""
+        symbol = self._live.pop(order_id, None)
+        if symbol is None:
+            return
+        self._open[symbol] -= 1
+        self._dead += 1
+        if self._dead > max(len(self._live), 1000):
+            self._compact()
+
+    def _compact(self):
+        for heaps in (self._below, self._above):
+            for symbol, heap in list(heaps.items()):
+                heap[:] = [entry for entry in heap if entry[1] in self._live]
+                heapq.heapify(heap)
+                if not heap:
+                    del heaps[symbol]
+        self._open = Counter({symbol: count for symbol, count in self._open.items() if count})
+        self._dead = 0
+
+    def _pop_crossed(self, heap, crossed, triggered):
+        while heap and crossed(heap[0][0]):
+            _, order_id = heapq.heappop(heap)
+            if self._live.pop(order_id, None) is not None:
+                triggered.append(order_id)
+            else:
+                self._dead -= 1
+
+    def match(self, symbol, price):
+        """Remove and return the ids of orders on symbol triggered at price, oldest first"""
+        triggered = []
+        if symbol in self._below:
+            self._pop_crossed(self._below[symbol], lambda key: -key >= price, triggered)
+        if symbol in self._above:
+            self._pop_crossed(self._above[symbol], lambda key: key <= price, triggered)
+        self._open[symbol] -= len(triggered)
+        return sorted(triggered)
+
+
+class OrderMatcher:
+    """Keeps an OrderBook in step with the Order table and fills orders on price ticks"""
+
+    def __init__(self, book=None):
+        self.book = book or OrderBook()
+        self.last_order_id = 0
+        self.synced_at = None
+        self.last_prices = {}
+        self.new_symbols = set()
+
+    def load_new_orders(self):
+        """Add orders placed since the last call to the book; returns how many"""
+        added = 0
+        self.new_symbols = set()
+        orders = Order.objects.filter(
+            status=Order.OPEN, order_type__in=[Order.LIMIT, Order.STOP], id__gt=self.last_order_id
+        ).order_by('id').values_list(
+            'id', 'stock_symbol', 'trigger_price', 'transaction_type', 'order_type'
+        )
+        for order_id, symbol, trigger_price, transaction_type, order_type in orders.iterator(chunk_size=5000):
+            self.book.add(order_id, symbol, float(trigger_price), fires_below(transaction_type, order_type))
+            self.last_order_id = order_id
+            self.new_symbols.add(symbol)
+            added += 1
+        return added
+
+    def drop_closed_orders(self):
+        """Discard orders cancelled (or otherwise closed) elsewhere since the last call"""
+        now = timezone.now()
+        if self.synced_at is not None:
+            closed = Order.objects.filter(updated_at__gte=self.synced_at).exclude(status=Order.OPEN)
+            for order_id in closed.values_list('id', flat=True).iterator(chunk_size=5000):
+                self.book.discard(order_id)
+        self.synced_at = now
+
+    def fill(self, order_id, price):
+        """Execute a triggered order at price; returns the order, or None if it is no longer open"""
+        with transaction.atomic():
+            order = Order.objects.select_for_update().select_related('user').filter(
+                id=order_id, status=Order.OPEN
+            ).first()
+            if order is None:
+                return None
+            try:
+                # Savepoint, so a rejected fill still records the rejection
+                with transaction.atomic():
+                    order.transaction = execute_order(
+                        order.user, order.stock_symbol, order.stock_name,
+                        order.transaction_type, order.quantity, price
+                    )
+                order.status = Order.FILLED
+            except TradeError as e:
+                order.status = Order.REJECTED
+                order.reason = str(e)[:255]
+            order.save(update_fields=['status', 'transaction', 'reason', 'updated_at'])
+        return order
+
+    def on_tick(self, symbol, price):
+        """Fill every order on symbol crossed by price; returns the orders filled or rejected"""
+        orders = []
+        for order_id in self.book.match(symbol, float(price)):
+            order = self.fill(order_id, price)
+            if order is not None:
+                orders.append(order)
+        return orders
+
+    def run_cycle(self):
+        """Sync the book with the database and match it against current prices; returns orders processed"""
+        self.load_new_orders()
+        self.drop_closed_orders()
+        symbols = self.book.symbols()
+        prices = get_current_stock_prices(symbols) if symbols else {}
+
+        processed = []
+        for symbol, price in prices.items():
+            # Only a changed price is a new tick, except for symbols with newly
+            # loaded orders, which may already be crossed at the current price.
+            # Orders already in the book were not crossed at the last price.
+            if price <= 0:
+                continue
+            if self.last_prices.get(symbol) == price and symbol not in self.new_symbols:
+                continue
+            self.last_prices[symbol] = price
+            processed += self.on_tick(symbol, price)
+        return processed
+
+
+def run_matcher(interval, once=False):
+    """Match open orders against quotes every interval seconds"""
+    matcher = OrderMatcher()
+    while True:
+        started = time.monotonic()
+        processed = matcher.run_cycle()
+        if processed:
+            filled = sum(1 for order in processed if order.status == Order.FILLED)
+            logger.info(
+                f"Filled {filled} and rejected {len(processed) - filled} orders; "
+                f"{len(matcher.book)} open across {len(matcher.book.symbols())} symbols"
+            )
+
+        if once:
+            return processed
+        time.sleep(max(0, interval - (time.monotonic() - started)))
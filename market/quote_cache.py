@@ -0,0 +1,388 @@
+"""
+Quote cache used by market.utils to avoid repeated upstream lookups.
+
+Entries carry their own expiry so a symbol can be cached for a shorter time
+(for example fallback data) than regular quotes. Three backends are available
+and selected with the QUOTE_CACHE_BACKEND setting:
+
+* ``memory`` - per-process LRU dict (default)
+* ``django`` - Django cache framework alias, shared when the alias is shared
+* ``sqlite`` - local SQLite file shared by every worker on the machine
+
+Writers go through update_many, which also bumps a quote version whenever a
+price actually changes. Pages that render quotes can key cached fragments on
+quote_version() and re-render once per price change rather than per request.
+
+Bookkeeping values (the quote version, recently requested symbols, challenge
+standings) are stored with the *_meta methods. They live outside the quote
+LRU so a burst of new symbols can never evict them, and update_meta applies a
+read-modify-write atomically across threads and, for shared backends, workers.
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_TTL = 60
+DEFAULT_MAX_ENTRIES = 1000
+
+QUOTE_VERSION_KEY = 'quote_version'
+QUOTE_VERSION_TTL = 24 * 3600
+
+
+def _price(quote):
+    """The quote fields rendered pages depend on"""
+    if quote is None:
+        return None
+    return quote.get('current_price'), quote.get('change_percent')
+
+
+class BaseQuoteCache:
+    """Common interface of the quote cache backends"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def get(self, symbol):
+        """Return the cached quote for symbol or None"""
+        return self.get_many([symbol]).get(symbol)
+
+    def set(self, symbol, quote, ttl=None):
+        """Cache a single quote"""
+        self.set_many({symbol: quote}, ttl=ttl)
+
+    def get_many(self, symbols):
+        """Return a dict of the cached quotes found for symbols"""
+        raise NotImplementedError
+
+    def set_many(self, quotes, ttl=None):
+        """Cache a dict of symbol -> quote, all with the same ttl"""
+        raise NotImplementedError
+
+    def update_many(self, quotes, ttl=None):
+        """set_many, bumping the quote version if any price differs from the cached one"""
+        cached = self.get_many(list(quotes))
+        changed = any(_price(cached.get(symbol)) != _price(quote) for symbol, quote in quotes.items())
+        self.set_many(quotes, ttl=ttl)
+        # Bump after writing so a reader that sees the new version also sees the new prices
+        if changed:
+            self.bump_quote_version()
+
+    def quote_version(self):
+        """Nanosecond timestamp of the last cached price change, used as a version token"""
+        version = self.get_meta(QUOTE_VERSION_KEY)
+        if version is None:
+            version = self.bump_quote_version()
+        return version
+
+    def bump_quote_version(self):
+        version = time.time_ns()
+        self.set_meta(QUOTE_VERSION_KEY, version, ttl=QUOTE_VERSION_TTL)
+        return version
+
+    def delete(self, symbol):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def get_meta(self, key, default=None):
+        """Return a non-quote value (e.g. tracking data) stored alongside the quotes"""
+        raise NotImplementedError
+
+    def set_meta(self, key, value, ttl=None):
+        """Store a non-quote value alongside the quotes, never evicted before its ttl"""
+        raise NotImplementedError
+
+    def update_meta(self, key, func, default=None, ttl=None):
+        """Atomically replace the meta value with func(current value) and return it"""
+        raise NotImplementedError
+
+    def delete_meta(self, key):
+        raise NotImplementedError
+
+    def _expiry(self, ttl):
+        return time.time() + (self.ttl if ttl is None else ttl)
+
+
+class MemoryQuoteCache(BaseQuoteCache):
+    """In-process LRU cache, private to each worker"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        super().__init__(ttl, max_entries)
+        self._entries = OrderedDict()
+        self._meta = {}
+        self._lock = threading.Lock()
+
+    def get_many(self, symbols):
+        now = time.time()
+        found = {}
+        with self._lock:
+            for symbol in symbols:
+                entry = self._entries.get(symbol)
+                if entry is None:
+                    continue
+                expires_at, quote = entry
+                if expires_at <= now:
+                    del self._entries[symbol]
+                    continue
+                self._entries.move_to_end(symbol)
+                found[symbol] = dict(quote)
+        return found
+
+    def set_many(self, quotes, ttl=None):
+        expires_at = self._expiry(ttl)
+        with self._lock:
+            for symbol, quote in quotes.items():
+                self._entries[symbol] = (expires_at, dict(quote))
+                self._entries.move_to_end(symbol)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, symbol):
+        with self._lock:
+            self._entries.pop(symbol, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._meta.clear()
+
+    def _live_meta(self, key, default):
+        entry = self._meta.get(key)
+        if entry is None or entry[0] <= time.time():
+            return default
+        return entry[1]
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            return self._live_meta(key, default)
+
+    def set_meta(self, key, value, ttl=None):
+        with self._lock:
+            self._meta[key] = (self._expiry(ttl), value)
+
+    def update_meta(self, key, func, default=None, ttl=None):
+        with self._lock:
+            value = func(self._live_meta(key, default))
+            self._meta[key] = (self._expiry(ttl), value)
+            return value
+
+    def delete_meta(self, key):
+        with self._lock:
+            self._meta.pop(key, None)
+
+
+class DjangoQuoteCache(BaseQuoteCache):
+    """Backend storing quotes in a Django cache alias (eviction is left to it)"""
+
+    key_prefix = 'quote:'
+    meta_prefix = 'quote_meta:'
+    # How long update_meta waits for another worker's update before going ahead
+    lock_wait = 1.0
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, alias='default'):
+        super().__init__(ttl, max_entries)
+        self._cache = caches[alias]
+
+    def _key(self, symbol):
+        return f"{self.key_prefix}{symbol}"
+
+    def get_many(self, symbols):
+        keys = {self._key(symbol): symbol for symbol in symbols}
+        found = self._cache.get_many(list(keys))
+        return {keys[key]: quote for key, quote in found.items()}
+
+    def set_many(self, quotes, ttl=None):
+        timeout = self.ttl if ttl is None else ttl
+        self._cache.set_many(
+            {self._key(symbol): quote for symbol, quote in quotes.items()},
+            timeout=timeout
+        )
+
+    def delete(self, symbol):
+        self._cache.delete(self._key(symbol))
+
+    def clear(self):
+        # Clears the whole alias, so point QUOTE_CACHE_ALIAS at a dedicated cache
+        self._cache.clear()
+
+    def get_meta(self, key, default=None):
+        return self._cache.get(f"{self.meta_prefix}{key}", default)
+
+    def set_meta(self, key, value, ttl=None):
+        self._cache.set(f"{self.meta_prefix}{key}", value, timeout=self.ttl if ttl is None else ttl)
+
+    def update_meta(self, key, func, default=None, ttl=None):
+        """Raises TimeoutError rather than updating unlocked if the lock stays taken for lock_wait seconds"""
+        # cache.add is atomic on every shared backend, so it doubles as a short-lived lock
+        lock_key = f"{self.meta_prefix}{key}:lock"
+        deadline = time.monotonic() + self.lock_wait
+        while not self._cache.add(lock_key, 1, timeout=5):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"Timed out waiting for the {key} meta lock")
+            time.sleep(0.01)
+        try:
+            value = func(self.get_meta(key, default))
+            self.set_meta(key, value, ttl=ttl)
+            return value
+        finally:
+            self._cache.delete(lock_key)
+
+    def delete_meta(self, key):
+        self._cache.delete(f"{self.meta_prefix}{key}")
+
+
+class SQLiteQuoteCache(BaseQuoteCache):
+    """Backend storing quotes in a local SQLite file shared by all workers"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES, path='quote_cache.sqlite3'):
+        super().__init__(ttl, max_entries)
+        self.path = str(path)
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS quotes ("
+            "symbol TEXT PRIMARY KEY, quote BLOB NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection().execute(
+            "CREATE INDEX IF NOT EXISTS quotes_accessed_at ON quotes (accessed_at)"
+        )
+        # Meta values get their own table so the LRU trim in set_many never touches them
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS meta ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, symbols):
+        symbols = list(symbols)
+        if not symbols:
+            return {}
+        now = time.time()
+        conn = self._connection()
+        placeholders = ",".join("?" * len(symbols))
+        rows = conn.execute(
+            f"SELECT symbol, quote FROM quotes WHERE symbol IN ({placeholders}) AND expires_at > ?",
+            (*symbols, now)
+        ).fetchall()
+        if rows:
+            conn.execute(
+                f"UPDATE quotes SET accessed_at = ? WHERE symbol IN ({','.join('?' * len(rows))})",
+                (now, *[row[0] for row in rows])
+            )
+        return {symbol: pickle.loads(quote) for symbol, quote in rows}
+
+    def set_many(self, quotes, ttl=None):
+        if not quotes:
+            return
+        now = time.time()
+        expires_at = self._expiry(ttl)
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR REPLACE INTO quotes (symbol, quote, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                [(symbol, pickle.dumps(quote), expires_at, now) for symbol, quote in quotes.items()]
+            )
+            conn.execute("DELETE FROM quotes WHERE expires_at <= ?", (now,))
+            conn.execute(
+                "DELETE FROM quotes WHERE symbol IN ("
+                "SELECT symbol FROM quotes ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, symbol):
+        self._connection().execute("DELETE FROM quotes WHERE symbol = ?", (symbol,))
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM quotes")
+            conn.execute("DELETE FROM meta")
+
+    def _read_meta(self, conn, key, default):
+        row = conn.execute(
+            "SELECT value FROM meta WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def _write_meta(self, conn, key, value, ttl):
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, pickle.dumps(value), self._expiry(ttl))
+        )
+        conn.execute("DELETE FROM meta WHERE expires_at <= ?", (time.time(),))
+
+    def get_meta(self, key, default=None):
+        return self._read_meta(self._connection(), key, default)
+
+    def set_meta(self, key, value, ttl=None):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._write_meta(conn, key, value, ttl)
+
+    def update_meta(self, key, func, default=None, ttl=None):
+        # BEGIN IMMEDIATE takes the write lock before reading, so workers merge in turn
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            value = func(self._read_meta(conn, key, default))
+            self._write_meta(conn, key, value, ttl)
+        return value
+
+    def delete_meta(self, key):
+        self._connection().execute("DELETE FROM meta WHERE key = ?", (key,))
+
+
+_quote_cache = None
+_quote_cache_lock = threading.Lock()
+
+
+def create_quote_cache():
+    """Build the quote cache configured in settings"""
+    backend = getattr(settings, 'QUOTE_CACHE_BACKEND', 'memory')
+    options = {
+        'ttl': getattr(settings, 'QUOTE_CACHE_TTL', DEFAULT_TTL),
+        'max_entries': getattr(settings, 'QUOTE_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+    }
+    if backend == 'memory':
+        return MemoryQuoteCache(**options)
+    if backend == 'django':
+        return DjangoQuoteCache(alias=getattr(settings, 'QUOTE_CACHE_ALIAS', 'default'), **options)
+    if backend == 'sqlite':
+        return SQLiteQuoteCache(path=getattr(settings, 'QUOTE_CACHE_PATH', 'quote_cache.sqlite3'), **options)
+    raise ValueError(f"Unknown QUOTE_CACHE_BACKEND: {backend}")
+
+
+def get_quote_cache():
+    """Return the process-wide quote cache, creating it on first use"""
+    global _quote_cache
+    if _quote_cache is None:
+        with _quote_cache_lock:
+            if _quote_cache is None:
+                _quote_cache = create_quote_cache()
+    return _quote_cache
+
+
+def reset_quote_cache():
+    """Drop the process-wide quote cache so it is rebuilt from settings"""
+    global _quote_cache
+    with _quote_cache_lock:
+        _quote_cache = None
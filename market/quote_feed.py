@@ -0,0 +1,74 @@
+"""
+Background quote refresher used by the run_quote_feed management command.
+
+The feed keeps a tracked universe of symbols fresh in the shared quote cache
+so that web workers (with QUOTE_FEED_ENABLED) never wait on Yahoo Finance.
+"""
+
+import logging
+import time
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import Order, StockHolding
+from .quote_cache import get_quote_cache
+from .utils import NIFTY50_STOCKS, fetch_stock_infos, get_recent_symbols, normalize_symbol, store_quotes
+
+logger = logging.getLogger(__name__)
+
+
+def tracked_universe():
+    """
+    Return the symbols the feed refreshes, highest priority first:
+    held symbols (most holders first), symbols with open orders, then recently
+    requested ones, then the Nifty list.
+    """
+    held = (
+        StockHolding.objects.filter(quantity__gt=0)
+        .values('stock_symbol')
+        .annotate(holders=Count('id'))
+        .order_by('-holders', 'stock_symbol')
+        .values_list('stock_symbol', flat=True)
+    )
+    symbols = [normalize_symbol(symbol) for symbol in held]
+    symbols += Order.objects.filter(status=Order.OPEN).order_by().values_list('stock_symbol', flat=True).distinct()
+    symbols += get_recent_symbols()
+    symbols += [stock['symbol'] for stock in NIFTY50_STOCKS]
+
+    universe = list(dict.fromkeys(symbols))
+    max_symbols = getattr(settings, 'QUOTE_FEED_MAX_SYMBOLS', None)
+    return universe[:max_symbols] if max_symbols else universe
+
+
+def refresh_quotes(symbols):
+    """
+    Fetch quotes for symbols in priority order and write each batch to the cache.
+    Returns the number of symbols refreshed.
+    """
+    cache = get_quote_cache()
+    batch_size = getattr(settings, 'QUOTE_BATCH_SIZE', 50)
+    ttl = getattr(settings, 'QUOTE_FEED_TTL', 3600)
+
+    refreshed = 0
+    for start in range(0, len(symbols), batch_size):
+        fetched = fetch_stock_infos(symbols[start:start + batch_size])
+        if fetched:
+            cache.update_many(fetched, ttl=ttl)
+            store_quotes(fetched.values())
+            refreshed += len(fetched)
+    return refreshed
+
+
+def run_feed(interval, once=False):
+    """Refresh the tracked universe every interval seconds"""
+    while True:
+        started = time.monotonic()
+        symbols = tracked_universe()
+        refreshed = refresh_quotes(symbols)
+        elapsed = time.monotonic() - started
+        logger.info(f"Refreshed {refreshed}/{len(symbols)} quotes in {elapsed:.2f}s")
+
+        if once:
+            return refreshed
+        time.sleep(max(0, interval - elapsed))
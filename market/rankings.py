@@ -0,0 +1,114 @@
+"""
+Challenge standings.
+
+Completed challenges are ranked in SQL with a RANK() window over the stored
+final portfolio values, so a standings page is a single query. Active
+challenges are valued with the bulk valuation kernel, sorted once and the
+resulting Standings cached for CHALLENGE_STANDINGS_TTL seconds in the quote
+cache, where every worker sharing the cache can reuse them.
+"""
+
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import Rank
+
+from .models import Challenge, ChallengeParticipant
+from .quote_cache import get_quote_cache
+from .utils import get_current_stock_prices
+from .valuation import HoldingsMatrix, to_money
+
+
+@dataclass(frozen=True)
+class Standing:
+    """One participant's position in a challenge"""
+    rank: int
+    user_id: int
+    username: str
+    portfolio_value: object
+
+
+class Standings:
+    """Participants of a challenge ordered best first, with rank lookup by user"""
+
+    def __init__(self, entries):
+        self.entries = tuple(entries)
+        self._by_user = {entry.user_id: entry for entry in self.entries}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def top(self, limit):
+        return self.entries[:limit]
+
+    def get(self, user_id):
+        """Return the Standing of a user, or None if they are not participating"""
+        return self._by_user.get(user_id)
+
+
+def _standings_key(challenge_id):
+    return f"challenge_standings:{challenge_id}"
+
+
+def completed_standings(challenge):
+    """
+    Rank a completed challenge by final portfolio value in one query.
+    Returns None if some participants have no final value yet.
+    """
+    rows = ChallengeParticipant.objects.filter(challenge=challenge).annotate(
+        rank=Window(Rank(), order_by=F('final_portfolio_value').desc()),
+    ).order_by('rank', 'user_id').values_list('rank', 'user_id', 'user__username', 'final_portfolio_value')
+
+    entries = [Standing(*row) for row in rows]
+    if any(entry.portfolio_value is None for entry in entries):
+        return None
+    return Standings(entries)
+
+
+def live_standings(challenge):
+    """
+    Rank participants of a challenge by current net worth using bulk
+    valuation. Participants without a portfolio are left out.
+    """
+    participants = ChallengeParticipant.objects.filter(challenge=challenge).values('user_id')
+    matrix = HoldingsMatrix.load(user_ids=participants)
+    valuation = matrix.value(get_current_stock_prices(matrix.symbols) if matrix.symbols else {})
+
+    # Best net worth first, ties broken by user id; ties share a rank as RANK() does
+    order = np.lexsort((valuation.user_ids, -valuation.net_worth))
+    net_worth = valuation.net_worth[order]
+    entries = []
+    for position, i in enumerate(order):
+        if position and net_worth[position] == net_worth[position - 1]:
+            rank = entries[-1].rank
+        else:
+            rank = position + 1
+        entries.append(Standing(rank, int(valuation.user_ids[i]), valuation.usernames[i],
+                                to_money(valuation.net_worth[i])))
+    return Standings(entries)
+
+
+def challenge_standings(challenge):
+    """Return the Standings of a challenge, from cache where possible"""
+    if challenge.status == Challenge.COMPLETED:
+        standings = completed_standings(challenge)
+        if standings is not None:
+            return standings
+
+    cache = get_quote_cache()
+    standings = cache.get_meta(_standings_key(challenge.id))
+    if standings is None:
+        standings = live_standings(challenge)
+        cache.set_meta(_standings_key(challenge.id), standings,
+                       ttl=getattr(settings, 'CHALLENGE_STANDINGS_TTL', 60))
+    return standings
+
+
+def invalidate_standings(challenge):
+    """Drop cached standings, e.g. after someone joins"""
+    get_quote_cache().delete_meta(_standings_key(challenge.id))
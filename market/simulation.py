@@ -0,0 +1,303 @@
+"""
+Deterministic simulated market used when live quotes are unavailable.
+
+Every symbol follows a geometric Brownian motion driven by a shared market
+factor plus its own noise (a one-factor model, so symbols are correlated
+through their beta). A session is one calendar day split into ticks; the
+whole universe is stepped together with NumPy, giving intraday OHLC and
+volume for every symbol at every tick. Each session opens one tick's move
+away from the previous session's close.
+
+All randomness comes from generators seeded with (seed, day, symbol), so any
+process with the same MARKET_SIM_SEED sees the same prices at the same time,
+regardless of the order in which symbols were added.
+"""
+
+import threading
+import time
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+SECONDS_PER_DAY = 86400
+SECONDS_PER_YEAR = 365 * SECONDS_PER_DAY
+
+# Daily price levels are a moving sum of this many daily shocks
+ANCHOR_LOOKBACK = 30
+
+
+def _symbol_key(symbol):
+    return zlib.crc32(symbol.encode('utf-8'))
+
+
+def _unit_shocks(bit_generator, start):
+    """ANCHOR_LOOKBACK unit-variance shocks from position start of a random stream"""
+    bit_generator.advance(start)
+    return (np.random.Generator(bit_generator).random(ANCHOR_LOOKBACK) - 0.5) * np.sqrt(12)
+
+
+class SymbolParams:
+    """Static per-symbol parameters, stored as arrays over the universe"""
+
+    FIELDS = ('base_price', 'beta', 'volatility', 'shares', 'eps', 'dividend_yield', 'avg_volume')
+
+    def __init__(self, seed, symbols):
+        rows = [self._draw(seed, symbol) for symbol in symbols]
+        for i, field in enumerate(self.FIELDS):
+            setattr(self, field, np.array([row[i] for row in rows], dtype=np.float64))
+
+    @staticmethod
+    def _draw(seed, symbol):
+        rng = np.random.default_rng([seed, _symbol_key(symbol)])
+        base_price = float(np.exp(rng.uniform(np.log(100), np.log(5000))))
+        return (
+            base_price,
+            rng.uniform(0.6, 1.4),                  # beta to the market factor
+            rng.uniform(0.15, 0.45),                # annual idiosyncratic volatility
+            float(rng.integers(10**7, 10**9)),      # shares outstanding
+            base_price / rng.uniform(8, 50),        # earnings per share
+            rng.uniform(0, 4),                      # dividend yield %
+            float(rng.integers(10**5, 10**7)),      # average daily volume
+        )
+
+
+class SessionBars:
+    """
+    Tick-by-tick closes and volumes of shape (ticks, symbols) for one session.
+    Stored as float32 to keep large universes small; highs, lows and cumulative
+    volume are derived on demand for the columns being quoted.
+    """
+
+    def __init__(self, open_, close, tick_volume):
+        self.open = open_
+        self.close = close
+        self.tick_volume = tick_volume
+
+    def append(self, other):
+        """Return bars with the symbols of other added as extra columns"""
+        return SessionBars(
+            np.concatenate([self.open, other.open]),
+            np.hstack([self.close, other.close]),
+            np.hstack([self.tick_volume, other.tick_volume]),
+        )
+
+    def ohlcv(self, tick, columns):
+        """Return open, high, low, close and cumulative volume arrays at a tick"""
+        closes = self.close[:tick + 1, columns]
+        open_ = self.open[columns]
+        high = np.maximum(closes.max(axis=0), open_)
+        low = np.minimum(closes.min(axis=0), open_)
+        volume = self.tick_volume[:tick + 1, columns].sum(axis=0)
+        return open_, high, low, closes[-1], volume
+
+
+class MarketSimulator:
+    """Seedable simulated market stepping a whole universe of symbols per tick"""
+
+    def __init__(self, symbols=(), seed=0, tick_seconds=60, market_volatility=0.15, drift=0.08):
+        self.seed = seed
+        self.tick_seconds = tick_seconds
+        self.ticks_per_session = SECONDS_PER_DAY // tick_seconds
+        self.market_volatility = market_volatility
+        self.drift = drift
+        self.symbols = []
+        self.index = {}
+        self.params = SymbolParams(seed, [])
+        self._sessions = {}
+        self._previous_closes = {}
+        self._lock = threading.RLock()
+        self.add_symbols(symbols)
+
+    def add_symbols(self, symbols):
+        """Add symbols to the universe; existing session data is extended, not recomputed"""
+        with self._lock:
+            new = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self.index]
+            if not new:
+                return
+            new_params = SymbolParams(self.seed, new)
+            for symbol in new:
+                self.index[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            for field in SymbolParams.FIELDS:
+                setattr(self.params, field, np.concatenate([getattr(self.params, field), getattr(new_params, field)]))
+            for day, bars in list(self._sessions.items()):
+                self._sessions[day] = bars.append(self._simulate_session(day, new, new_params))
+            for day, closes in list(self._previous_closes.items()):
+                new_closes = self._simulate_session(day - 1, new, new_params).close[-1].astype(np.float64)
+                self._previous_closes[day] = np.concatenate([closes, new_closes])
+
+    def session(self, day):
+        """Return the SessionBars for a day number (days since the Unix epoch)"""
+        with self._lock:
+            bars = self._sessions.get(day)
+            if bars is None:
+                bars = self._simulate_session(day, self.symbols, self.params)
+                # Only the current session is kept in full
+                self._sessions = {day: bars}
+            return bars
+
+    def previous_close(self, day):
+        """Closing prices of the session before day, for every symbol"""
+        with self._lock:
+            closes = self._previous_closes.get(day)
+            if closes is None:
+                closes = self._simulate_session(day - 1, self.symbols, self.params).close[-1].astype(np.float64)
+                self._previous_closes = {day: closes}
+            return closes
+
+    def _level(self, day, symbols, params):
+        """
+        Log price of each symbol relative to its base price at the open of a day.
+
+        The level is a moving sum of the last ANCHOR_LOOKBACK daily shocks, each
+        a market factor move scaled by beta plus the symbol's own noise. From one
+        day to the next it moves by the newest shock minus the one leaving the
+        window, so daily moves carry the market factor like any other return,
+        yet any day's level is found without replaying every session since the
+        epoch.
+        """
+        start = day - ANCHOR_LOOKBACK
+        market = _unit_shocks(np.random.PCG64([self.seed]), start)
+        own = np.empty((ANCHOR_LOOKBACK, len(symbols)))
+        for i, symbol in enumerate(symbols):
+            own[:, i] = _unit_shocks(np.random.PCG64([self.seed, _symbol_key(symbol)]), start)
+        shocks = np.outer(market, params.beta * self.market_volatility) + own * params.volatility
+        # Each daily move is the difference of two shocks, hence half the daily variance per shock
+        return shocks.sum(axis=0) * np.sqrt(1 / 365 / 2)
+
+    def _overnight_step(self, day, symbols, params, dt):
+        """Log return from the previous session's last tick to the open of day, one tick's GBM step"""
+        market = np.random.default_rng([self.seed, day, 2]).standard_normal()
+        own = np.array([
+            np.random.default_rng([self.seed, day, _symbol_key(symbol), 2]).standard_normal()
+            for symbol in symbols
+        ])
+        total_variance = (params.beta * self.market_volatility) ** 2 + params.volatility ** 2
+        return (
+            (self.drift - 0.5 * total_variance) * dt
+            + market * params.beta * self.market_volatility * np.sqrt(dt)
+            + own * params.volatility * np.sqrt(dt)
+        )
+
+    def _simulate_session(self, day, symbols, params):
+        """
+        Step every symbol through all ticks of a session in one vectorized pass.
+
+        The session opens at the day's level and its ticks are pinned (as a
+        Brownian bridge) to close one overnight step below the next day's
+        open, so each session starts from the previous close.
+        """
+        ticks = self.ticks_per_session
+        n = len(symbols)
+        dt = self.tick_seconds / SECONDS_PER_YEAR
+
+        market = np.random.default_rng([self.seed, day]).standard_normal(ticks)
+        noise = np.empty((ticks, n))
+        volume_noise = np.empty((ticks, n))
+        for i, symbol in enumerate(symbols):
+            rng = np.random.default_rng([self.seed, day, _symbol_key(symbol), 1])
+            noise[:, i] = rng.standard_normal(ticks)
+            volume_noise[:, i] = rng.standard_normal(ticks)
+
+        total_variance = (params.beta * self.market_volatility) ** 2 + params.volatility ** 2
+        log_returns = (
+            (self.drift - 0.5 * total_variance) * dt
+            + np.outer(market, params.beta * self.market_volatility * np.sqrt(dt))
+            + noise * (params.volatility * np.sqrt(dt))
+        )
+
+        level = self._level(day, symbols, params)
+        target = self._level(day + 1, symbols, params) - self._overnight_step(day + 1, symbols, params, dt) - level
+        path = np.cumsum(log_returns, axis=0)
+        path -= np.outer(np.arange(1, ticks + 1) / ticks, path[-1] - target)
+
+        open_ = params.base_price * np.exp(level)
+        close = open_ * np.exp(path)
+        tick_volume = (params.avg_volume / ticks) * np.exp(0.5 * volume_noise - 0.125)
+        return SessionBars(open_, close.astype(np.float32), tick_volume.astype(np.float32))
+
+    def _clock(self, at):
+        at = time.time() if at is None else at
+        day = int(at // SECONDS_PER_DAY)
+        tick = int((at % SECONDS_PER_DAY) // self.tick_seconds)
+        return day, tick
+
+    def quotes(self, symbols, at=None):
+        """Return stock info dicts (same keys as get_stock_info) for symbols at a Unix time"""
+        symbols = list(symbols)
+        self.add_symbols(symbols)
+        day, tick = self._clock(at)
+        with self._lock:
+            today = self.session(day)
+            previous_close = self.previous_close(day)
+            params = self.params
+            columns = np.array([self.index[symbol] for symbol in symbols], dtype=np.intp)
+
+        open_, high, low, price, volume = today.ohlcv(tick, columns)
+        price = price.astype(np.float64)
+        previous_close = previous_close[columns]
+        change = price - previous_close
+        market_cap = price * params.shares[columns]
+        pe_ratio = price / params.eps[columns]
+        base = params.base_price[columns]
+
+        results = {}
+        for j, symbol in enumerate(symbols):
+            results[symbol] = {
+                'symbol': symbol,
+                'name': symbol,
+                'current_price': round(float(price[j]), 2),
+                'change': round(float(change[j]), 2),
+                'change_percent': round(float(change[j] / previous_close[j] * 100), 2),
+                'previous_close': round(float(previous_close[j]), 2),
+                'open': round(float(open_[j]), 2),
+                'day_high': round(float(high[j]), 2),
+                'day_low': round(float(low[j]), 2),
+                'volume': int(volume[j]),
+                'market_cap': int(market_cap[j]),
+                'pe_ratio': round(float(pe_ratio[j]), 2),
+                'dividend_yield': round(float(params.dividend_yield[columns[j]]), 2),
+                'fifty_two_week_high': round(float(max(base[j] * 1.3, high[j])), 2),
+                'fifty_two_week_low': round(float(min(base[j] * 0.75, low[j])), 2),
+            }
+        return results
+
+    def daily_bars(self, symbols, start_day, end_day):
+        """
+        Return daily OHLCV bars for symbols from start_day to end_day (inclusive,
+        days since the Unix epoch) as a dict of symbol -> column lists.
+        """
+        symbols = list(symbols)
+        params = SymbolParams(self.seed, symbols)
+        bars = {symbol: {column: [] for column in ('timestamp', 'open', 'high', 'low', 'close', 'volume')}
+                for symbol in symbols}
+        last_tick = self.ticks_per_session - 1
+        columns = np.arange(len(symbols))
+        for day in range(start_day, end_day + 1):
+            open_, high, low, close, volume = self._simulate_session(day, symbols, params).ohlcv(last_tick, columns)
+            for j, symbol in enumerate(symbols):
+                bars[symbol]['timestamp'].append(day * SECONDS_PER_DAY)
+                bars[symbol]['open'].append(round(float(open_[j]), 2))
+                bars[symbol]['high'].append(round(float(high[j]), 2))
+                bars[symbol]['low'].append(round(float(low[j]), 2))
+                bars[symbol]['close'].append(round(float(close[j]), 2))
+                bars[symbol]['volume'].append(int(volume[j]))
+        return bars
+
+
+_simulator = None
+_simulator_lock = threading.Lock()
+
+
+def get_market_simulator():
+    """Return the process-wide simulator configured from settings"""
+    global _simulator
+    if _simulator is None:
+        with _simulator_lock:
+            if _simulator is None:
+                _simulator = MarketSimulator(
+                    seed=getattr(settings, 'MARKET_SIM_SEED', 0),
+                    tick_seconds=getattr(settings, 'MARKET_SIM_TICK_SECONDS', 60),
+                )
+    return _simulator
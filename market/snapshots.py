@@ -0,0 +1,189 @@
+"""
+Daily portfolio snapshots built from the transaction ledger.
+
+snapshot_portfolios starts from each portfolio's last completed snapshot
+(its cash and positions at the end of that day), replays the transactions
+made since then and values the positions at each day's close from the bar
+store. Only days after the last final snapshot are computed. Today's row
+is valued at live prices, so it and yesterday's row (whose close may not
+have been loaded yet) are recomputed on every run.
+
+A portfolio's first snapshot starts at its first transaction, with opening
+cash worked back from the current balance through the ledger. Portfolios
+that have never traded get no snapshots.
+"""
+
+import logging
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+
+from .history import get_bar_store
+from .models import Portfolio, PortfolioSnapshot, Transaction
+from .simulation import SECONDS_PER_DAY
+from .utils import get_current_stock_prices
+from .valuation import to_money
+
+logger = logging.getLogger(__name__)
+
+EPOCH = date(1970, 1, 1)
+
+
+class DailyCloses:
+    """Daily closes from the bar store, looked up as of a date"""
+
+    def __init__(self, store=None):
+        self.store = store or get_bar_store()
+        self._series = {}
+
+    def _load(self, symbol):
+        try:
+            bars = self.store.read(symbol, '1d')
+        except ValueError:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.asarray(bars['timestamp']) // SECONDS_PER_DAY, np.asarray(bars['close'])
+
+    def close(self, symbol, day):
+        """Close of the last bar on or before day, or None if there is none"""
+        if symbol not in self._series:
+            self._series[symbol] = self._load(symbol)
+        days, closes = self._series[symbol]
+        i = int(np.searchsorted(days, (day - EPOCH).days, side='right')) - 1
+        return float(closes[i]) if i >= 0 else None
+
+
+def replay(start, end, cash, positions, transactions):
+    """
+    Apply transactions (ordered by time) day by day from start to end and
+    yield (day, cash, positions, last_prices) at the end of each day, where
+    last_prices holds the most recent traded price of each symbol.
+    """
+    positions = dict(positions)
+    last_prices = {}
+    transactions = iter(transactions)
+    pending = next(transactions, None)
+    day = start
+    while day <= end:
+        while pending is not None and timezone.localtime(pending.timestamp).date() <= day:
+            amount = pending.quantity * pending.price
+            if pending.transaction_type == Transaction.BUY:
+                cash -= amount
+                positions[pending.stock_symbol] = positions.get(pending.stock_symbol, 0) + pending.quantity
+            else:
+                cash += amount
+                positions[pending.stock_symbol] = positions.get(pending.stock_symbol, 0) - pending.quantity
+                if positions[pending.stock_symbol] <= 0:
+                    del positions[pending.stock_symbol]
+            last_prices[pending.stock_symbol] = float(pending.price)
+            pending = next(transactions, None)
+        yield day, cash, positions, last_prices
+        day += timedelta(days=1)
+
+
+def _opening_cash(balance, transactions):
+    """Cash before the first transaction, worked back from the current balance"""
+    for txn in transactions:
+        amount = txn.quantity * txn.price
+        balance += amount if txn.transaction_type == Transaction.BUY else -amount
+    return balance
+
+
+def snapshot_portfolios(portfolio_ids=None, today=None, closes=None):
+    """Bring snapshots up to today for all portfolios, or the given ones; returns rows written"""
+    today = today or timezone.localdate()
+    closes = closes or DailyCloses()
+    batch_size = getattr(settings, 'SNAPSHOT_BATCH_SIZE', 500)
+
+    final_before = today - timedelta(days=1)
+    latest = PortfolioSnapshot.objects.filter(portfolio=OuterRef('pk'), date__lt=final_before).order_by('-date')
+    portfolios = Portfolio.objects.annotate(last_snapshot_id=Subquery(latest.values('id')[:1])).values_list(
+        'id', 'last_snapshot_id', 'user__profile__balance'
+    ).order_by('id')
+    if portfolio_ids is not None:
+        portfolios = portfolios.filter(id__in=portfolio_ids)
+    portfolios = list(portfolios)
+
+    written = 0
+    for start in range(0, len(portfolios), batch_size):
+        written += _snapshot_batch(portfolios[start:start + batch_size], today, closes)
+    return written
+
+
+def _snapshot_batch(portfolios, today, closes):
+    last_snapshots = PortfolioSnapshot.objects.in_bulk(
+        [snapshot_id for _, snapshot_id, _ in portfolios if snapshot_id]
+    )
+    # Full ledgers for portfolios without snapshots; for the rest only the
+    # transactions since the oldest of their last snapshots
+    fresh = [portfolio_id for portfolio_id, snapshot_id, _ in portfolios if snapshot_id not in last_snapshots]
+    continuing = [snapshot.portfolio_id for snapshot in last_snapshots.values()]
+    ledger_filter = Q(portfolio_id__in=fresh)
+    if continuing:
+        since = min(snapshot.date for snapshot in last_snapshots.values()) + timedelta(days=1)
+        since = timezone.make_aware(datetime.combine(since, time.min))
+        ledger_filter |= Q(portfolio_id__in=continuing, timestamp__gte=since)
+    ledgers = defaultdict(list)
+    for txn in Transaction.objects.filter(ledger_filter).order_by('timestamp', 'id'):
+        ledgers[txn.portfolio_id].append(txn)
+
+    replays = []
+    for portfolio_id, snapshot_id, balance in portfolios:
+        ledger = ledgers[portfolio_id]
+        snapshot = last_snapshots.get(snapshot_id)
+        if snapshot:
+            start = snapshot.date + timedelta(days=1)
+            ledger = [txn for txn in ledger if timezone.localtime(txn.timestamp).date() >= start]
+            replays.append((portfolio_id, start, snapshot.cash_balance, snapshot.positions, ledger))
+        elif ledger:
+            first_day = min(timezone.localtime(ledger[0].timestamp).date(), today)
+            replays.append((portfolio_id, first_day, _opening_cash(balance or Decimal('0'), ledger), {}, ledger))
+
+    # Today's row is valued at live prices, fetched once for the whole batch
+    held_today = set()
+    days = {}
+    for portfolio_id, start, cash, positions, ledger in replays:
+        days[portfolio_id] = [
+            (day, cash, dict(positions), dict(last_prices))
+            for day, cash, positions, last_prices in replay(start, today, cash, positions, ledger)
+        ]
+        held_today.update(days[portfolio_id][-1][2] if days[portfolio_id] else ())
+    live_prices = get_current_stock_prices(sorted(held_today)) if held_today else {}
+
+    rows = []
+    for portfolio_id, portfolio_days in days.items():
+        for day, cash, positions, last_prices in portfolio_days:
+            holdings_value = 0.0
+            for symbol, quantity in positions.items():
+                if day == today and symbol in live_prices:
+                    price = float(live_prices[symbol])
+                else:
+                    price = closes.close(symbol, day)
+                    if price is None:
+                        price = last_prices.get(symbol, 0.0)
+                holdings_value += quantity * price
+            holdings_value = to_money(holdings_value)
+            rows.append(PortfolioSnapshot(
+                portfolio_id=portfolio_id, date=day, cash_balance=cash,
+                holdings_value=holdings_value, net_worth=cash + holdings_value, positions=positions,
+            ))
+
+    PortfolioSnapshot.objects.bulk_create(
+        rows, batch_size=1000, update_conflicts=True, unique_fields=['portfolio', 'date'],
+        update_fields=['cash_balance', 'holdings_value', 'net_worth', 'positions', 'updated_at'],
+    )
+    return len(rows)
+
+
+def get_portfolio_history(portfolio, days=None):
+    """Daily net worth for the dashboard chart, read from snapshots in one query"""
+    days = days or getattr(settings, 'PORTFOLIO_HISTORY_DAYS', 30)
+    since = timezone.localdate() - timedelta(days=days)
+    return [
+        {'date': day.strftime('%Y-%m-%d'), 'value': float(net_worth)}
+        for day, net_worth in portfolio.snapshots.filter(date__gte=since).values_list('date', 'net_worth')
+    ]
@@ -0,0 +1,134 @@
+"""
+Live quote fan-out for the quote_stream Server-Sent Events endpoint.
+
+Each worker process runs at most one QuoteBroadcaster poll loop, however
+many clients are connected. Every STREAM_POLL_INTERVAL seconds it looks up
+the union of the symbols subscribers are watching with one aget_stock_infos
+call (served from the quote cache, or by the quote feed when it is
+enabled), works out which prices changed since the last poll, and hands
+each subscriber only the changes for its own symbols.
+
+Subscribers never queue: changes are merged into a pending dict that the
+client drains when it is ready, so a slow client gets the latest price
+rather than a backlog. The loop stops when the last subscriber leaves.
+"""
+
+import asyncio
+import logging
+import weakref
+from collections import defaultdict
+
+from django.conf import settings
+
+from .async_quotes import aget_stock_infos
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    """One client's view of the stream: a set of symbols and the changes not yet sent"""
+
+    def __init__(self, symbols):
+        self.symbols = frozenset(symbols)
+        self.pending = {}
+        self._ready = asyncio.Event()
+
+    def push(self, changes):
+        self.pending.update(changes)
+        self._ready.set()
+
+    async def next(self, timeout=None):
+        """Wait up to timeout seconds for changes; returns {} if there were none"""
+        if not self._ready.is_set():
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return {}
+        self._ready.clear()
+        changes, self.pending = self.pending, {}
+        return changes
+
+
+class QuoteBroadcaster:
+    """Polls quotes for every watched symbol once per interval and fans out the changes"""
+
+    def __init__(self, interval=2):
+        self.interval = interval
+        self.polls = 0
+        self._subscribers = defaultdict(set)  # symbol -> subscriptions
+        self._last = {}  # symbol -> last quote sent
+        self._task = None
+
+    @property
+    def symbols(self):
+        return sorted(self._subscribers)
+
+    def __len__(self):
+        return len({subscription for subscriptions in self._subscribers.values() for subscription in subscriptions})
+
+    def subscribe(self, symbols):
+        """Start watching symbols; the latest known quotes are queued straight away"""
+        subscription = Subscription(symbols)
+        for symbol in subscription.symbols:
+            self._subscribers[symbol].add(subscription)
+        known = {symbol: self._last[symbol] for symbol in subscription.symbols if symbol in self._last}
+        if known:
+            subscription.push(known)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        for symbol in subscription.symbols:
+            subscribers = self._subscribers.get(symbol)
+            if subscribers is None:
+                continue
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[symbol]
+                self._last.pop(symbol, None)
+
+    async def poll_once(self):
+        """Look up every watched symbol once and push the changed quotes; returns the changes"""
+        symbols = self.symbols
+        if not symbols:
+            return {}
+        self.polls += 1
+        stock_infos = await aget_stock_infos(symbols)
+
+        changes = {}
+        for symbol, stock_info in stock_infos.items():
+            quote = {
+                'price': round(float(stock_info['current_price']), 2),
+                'change_percent': round(float(stock_info['change_percent']), 2),
+            }
+            if self._last.get(symbol) != quote and symbol in self._subscribers:
+                self._last[symbol] = quote
+                changes[symbol] = quote
+
+        for symbol, quote in changes.items():
+            for subscription in self._subscribers.get(symbol, ()):
+                subscription.push({symbol: quote})
+        return changes
+
+    async def _run(self):
+        while self._subscribers:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error(f"Error polling streamed quotes: {e}")
+            await asyncio.sleep(self.interval)
+
+
+# Subscriptions wait on events of the loop serving them, so each event loop
+# gets its own broadcaster. Under uvicorn that is one per worker process.
+_broadcasters = weakref.WeakKeyDictionary()
+
+
+def get_quote_broadcaster():
+    """Return the quote broadcaster for the running event loop"""
+    loop = asyncio.get_running_loop()
+    broadcaster = _broadcasters.get(loop)
+    if broadcaster is None:
+        broadcaster = _broadcasters[loop] = QuoteBroadcaster(getattr(settings, 'STREAM_POLL_INTERVAL', 2))
+    return broadcaster
@@ -1,4 +1,6 @@
 
+from datetime import datetime, timezone as dt_timezone
+
 from django import template
 
 
@@ -27,4 +29,11 @@ def mul(value, arg):
 
 @register.filter
 def split(value, delimiter=','):
-    return value.split(delimiter)
\ No newline at end of file
+    return value.split(delimiter)
+
+@register.filter
+def from_timestamp(value):
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (ValueError, TypeError):
+        return None
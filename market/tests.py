@@ -1,11 +1,50 @@
-from django.test import TestCase, Client
+from django.test import AsyncRequestFactory, TestCase, Client, override_settings
+from django.conf import settings
+from django.db import DatabaseError
 from django.urls import reverse
-from django.contrib.auth.models import User
-from .models import Portfolio, StockHolding, Transaction, Challenge
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages import get_messages
+from .models import (
+    Portfolio, StockHolding, Transaction, Challenge, ChallengeParticipant, StockQuote, LeaderboardEntry,
+    PortfolioSnapshot, Order
+)
 from decimal import Decimal
-from unittest.mock import patch
+from unittest.mock import AsyncMock, Mock, patch
 from django.utils import timezone
-from datetime import timedelta
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from io import StringIO
+from django.core.management import call_command
+import numpy as np
+from . import async_views
+from .async_quotes import AsyncUpstreamClient, aget_stock_infos
+from .challenge_scheduler import close_due_challenges, run_scheduler, start_due_challenges
+from .fake_yahoo import FakeYahooServer
+from .history import BarStore
+from .instruments import Instrument, InstrumentIndex, load_instruments
+from .leaderboard import LeaderboardRefresher
+from .ledger import audit_portfolio, rebuild_and_audit, rebuild_portfolio, stream_transactions
+from .order_queue import claim_batch, drain, requeue_stale, run_executor
+from .orderbook import OrderBook, OrderMatcher
+from .quote_cache import DjangoQuoteCache, MemoryQuoteCache, SQLiteQuoteCache, get_quote_cache, reset_quote_cache
+from .quote_feed import tracked_universe
+from .rankings import challenge_standings
+from .simulation import MarketSimulator
+from .snapshots import DailyCloses, snapshot_portfolios
+from .streaming import QuoteBroadcaster
+from .trading import InsufficientFundsError, InsufficientSharesError, execute_basket, execute_order
+from .upstream import (
+    CircuitBreaker, CircuitOpenError, RateLimitedError, UpstreamClient, UpstreamError,
+    get_upstream_client, reset_upstream_client
+)
+from .utils import fetch_stock_infos, get_fallback_stock_info, get_stock_info, get_stock_infos, record_requested_symbols, search_fallback_stocks, search_stocks
+from .valuation import HoldingsMatrix, to_money, value_portfolio
+from .views import index_fragment_timeout
 
 class MarketViewsTest(TestCase):
     def setUp(self):
@@ -201,3 +240,1511 @@ class ChallengeModelTest(TestCase):
         
         # Status should be PENDING
         self.assertEqual(future_challenge.status, Challenge.PENDING)
+
+class QuoteCacheTest(TestCase):
+    def setUp(self):
+        reset_quote_cache()
+        self.quote = {'symbol': 'RELIANCE.NS', 'name': 'Reliance Industries Ltd', 'current_price': 2500.0}
+    
+    def tearDown(self):
+        reset_quote_cache()
+    
+    def test_memory_cache_evicts_least_recently_used(self):
+        cache = MemoryQuoteCache(ttl=60, max_entries=2)
+        cache.set('A.NS', self.quote)
+        cache.set('B.NS', self.quote)
+        cache.get('A.NS')
+        cache.set('C.NS', self.quote)
+        
+        self.assertIsNotNone(cache.get('A.NS'))
+        self.assertIsNone(cache.get('B.NS'))
+        self.assertIsNotNone(cache.get('C.NS'))
+    
+    def test_per_symbol_ttl(self):
+        cache = MemoryQuoteCache(ttl=60)
+        cache.set('A.NS', self.quote)
+        cache.set('B.NS', self.quote, ttl=-1)
+        
+        self.assertIsNotNone(cache.get('A.NS'))
+        self.assertIsNone(cache.get('B.NS'))
+    
+    def test_sqlite_cache_is_shared_between_instances(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'quotes.sqlite3')
+            SQLiteQuoteCache(path=path, max_entries=1).set_many({'A.NS': self.quote, 'B.NS': self.quote})
+            
+            other = SQLiteQuoteCache(path=path)
+            self.assertEqual(len(other.get_many(['A.NS', 'B.NS'])), 1)
+    
+    def test_meta_values_are_not_evicted_by_quotes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for cache in (MemoryQuoteCache(max_entries=2),
+                          SQLiteQuoteCache(path=os.path.join(tmp, 'quotes.sqlite3'), max_entries=2)):
+                version = cache.quote_version()
+                cache.set_meta('recent_symbols', ['A.NS'])
+                cache.set_many({f"S{i}.NS": self.quote for i in range(5)})
+                
+                self.assertEqual(cache.quote_version(), version)
+                self.assertEqual(cache.get_meta('recent_symbols'), ['A.NS'])
+                self.assertEqual(len(cache.get_many([f"S{i}.NS" for i in range(5)])), 2)
+    
+    def test_django_update_meta_never_writes_without_the_lock(self):
+        cache = DjangoQuoteCache()
+        cache.lock_wait = 0.05
+        cache.set_meta('recent_symbols', ['A.NS'])
+        # Another worker is mid-update
+        cache._cache.add(f"{cache.meta_prefix}recent_symbols:lock", 1)
+        self.addCleanup(cache.clear)
+        
+        with self.assertRaises(TimeoutError):
+            cache.update_meta('recent_symbols', lambda recent: recent + ['B.NS'])
+        self.assertEqual(cache.get_meta('recent_symbols'), ['A.NS'])
+        
+        cache._cache.delete(f"{cache.meta_prefix}recent_symbols:lock")
+        self.assertEqual(cache.update_meta('recent_symbols', lambda recent: recent + ['B.NS']), ['A.NS', 'B.NS'])
+    
+    def test_sqlite_update_meta_merges_across_workers(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'quotes.sqlite3')
+            SQLiteQuoteCache(path=path)
+            
+            def record(worker):
+                cache = SQLiteQuoteCache(path=path)
+                for i in range(20):
+                    cache.update_meta('recent_symbols', lambda recent: recent + [f"{worker}-{i}"], default=[])
+            
+            threads = [threading.Thread(target=record, args=(worker,)) for worker in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            
+            self.assertEqual(len(SQLiteQuoteCache(path=path).get_meta('recent_symbols')), 80)
+    
+    @patch('market.utils.fetch_stock_infos')
+    def test_get_stock_info_fetches_once(self, mock_fetch):
+        mock_fetch.return_value = {'RELIANCE.NS': self.quote}
+        
+        for _ in range(3):
+            self.assertEqual(get_stock_info('RELIANCE')['current_price'], 2500.0)
+        
+        mock_fetch.assert_called_once_with(['RELIANCE.NS'])
+
+class BatchQuoteTest(TestCase):
+    def setUp(self):
+        reset_quote_cache()
+    
+    def tearDown(self):
+        reset_quote_cache()
+    
+    @override_settings(QUOTE_BATCH_SIZE=2)
+    @patch('market.utils.get_upstream_client')
+    def test_get_stock_infos_chunks_requests(self, mock_client):
+        def quote_response(url):
+            symbols = url.split('symbols=')[1].split(',')
+            return {'quoteResponse': {'result': [
+                {'symbol': symbol, 'regularMarketPrice': 100.0} for symbol in symbols
+            ]}}
+        mock_client.return_value.get_json.side_effect = quote_response
+        
+        infos = get_stock_infos(['RELIANCE', 'TCS.NS', 'INFY.NS'])
+        
+        self.assertEqual(mock_client.return_value.get_json.call_count, 2)
+        self.assertEqual(list(infos), ['RELIANCE', 'TCS.NS', 'INFY.NS'])
+        self.assertEqual(infos['RELIANCE']['symbol'], 'RELIANCE.NS')
+        self.assertEqual(infos['INFY.NS']['current_price'], 100.0)
+    
+    @patch('market.utils.fetch_stock_infos')
+    def test_missing_symbols_get_fallback_data(self, mock_fetch):
+        mock_fetch.return_value = {}
+        
+        infos = get_stock_infos(['TCS.NS'])
+        
+        self.assertEqual(infos['TCS.NS']['symbol'], 'TCS.NS')
+        self.assertGreater(infos['TCS.NS']['current_price'], 0)
+
+class UpstreamClientTest(TestCase):
+    def setUp(self):
+        self.upstream = UpstreamClient(max_retries=2, backoff_base=0, failure_threshold=2, cooldown=60)
+    
+    def response(self, status_code, data=None):
+        response = Mock(status_code=status_code)
+        response.json.return_value = data
+        return response
+    
+    def test_retries_server_errors(self):
+        with patch.object(self.upstream.session, 'get') as mock_get:
+            mock_get.side_effect = [self.response(503), self.response(200, {'ok': True})]
+            
+            self.assertEqual(self.upstream.get_json('http://upstream/quote'), {'ok': True})
+        
+        self.assertEqual(self.upstream.stats.snapshot()['retries'], 1)
+        self.assertEqual(self.upstream.breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_rate_limit_trips_breaker_until_cooldown(self):
+        with patch.object(self.upstream.session, 'get') as mock_get:
+            mock_get.return_value = self.response(429)
+            with self.assertRaises(RateLimitedError):
+                self.upstream.get_json('http://upstream/quote')
+            with self.assertRaises(CircuitOpenError):
+                self.upstream.get_json('http://upstream/quote')
+            self.assertEqual(mock_get.call_count, 1)
+        
+        stats = self.upstream.stats.snapshot()
+        self.assertEqual(stats['trips'], 1)
+        self.assertEqual(stats['rejected'], 1)
+    
+    def test_half_open_probe_closes_breaker(self):
+        self.upstream.breaker.cooldown = 0
+        self.upstream.breaker.trip()
+        self.assertEqual(self.upstream.breaker.state, CircuitBreaker.HALF_OPEN)
+        
+        with patch.object(self.upstream.session, 'get') as mock_get:
+            mock_get.return_value = self.response(200, {'ok': True})
+            self.upstream.get_json('http://upstream/quote')
+        
+        self.assertEqual(self.upstream.breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_unexpected_error_releases_half_open_probe(self):
+        self.upstream.breaker.cooldown = 0
+        self.upstream.breaker.trip()
+        
+        with patch.object(self.upstream.session, 'get') as mock_get:
+            mock_get.side_effect = ValueError("Invalid URL")
+            with self.assertRaises(ValueError):
+                self.upstream.get_json('not a url')
+            
+            mock_get.side_effect = None
+            mock_get.return_value = self.response(200, {'ok': True})
+            self.assertEqual(self.upstream.get_json('http://upstream/quote'), {'ok': True})
+        
+        self.assertEqual(self.upstream.breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_only_the_probe_releases_the_probe(self):
+        breaker = self.upstream.breaker
+        breaker.cooldown = 0
+        
+        def trip_and_probe(url, timeout):
+            # Another caller trips the breaker and takes the probe while this call is in flight
+            breaker.trip()
+            self.assertEqual(breaker.acquire(), (True, True))
+            raise ValueError("Invalid URL")
+        
+        with patch.object(self.upstream.session, 'get', side_effect=trip_and_probe):
+            with self.assertRaises(ValueError):
+                self.upstream.get_json('http://upstream/quote')
+        
+        self.assertEqual(breaker.acquire(), (False, False))
+
+class SearchEnrichmentTest(TestCase):
+    def setUp(self):
+        reset_quote_cache()
+    
+    def tearDown(self):
+        reset_quote_cache()
+    
+    @override_settings(SEARCH_QUOTE_DEADLINE=0.05)
+    @patch('market.utils.get_upstream_client')
+    def test_slow_quotes_are_returned_without_prices(self, mock_client):
+        def upstream(url):
+            if '/search' in url:
+                return {'quotes': [{'symbol': 'TCS.NS', 'longname': 'Tata Consultancy Services Ltd'}]}
+            time.sleep(0.5)
+            return {'quoteResponse': {'result': [{'symbol': 'TCS.NS', 'regularMarketPrice': 3500.0}]}}
+        mock_client.return_value.get_json.side_effect = upstream
+        
+        started = time.monotonic()
+        results = search_stocks('tcs')
+        
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(results[0]['symbol'], 'TCS.NS')
+        self.assertNotIn('current_price', results[0])
+
+class QuoteFeedTest(TestCase):
+    def setUp(self):
+        reset_quote_cache()
+        user = User.objects.create_user(username='holder', password='testpassword123')
+        self.portfolio = Portfolio.objects.create(user=user)
+        StockHolding.objects.create(
+            portfolio=self.portfolio, stock_symbol='WIPRO.NS', stock_name='Wipro Ltd',
+            quantity=5, average_buy_price=Decimal('400.00')
+        )
+    
+    def tearDown(self):
+        reset_quote_cache()
+    
+    def test_universe_puts_held_then_searched_symbols_first(self):
+        record_requested_symbols(['ZOMATO.NS'])
+        
+        universe = tracked_universe()
+        
+        self.assertEqual(universe[:2], ['WIPRO.NS', 'ZOMATO.NS'])
+        self.assertIn('RELIANCE.NS', universe)
+    
+    @patch('market.quote_feed.fetch_stock_infos')
+    def test_feed_cycle_fills_cache(self, mock_fetch):
+        mock_fetch.side_effect = lambda symbols: {
+            symbol: {'symbol': symbol, 'current_price': 100.0, 'fetched_at': time.time()}
+            for symbol in symbols
+        }
+        
+        call_command('run_quote_feed', '--once', stderr=StringIO(), stdout=StringIO())
+        
+        self.assertEqual(get_quote_cache().get('WIPRO.NS')['current_price'], 100.0)
+    
+    @override_settings(QUOTE_FEED_ENABLED=True)
+    @patch('market.utils.fetch_stock_infos')
+    def test_feed_mode_never_calls_upstream(self, mock_fetch):
+        info = get_stock_info('INFY.NS')
+        
+        mock_fetch.assert_not_called()
+        self.assertEqual(info['symbol'], 'INFY.NS')
+        self.assertIn('INFY.NS', tracked_universe())
+
+class StockQuoteTest(TestCase):
+    def setUp(self):
+        reset_quote_cache()
+    
+    def tearDown(self):
+        reset_quote_cache()
+    
+    def stock_info(self, symbol, change_percent, price=100.0):
+        return {
+            'symbol': symbol, 'name': symbol, 'current_price': price,
+            'change_percent': change_percent, 'volume': 1000, 'fetched_at': time.time()
+        }
+    
+    def test_bulk_upsert_inserts_and_updates_in_one_query(self):
+        StockQuote.objects.bulk_upsert([self.stock_info('A.NS', 1.0), self.stock_info('B.NS', -2.0)])
+        
+        with self.assertNumQueries(1):
+            StockQuote.objects.bulk_upsert([self.stock_info('A.NS', 3.0, price=110.5), self.stock_info('C.NS', 0.5)])
+        
+        self.assertEqual(StockQuote.objects.count(), 3)
+        self.assertEqual(StockQuote.objects.get(symbol='A.NS').current_price, Decimal('110.50'))
+        self.assertEqual(StockQuote.objects.gainers().first().symbol, 'A.NS')
+        self.assertEqual(StockQuote.objects.losers().first().symbol, 'B.NS')
+    
+    @patch('market.utils.fetch_stock_infos')
+    def test_fresh_snapshots_are_served_after_restart(self, mock_fetch):
+        StockQuote.objects.bulk_upsert([self.stock_info('TCS.NS', 1.5, price=3500.0)])
+        
+        self.assertEqual(get_stock_info('TCS.NS')['current_price'], 3500.0)
+        mock_fetch.assert_not_called()
+
+class MarketSimulatorTest(TestCase):
+    def test_quotes_are_deterministic_and_order_independent(self):
+        at = 20000 * 86400 + 4 * 3600
+        first = MarketSimulator(seed=7).quotes(['TCS.NS', 'INFY.NS'], at=at)
+        second = MarketSimulator(seed=7, symbols=['INFY.NS', 'WIPRO.NS']).quotes(['TCS.NS', 'INFY.NS'], at=at)
+        
+        self.assertEqual(first, second)
+        self.assertNotEqual(MarketSimulator(seed=8).quotes(['TCS.NS'], at=at)['TCS.NS'], first['TCS.NS'])
+    
+    def test_intraday_bars_are_consistent(self):
+        simulator = MarketSimulator(seed=7)
+        day_start = 20000 * 86400
+        morning = simulator.quotes(['TCS.NS'], at=day_start + 3600)['TCS.NS']
+        evening = simulator.quotes(['TCS.NS'], at=day_start + 20 * 3600)['TCS.NS']
+        
+        self.assertEqual(morning['open'], evening['open'])
+        self.assertEqual(morning['previous_close'], evening['previous_close'])
+        self.assertGreaterEqual(evening['day_high'], max(morning['day_high'], evening['current_price']))
+        self.assertLessEqual(evening['day_low'], min(morning['day_low'], evening['current_price']))
+        self.assertGreaterEqual(evening['volume'], morning['volume'])
+    
+    def test_sessions_open_at_the_previous_close(self):
+        simulator = MarketSimulator(seed=7)
+        symbols = ['TCS.NS', 'INFY.NS', 'RELIANCE.NS']
+        for day in range(20000, 20005):
+            quotes = simulator.quotes(symbols, at=(day + 1) * 86400)
+            for quote in quotes.values():
+                # At most one tick's move overnight, not an independent daily draw
+                self.assertLess(abs(quote['open'] / quote['previous_close'] - 1), 0.005)
+    
+    def test_fallback_does_not_reseed_global_random(self):
+        random.seed(123)
+        expected = random.random()
+        random.seed(123)
+        get_fallback_stock_info('RELIANCE.NS')
+        
+        self.assertEqual(random.random(), expected)
+
+class BarStoreTest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = BarStore(self.tmp.name)
+    
+    def tearDown(self):
+        self.tmp.cleanup()
+    
+    def bars(self, timestamps):
+        return {
+            'timestamp': timestamps,
+            'open': [100.0] * len(timestamps),
+            'high': [110.0] * len(timestamps),
+            'low': [90.0] * len(timestamps),
+            'close': [float(t) for t in timestamps],
+            'volume': [1000] * len(timestamps),
+        }
+    
+    def test_append_skips_existing_bars_and_range_query_slices(self):
+        self.assertEqual(self.store.append('TCS.NS', '1d', self.bars([1, 2, 3])), 3)
+        self.assertEqual(self.store.append('TCS.NS', '1d', self.bars([3, 4, 5])), 2)
+        
+        bars = self.store.read('TCS.NS', '1d', start=2, end=4)
+        
+        self.assertIsInstance(bars['close'], np.memmap)
+        self.assertEqual(bars['timestamp'].tolist(), [2, 3, 4])
+        self.assertEqual(bars['close'].tolist(), [2.0, 3.0, 4.0])
+        self.assertEqual(self.store.read('INFY.NS', '1d')['close'].tolist(), [])
+    
+    def test_append_after_a_crashed_append_stays_aligned(self):
+        self.store.append('TCS.NS', '1d', self.bars([1, 2]))
+        # A crash after the price columns but before the timestamps
+        for column in ('open', 'high', 'low', 'close', 'volume'):
+            with open(os.path.join(self.tmp.name, '1d', 'TCS.NS', f'{column}.bin'), 'ab') as f:
+                f.write(np.zeros(1, dtype='<f8').tobytes())
+        
+        self.store.append('TCS.NS', '1d', self.bars([3]))
+        
+        bars = self.store.read('TCS.NS', '1d')
+        self.assertEqual(bars['timestamp'].tolist(), [1, 2, 3])
+        self.assertEqual(bars['close'].tolist(), [1.0, 2.0, 3.0])
+        self.assertEqual(os.path.getsize(os.path.join(self.tmp.name, '1d', 'TCS.NS', 'close.bin')), 3 * 8)
+    
+    def test_rejects_path_like_symbols(self):
+        with self.assertRaises(ValueError):
+            self.store.read('../secrets', '1d')
+    
+    def test_history_api(self):
+        self.store.append('TCS.NS', '1d', self.bars([86400, 172800]))
+        User.objects.create_user(username='charts', password='testpassword123')
+        self.client.login(username='charts', password='testpassword123')
+        
+        with patch('market.views.get_bar_store', return_value=self.store):
+            response = self.client.get(reverse('market:stock_history_api', args=['TCS']), {'start': 100000})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['bars']['timestamp'], [172800])
+
+class FakeYahooTest(TestCase):
+    def setUp(self):
+        self.server = FakeYahooServer()
+        self.settings_override = override_settings(
+            YAHOO_FINANCE_BASE_URL=self.server.start(),
+            UPSTREAM_BACKOFF_BASE=0,
+        )
+        self.settings_override.enable()
+        reset_quote_cache()
+        reset_upstream_client()
+    
+    def tearDown(self):
+        self.server.stop()
+        self.settings_override.disable()
+        reset_quote_cache()
+        reset_upstream_client()
+    
+    def test_quotes_and_search_over_http(self):
+        infos = fetch_stock_infos(['TCS.NS', 'INFY.NS'])
+        results = search_stocks('infosys')
+        
+        self.assertEqual(set(infos), {'TCS.NS', 'INFY.NS'})
+        self.assertEqual(infos['TCS.NS']['name'], 'Tata Consultancy Services Ltd')
+        self.assertEqual(results[0]['symbol'], 'INFY.NS')
+        self.assertIn('current_price', results[0])
+    
+    def test_rate_limiting_trips_circuit_breaker(self):
+        self.server.rate_limit_rate = 1.0
+        
+        self.assertEqual(fetch_stock_infos(['TCS.NS']), {})
+        self.assertEqual(fetch_stock_infos(['TCS.NS']), {})
+        
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(get_upstream_client().stats.snapshot()['trips'], 1)
+
+class InstrumentIndexTest(TestCase):
+    def setUp(self):
+        self.index = InstrumentIndex([
+            Instrument('TCS.NS', 'Tata Consultancy Services Ltd', 'EQ'),
+            Instrument('TATAMOTORS.NS', 'Tata Motors Ltd', 'EQ'),
+            Instrument('TATACONSUM.NS', 'Tata Consumer Products Ltd', 'EQ'),
+            Instrument('EICHERMOT.NS', 'Eicher Motors Ltd', 'EQ'),
+            Instrument('INDUSINDBK.NS', 'IndusInd Bank Ltd', 'EQ'),
+            Instrument('HINDALCO.NS', 'Hindalco Industries Ltd', 'EQ'),
+        ])
+    
+    def test_ranking_tiers(self):
+        def symbols(query):
+            return [instrument.symbol for instrument in self.index.search(query)]
+        
+        self.assertEqual(symbols('tcs.ns'), ['TCS.NS'])
+        self.assertEqual(symbols('tata'), ['TATACONSUM.NS', 'TATAMOTORS.NS', 'TCS.NS'])
+        self.assertEqual(symbols('tata con'), ['TCS.NS', 'TATACONSUM.NS'])
+        self.assertEqual(symbols('motors'), ['EICHERMOT.NS', 'TATAMOTORS.NS'])
+        self.assertEqual(symbols('ndus'), ['HINDALCO.NS', 'INDUSINDBK.NS'])
+        self.assertEqual(symbols('t'), ['TCS.NS', 'TATACONSUM.NS', 'TATAMOTORS.NS'])
+        self.assertEqual(self.index.search('tata', limit=1)[0].symbol, 'TATACONSUM.NS')
+        self.assertEqual(symbols('zzz'), [])
+    
+    def test_load_nse_equity_list(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write("SYMBOL,NAME OF COMPANY, SERIES, ISIN NUMBER\n"
+                    "20MICRONS,20 Microns Limited,EQ,INE144J01027\n"
+                    "M&M,Mahindra & Mahindra Limited,EQ,INE101A01026\n")
+        self.addCleanup(os.remove, f.name)
+        
+        instruments = load_instruments(f.name)
+        
+        self.assertEqual(instruments[1], Instrument('M&M.NS', 'Mahindra & Mahindra Limited', 'EQ'))
+        self.assertEqual(InstrumentIndex(instruments).search('m&m')[0].symbol, 'M&M.NS')
+    
+    @patch('market.utils.get_market_simulator')
+    def test_fallback_search_prices_only_matches(self, mock_simulator):
+        mock_simulator.return_value.quotes.side_effect = lambda symbols: {
+            symbol: {'symbol': symbol, 'current_price': 100.0} for symbol in symbols
+        }
+        
+        results = search_fallback_stocks('hdfc')
+        
+        mock_simulator.return_value.quotes.assert_called_once_with(
+            ['HDFC.NS', 'HDFCAMC.NS', 'HDFCBANK.NS', 'HDFCLIFE.NS']
+        )
+        self.assertEqual(results[2]['name'], 'HDFC Bank Ltd')
+
+class ValuationTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='valuer', password='testpassword123')
+        self.portfolio = Portfolio.objects.create(user=self.user)
+        StockHolding.objects.create(portfolio=self.portfolio, stock_symbol='TCS.NS', stock_name='TCS',
+                                    quantity=2, average_buy_price=Decimal('3000.00'))
+        StockHolding.objects.create(portfolio=self.portfolio, stock_symbol='INFY.NS', stock_name='Infosys',
+                                    quantity=10, average_buy_price=Decimal('1500.00'))
+    
+    @patch('market.valuation.get_current_stock_prices')
+    def test_portfolio_priced_in_one_pass(self, mock_prices):
+        mock_prices.return_value = {'TCS.NS': Decimal('3300.00'), 'INFY.NS': Decimal('1400.00')}
+        
+        with self.assertNumQueries(1):
+            valuation = value_portfolio(self.portfolio, cash_balance=Decimal('500.00'))
+        
+        mock_prices.assert_called_once_with(['INFY.NS', 'TCS.NS'])
+        self.assertEqual(valuation.total_value, Decimal('20600.00'))
+        self.assertEqual(valuation.total_profit, Decimal('-400.00'))
+        self.assertEqual(valuation.net_worth, Decimal('21100.00'))
+        self.assertEqual(valuation.get('TCS.NS').profit_loss_percentage, Decimal('10'))
+        self.assertEqual(valuation.get('INFY.NS').profit_loss, Decimal('-1000.00'))
+        with self.assertRaises(AttributeError):
+            valuation.net_worth = Decimal('0')
+    
+    @patch('market.valuation.get_current_stock_prices')
+    def test_dashboard_uses_single_price_lookup(self, mock_prices):
+        mock_prices.return_value = {'TCS.NS': Decimal('3300.00'), 'INFY.NS': Decimal('1400.00')}
+        self.client.login(username='valuer', password='testpassword123')
+        
+        response = self.client.get(reverse('market:dashboard'))
+        
+        self.assertEqual(response.status_code, 200)
+        mock_prices.assert_called_once()
+        self.assertEqual(response.context['valuation'].total_value, Decimal('20600.00'))
+        self.assertContains(response, '₹20600.00')
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        self.prices = {'TCS.NS': Decimal('3000.00')}
+        patcher = patch('market.leaderboard.get_current_stock_prices',
+                        side_effect=lambda symbols: {symbol: self.prices[symbol] for symbol in symbols})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        self.users = []
+        for i in range(3):
+            user = User.objects.create_user(username=f'investor{i}', password='testpassword123')
+            user.profile.balance = Decimal('1000.00') * (i + 1)
+            user.profile.save()
+            Portfolio.objects.create(user=user)
+            self.users.append(user)
+        StockHolding.objects.create(portfolio=self.users[0].portfolio, stock_symbol='TCS.NS', stock_name='TCS',
+                                    quantity=1, average_buy_price=Decimal('2000.00'))
+        self.refresher = LeaderboardRefresher()
+    
+    def ranking(self):
+        return list(LeaderboardEntry.objects.values_list('username', 'net_worth'))
+    
+    def test_refresh_recomputes_only_dirty_portfolios(self):
+        self.assertEqual(self.refresher.refresh(), 3)
+        self.assertEqual(self.ranking(), [
+            ('investor0', Decimal('4000.00')), ('investor2', Decimal('3000.00')), ('investor1', Decimal('2000.00'))
+        ])
+        self.assertEqual(self.refresher.refresh(), 0)
+        
+        # A balance change only touches that user
+        profile = self.users[1].profile
+        profile.balance = Decimal('5000.00')
+        profile.save()
+        self.assertEqual(self.refresher.refresh(), 1)
+        self.assertEqual(self.ranking()[0], ('investor1', Decimal('5000.00')))
+        
+        # A price tick only touches holders of the symbol
+        self.prices['TCS.NS'] = Decimal('4500.00')
+        self.assertEqual(self.refresher.refresh(), 1)
+        self.assertEqual(self.ranking()[0], ('investor0', Decimal('5500.00')))
+        self.assertEqual(list(LeaderboardEntry.objects.values_list('rank', flat=True)), [1, 2, 3])
+    
+    @override_settings(LEADERBOARD_PAGE_SIZE=2)
+    def test_view_pages_by_rank(self):
+        self.client.login(username='investor1', password='testpassword123')
+        
+        first = self.client.get(reverse('market:leaderboard'))
+        second = self.client.get(reverse('market:leaderboard'), {'page': 2})
+        
+        self.assertEqual([entry.username for entry in first.context['users']], ['investor0', 'investor2'])
+        self.assertEqual([entry.username for entry in second.context['users']], ['investor1'])
+        self.assertEqual(second.context['num_pages'], 2)
+        self.assertEqual(first.context['user_rank'], 3)
+        self.assertContains(first, '?page=2')
+
+class BulkValuationTest(TestCase):
+    def setUp(self):
+        self.portfolios = []
+        for i, holdings in enumerate([
+            [('TCS.NS', 2, '3000.00'), ('INFY.NS', 10, '1500.00')],
+            [('INFY.NS', 5, '1600.00')],
+            [],
+        ]):
+            user = User.objects.create_user(username=f'bulk{i}', password='testpassword123')
+            user.profile.balance = Decimal('1000.50')
+            user.profile.save()
+            portfolio = Portfolio.objects.create(user=user)
+            for symbol, quantity, price in holdings:
+                StockHolding.objects.create(portfolio=portfolio, stock_symbol=symbol, stock_name=symbol,
+                                            quantity=quantity, average_buy_price=Decimal(price))
+            self.portfolios.append(portfolio)
+        self.prices = {'TCS.NS': Decimal('3300.00'), 'INFY.NS': Decimal('1400.00')}
+    
+    @patch('market.valuation.get_current_stock_prices')
+    def test_matches_single_portfolio_valuation(self, mock_prices):
+        mock_prices.return_value = self.prices
+        
+        with self.assertNumQueries(2):
+            matrix = HoldingsMatrix.load()
+        valuation = matrix.value(self.prices)
+        
+        self.assertEqual(len(valuation), 3)
+        for i, portfolio in enumerate(self.portfolios):
+            expected = value_portfolio(portfolio)
+            self.assertEqual(valuation.portfolio_ids[i], portfolio.id)
+            self.assertEqual(to_money(valuation.net_worth[i]), expected.net_worth)
+            self.assertEqual(to_money(valuation.profit[i]), expected.total_profit)
+        self.assertAlmostEqual(valuation.profit_percentage[1], -12.5)
+        self.assertEqual(valuation.profit_percentage[2], 0)
+    
+    def test_load_subset(self):
+        matrix = HoldingsMatrix.load([self.portfolios[1].id])
+        
+        self.assertEqual(matrix.usernames, ['bulk1'])
+        self.assertEqual(matrix.symbols, ['INFY.NS'])
+        self.assertEqual(matrix.value(np.array([1000.0])).net_worth.tolist(), [6000.5])
+
+class ChallengeRankingTest(TestCase):
+    def setUp(self):
+        reset_quote_cache()
+        self.addCleanup(reset_quote_cache)
+        self.users = [User.objects.create_user(username=f'racer{i}', password='testpassword123') for i in range(4)]
+        for user, balance in zip(self.users, ['1000.00', '3000.00', '3000.00', '500.00']):
+            user.profile.balance = Decimal(balance)
+            user.profile.save()
+            Portfolio.objects.create(user=user)
+        StockHolding.objects.create(portfolio=self.users[3].portfolio, stock_symbol='TCS.NS', stock_name='TCS',
+                                    quantity=1, average_buy_price=Decimal('3000.00'))
+    
+    def make_challenge(self, days_ago):
+        now = timezone.now()
+        challenge = Challenge.objects.create(
+            name='Race', creator=self.users[0],
+            start_date=now - timedelta(days=days_ago), end_date=now - timedelta(days=days_ago) + timedelta(days=7)
+        )
+        for user in self.users:
+            ChallengeParticipant.objects.create(user=user, challenge=challenge)
+        return challenge
+    
+    def test_completed_challenge_ranked_in_one_query(self):
+        challenge = self.make_challenge(days_ago=30)
+        for user, value in zip(self.users, ['120000.00', '90000.00', '120000.00', '80000.00']):
+            ChallengeParticipant.objects.filter(user=user).update(final_portfolio_value=Decimal(value))
+        
+        with self.assertNumQueries(1):
+            standings = challenge_standings(challenge)
+        
+        self.assertEqual([(s.rank, s.username) for s in standings],
+                         [(1, 'racer0'), (1, 'racer2'), (3, 'racer1'), (4, 'racer3')])
+    
+    @patch('market.rankings.get_current_stock_prices', return_value={'TCS.NS': Decimal('4000.00')})
+    def test_active_standings_valued_in_bulk_and_cached(self, mock_prices):
+        challenge = self.make_challenge(days_ago=1)
+        
+        standings = challenge_standings(challenge)
+        with self.assertNumQueries(0):
+            cached = challenge_standings(challenge)
+        
+        mock_prices.assert_called_once_with(['TCS.NS'])
+        self.assertIs(cached, standings)
+        self.assertEqual([(s.rank, s.username, s.portfolio_value) for s in standings], [
+            (1, 'racer3', Decimal('4500.00')), (2, 'racer1', Decimal('3000.00')),
+            (2, 'racer2', Decimal('3000.00')), (4, 'racer0', Decimal('1000.00')),
+        ])
+        self.assertEqual(ChallengeParticipant.objects.get(user=self.users[0]).current_rank, 4)
+    
+    @patch('market.rankings.get_current_stock_prices', return_value={'TCS.NS': Decimal('4000.00')})
+    def test_joining_refreshes_standings(self, mock_prices):
+        challenge = self.make_challenge(days_ago=1)
+        newcomer = User.objects.create_user(username='newcomer', password='testpassword123')
+        Portfolio.objects.create(user=newcomer)
+        self.assertIsNone(challenge_standings(challenge).get(newcomer.id))
+        
+        self.client.login(username='newcomer', password='testpassword123')
+        self.client.post(reverse('market:challenge_detail', args=[challenge.id]), {'join': '1'})
+        response = self.client.get(reverse('market:challenge_detail', args=[challenge.id]))
+        
+        self.assertEqual(response.context['user_rank'], 1)
+        self.assertEqual(len(response.context['participants']), 5)
+    
+    @patch('market.rankings.get_current_stock_prices', return_value={'TCS.NS': Decimal('4000.00')})
+    def test_count_includes_participants_without_a_portfolio(self, mock_prices):
+        challenge = self.make_challenge(days_ago=1)
+        # Joined but never traded, so there is no portfolio to value
+        idle = User.objects.create_user(username='idle', password='testpassword123')
+        ChallengeParticipant.objects.create(user=idle, challenge=challenge)
+        
+        self.client.login(username='idle', password='testpassword123')
+        response = self.client.get(reverse('market:challenge_detail', args=[challenge.id]))
+        
+        self.assertEqual(len(response.context['participants']), 4)
+        self.assertEqual(response.context['participant_count'], 5)
+
+class ChallengeSchedulerTest(TestCase):
+    def setUp(self):
+        reset_quote_cache()
+        self.addCleanup(reset_quote_cache)
+        self.creator = User.objects.create_user(username='organiser', password='testpassword123')
+        Portfolio.objects.create(user=self.creator)
+        StockHolding.objects.create(portfolio=self.creator.portfolio, stock_symbol='TCS.NS', stock_name='TCS',
+                                    quantity=2, average_buy_price=Decimal('3000.00'))
+        self.loner = User.objects.create_user(username='loner', password='testpassword123')
+    
+    def make_challenge(self, start, end):
+        challenge = Challenge.objects.create(name='Sprint', creator=self.creator, start_date=start, end_date=end)
+        ChallengeParticipant.objects.create(user=self.creator, challenge=challenge)
+        ChallengeParticipant.objects.create(user=self.loner, challenge=challenge)
+        return challenge
+    
+    @patch('market.challenge_scheduler.get_current_stock_prices', return_value={'TCS.NS': Decimal('3500.00')})
+    def test_transitions_and_freezes_final_values(self, mock_prices):
+        now = timezone.now()
+        upcoming = self.make_challenge(now + timedelta(hours=1), now + timedelta(days=1))
+        ending = self.make_challenge(now - timedelta(days=1), now + timedelta(hours=1))
+        
+        self.assertEqual(start_due_challenges(now + timedelta(hours=2)), 1)
+        self.assertEqual(close_due_challenges(now + timedelta(hours=2)), 1)
+        
+        upcoming.refresh_from_db()
+        ending.refresh_from_db()
+        self.assertEqual(upcoming.status, Challenge.ACTIVE)
+        self.assertEqual(ending.status, Challenge.COMPLETED)
+        mock_prices.assert_called_once_with(['TCS.NS'])
+        self.assertEqual(dict(ending.participants.values_list('user__username', 'final_portfolio_value')), {
+            'organiser': Decimal('107000.00'), 'loner': Decimal('100000.00'),
+        })
+        self.assertEqual(upcoming.participants.filter(final_portfolio_value__isnull=False).count(), 0)
+        
+        with self.assertNumQueries(1):
+            standings = challenge_standings(ending)
+        self.assertEqual(standings.top(1)[0].username, 'organiser')
+    
+    def test_command_runs_once(self):
+        out = StringIO()
+        call_command('run_challenge_scheduler', '--once', stdout=out)
+        self.assertIn('Started 0 and closed 0 challenges', out.getvalue())
+    
+    @patch('market.challenge_scheduler.get_current_stock_prices', return_value={'TCS.NS': Decimal('3500.00')})
+    def test_closes_challenges_saved_after_their_end(self, mock_prices):
+        now = timezone.now()
+        ended = self.make_challenge(now - timedelta(days=2), now - timedelta(days=1))
+        self.assertEqual(ended.status, Challenge.COMPLETED)
+        
+        self.assertEqual(close_due_challenges(now), 1)
+        self.assertEqual(ended.participants.filter(final_portfolio_value__isnull=True).count(), 0)
+        self.assertEqual(close_due_challenges(now), 0)
+        
+        with patch('market.rankings.live_standings') as live:
+            challenge_standings(ended)
+        live.assert_not_called()
+    
+    @patch('market.challenge_scheduler.get_current_stock_prices', return_value={'TCS.NS': Decimal('1.00')})
+    def test_late_participants_do_not_refreeze_others(self, mock_prices):
+        now = timezone.now()
+        ended = self.make_challenge(now - timedelta(days=2), now - timedelta(days=1))
+        ended.participants.update(final_portfolio_value=Decimal('100000.00'))
+        latecomer = User.objects.create_user(username='latecomer', password='testpassword123')
+        ChallengeParticipant.objects.create(user=latecomer, challenge=ended)
+        
+        self.assertEqual(close_due_challenges(now), 1)
+        
+        self.assertEqual(dict(ended.participants.values_list('user__username', 'final_portfolio_value')), {
+            'organiser': Decimal('100000.00'), 'loner': Decimal('100000.00'), 'latecomer': Decimal('100000.00'),
+        })
+        mock_prices.assert_not_called()
+    
+    def test_completed_challenges_reject_joins(self):
+        now = timezone.now()
+        ended = self.make_challenge(now - timedelta(days=2), now - timedelta(days=1))
+        User.objects.create_user(username='latecomer', password='testpassword123')
+        self.client.login(username='latecomer', password='testpassword123')
+        
+        response = self.client.post(reverse('market:challenge_detail', args=[ended.id]), {'join': '1'})
+        
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(ended.participants.filter(user__username='latecomer').exists())
+    
+    def test_scheduler_survives_a_failed_pass(self):
+        with patch('market.challenge_scheduler.close_due_challenges', side_effect=DatabaseError('locked')):
+            with self.assertLogs('market.challenge_scheduler', 'ERROR'):
+                self.assertEqual(run_scheduler(60, once=True), (0, 0))
+
+class PortfolioSnapshotTest(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.store = BarStore(tmpdir.name)
+        self.store.append('TCS.NS', '1d', {
+            'timestamp': [int(datetime(2024, 1, day, tzinfo=dt_timezone.utc).timestamp()) for day in (8, 9, 10)],
+            'open': [100, 110, 125], 'high': [110, 125, 128], 'low': [100, 110, 125],
+            'close': [110, 125, 128], 'volume': [1000, 1000, 1000],
+        })
+        
+        self.user = User.objects.create_user(username='historian', password='testpassword123')
+        self.user.profile.balance = Decimal('99600.00')
+        self.user.profile.save()
+        self.portfolio = Portfolio.objects.create(user=self.user)
+        for day, kind, quantity, price in [(8, Transaction.BUY, 10, '100.00'), (9, Transaction.SELL, 5, '120.00')]:
+            txn = Transaction.objects.create(portfolio=self.portfolio, stock_symbol='TCS.NS', stock_name='TCS',
+                                             transaction_type=kind, quantity=quantity, price=Decimal(price))
+            Transaction.objects.filter(id=txn.id).update(
+                timestamp=timezone.make_aware(datetime(2024, 1, day, 12, 0))
+            )
+    
+    def net_worths(self):
+        return list(self.portfolio.snapshots.values_list('date', 'net_worth'))
+    
+    @patch('market.snapshots.get_current_stock_prices', return_value={'TCS.NS': Decimal('130.00')})
+    def test_replays_ledger_incrementally(self, mock_prices):
+        closes = DailyCloses(self.store)
+        
+        written = snapshot_portfolios(today=date(2024, 1, 10), closes=closes)
+        
+        self.assertEqual(written, 3)
+        self.assertEqual(self.net_worths(), [
+            (date(2024, 1, 8), Decimal('100100.00')),
+            (date(2024, 1, 9), Decimal('100225.00')),
+            (date(2024, 1, 10), Decimal('100250.00')),
+        ])
+        self.assertEqual(self.portfolio.snapshots.last().positions, {'TCS.NS': 5})
+        
+        # The next day only yesterday (now at its close) and today are computed
+        written = snapshot_portfolios(today=date(2024, 1, 11), closes=closes)
+        
+        self.assertEqual(written, 2)
+        self.assertEqual(self.net_worths()[2:], [
+            (date(2024, 1, 10), Decimal('100240.00')),
+            (date(2024, 1, 11), Decimal('100250.00')),
+        ])
+    
+    def test_dashboard_reads_snapshots(self):
+        PortfolioSnapshot.objects.create(portfolio=self.portfolio, date=timezone.localdate(),
+                                         cash_balance=Decimal('99600.00'), holdings_value=Decimal('650.00'),
+                                         net_worth=Decimal('100250.00'), positions={'TCS.NS': 5})
+        self.client.login(username='historian', password='testpassword123')
+        
+        with patch('market.charts.snapshot_portfolios') as mock_snapshot:
+            response = self.client.get(reverse('market:portfolio_history_api'))
+        
+        mock_snapshot.assert_not_called()
+        self.assertEqual(response.json()['history'],
+                         [{'date': timezone.localdate().strftime('%Y-%m-%d'), 'value': 100250.0}])
+    
+    def test_history_etag_changes_when_a_snapshot_is_rewritten(self):
+        closes = DailyCloses(self.store)
+        with patch('market.snapshots.get_current_stock_prices', return_value={'TCS.NS': Decimal('130.00')}):
+            snapshot_portfolios(today=date(2024, 1, 10), closes=closes)
+        self.client.login(username='historian', password='testpassword123')
+        url = reverse('market:portfolio_history_api')
+        
+        with patch('market.charts.snapshot_portfolios'):
+            etag = self.client.get(url)['ETag']
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            
+            # Today's row is upserted in place at the new live price
+            with patch('market.snapshots.get_current_stock_prices', return_value={'TCS.NS': Decimal('140.00')}):
+                snapshot_portfolios(today=date(2024, 1, 10), closes=closes)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+class LedgerTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='auditor', password='testpassword123')
+        self.portfolio = Portfolio.objects.create(user=self.user)
+        for kind, quantity, price in [
+            (Transaction.BUY, 10, '100.00'), (Transaction.BUY, 5, '130.00'),
+            (Transaction.SELL, 6, '150.00'), (Transaction.BUY, 1, '90.00'),
+        ]:
+            Transaction.objects.create(portfolio=self.portfolio, stock_symbol='TCS.NS', stock_name='TCS',
+                                       transaction_type=kind, quantity=quantity, price=Decimal(price))
+        # Stored state as the trade view would have left it
+        self.user.profile.balance = Decimal('99160.00')
+        self.user.profile.save()
+        StockHolding.objects.create(portfolio=self.portfolio, stock_symbol='TCS.NS', stock_name='TCS',
+                                    quantity=10, average_buy_price=Decimal('108.00'))
+    
+    @override_settings(LEDGER_CHECKPOINT_INTERVAL=2)
+    def test_replay_derives_state_and_resumes_from_checkpoint(self):
+        state = rebuild_portfolio(self.portfolio.id)
+        
+        self.assertEqual(state.cash, Decimal('99160.00'))
+        self.assertEqual(state.positions['TCS.NS'].quantity, 10)
+        self.assertEqual(state.positions['TCS.NS'].average_cost, Decimal('108.00'))
+        self.assertEqual(state.realized_pnl, Decimal('240.00'))
+        self.assertEqual(list(self.portfolio.ledger_checkpoints.values_list('transaction_count', flat=True)), [2, 4])
+        self.assertEqual(audit_portfolio(self.portfolio, state), [])
+        
+        Transaction.objects.create(portfolio=self.portfolio, stock_symbol='TCS.NS', stock_name='TCS',
+                                   transaction_type=Transaction.SELL, quantity=10, price=Decimal('120.00'))
+        with patch('market.ledger.stream_transactions', wraps=stream_transactions) as mock_stream:
+            state = rebuild_portfolio(self.portfolio.id)
+        
+        self.assertEqual(mock_stream.call_args.kwargs['after'].transaction_count, 4)
+        self.assertEqual(state.transaction_count, 5)
+        self.assertEqual(state.positions, {})
+        self.assertEqual(state.realized_pnl, Decimal('360.00'))
+    
+    def test_replay_rounds_like_the_database_from_the_starting_balance(self):
+        user = User.objects.create_user(username='rounder', password='testpassword123')
+        user.profile.starting_balance = user.profile.balance = Decimal('5000.00')
+        user.profile.save()
+        # Average cost 100.125 after the fourth buy is a tie the two paths must round alike
+        for quantity, price in [(1, '100.00'), (1, '100.00'), (1, '100.00'), (1, '100.50'), (4, '100.11')]:
+            execute_order(user, 'TCS.NS', 'TCS', Transaction.BUY, quantity, Decimal(price))
+        portfolio = Portfolio.objects.get(user=user)
+        holding = StockHolding.objects.get(portfolio=portfolio, stock_symbol='TCS.NS')
+        
+        state = rebuild_portfolio(portfolio.id)
+        
+        user.profile.refresh_from_db()
+        self.assertEqual(state.cash, user.profile.balance)
+        self.assertEqual(state.positions['TCS.NS'].quantity, holding.quantity)
+        self.assertEqual(state.positions['TCS.NS'].average_cost, holding.average_buy_price)
+        self.assertEqual(rebuild_and_audit([portfolio.id]), {})
+    
+    def test_command_reports_and_fixes_drift(self):
+        StockHolding.objects.filter(portfolio=self.portfolio).update(quantity=12)
+        
+        out = StringIO()
+        call_command('rebuild_ledger', str(self.portfolio.id), '--fix', stdout=out)
+        
+        self.assertIn('TCS.NS is 12 @ 108.00, ledger says 10 @ 108.00', out.getvalue())
+        self.assertEqual(StockHolding.objects.get(portfolio=self.portfolio).quantity, 10)
+        self.assertEqual(rebuild_and_audit([self.portfolio.id]), {})
+
+
+class TradingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='trader', password='testpassword123')
+        self.user.profile.balance = Decimal('1000.00')
+        self.user.profile.save()
+    
+    def test_buy_and_sell_update_balance_and_holding(self):
+        execute_order(self.user, 'TCS.NS', 'TCS', Transaction.BUY, 4, Decimal('100.00'))
+        execute_order(self.user, 'TCS.NS', 'TCS', Transaction.BUY, 2, Decimal('130.00'))
+        
+        holding = StockHolding.objects.get(portfolio__user=self.user, stock_symbol='TCS.NS')
+        self.assertEqual(holding.quantity, 6)
+        self.assertEqual(holding.average_buy_price, Decimal('110.00'))
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, Decimal('340.00'))
+        
+        execute_order(self.user, 'TCS.NS', 'TCS', Transaction.SELL, 6, Decimal('120.00'))
+        
+        self.assertFalse(StockHolding.objects.filter(portfolio__user=self.user).exists())
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, Decimal('1060.00'))
+        self.assertEqual(Transaction.objects.filter(portfolio__user=self.user).count(), 3)
+    
+    def test_rejected_orders_leave_state_unchanged(self):
+        with self.assertRaisesMessage(InsufficientFundsError, 'You need ₹1200.00 but have ₹1000.00'):
+            execute_order(self.user, 'TCS.NS', 'TCS', Transaction.BUY, 12, Decimal('100.00'))
+        with self.assertRaisesMessage(InsufficientSharesError, "You don't own any shares of TCS.NS."):
+            execute_order(self.user, 'TCS.NS', 'TCS', Transaction.SELL, 1, Decimal('100.00'))
+        
+        execute_order(self.user, 'TCS.NS', 'TCS', Transaction.BUY, 3, Decimal('100.00'))
+        with self.assertRaisesMessage(InsufficientSharesError, 'You only have 3 shares of TCS.NS but are trying to sell 5.'):
+            execute_order(self.user, 'TCS.NS', 'TCS', Transaction.SELL, 5, Decimal('100.00'))
+        
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, Decimal('700.00'))
+        self.assertEqual(StockHolding.objects.get(portfolio__user=self.user).quantity, 3)
+        self.assertEqual(Transaction.objects.filter(portfolio__user=self.user).count(), 1)
+    
+    def test_trade_view_reports_rejection(self):
+        self.client.login(username='trader', password='testpassword123')
+        with patch('market.views.get_stock_info', return_value={'name': 'TCS', 'current_price': 500.0}):
+            response = self.client.post(reverse('market:trade'), {
+                'symbol': 'TCS.NS', 'quantity': 3, 'transaction_type': Transaction.BUY
+            })
+        
+        # Not following the redirect keeps the dashboard from fetching live quotes
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('Insufficient funds', str(list(get_messages(response.wsgi_request))[0]))
+        self.assertFalse(Transaction.objects.exists())
+
+
+class BasketOrderTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='rebalancer', password='testpassword123')
+        self.user.profile.balance = Decimal('500.00')
+        self.user.profile.save()
+        execute_order(self.user, 'TCS.NS', 'TCS', Transaction.BUY, 4, Decimal('100.00'))
+        execute_order(self.user, 'INFY.NS', 'Infosys', Transaction.BUY, 1, Decimal('50.00'))
+        self.prices = {'TCS.NS': Decimal('120.00'), 'INFY.NS': Decimal('60.00'), 'WIPRO.NS': Decimal('30.00')}
+    
+    def test_sells_fund_buys_in_one_basket(self):
+        # Buys listed first still get the proceeds of the sells
+        transactions = execute_basket(self.user, [
+            ('WIPRO.NS', Transaction.BUY, 10),
+            ('INFY.NS', Transaction.BUY, 2),
+            ('TCS.NS', Transaction.SELL, 4),
+        ], self.prices, {'WIPRO.NS': 'Wipro'})
+        
+        self.assertEqual([txn.transaction_type for txn in transactions], [Transaction.SELL, Transaction.BUY, Transaction.BUY])
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, Decimal('50.00') + 480 - 300 - 120)
+        holdings = {h.stock_symbol: h for h in StockHolding.objects.filter(portfolio__user=self.user)}
+        self.assertEqual(set(holdings), {'INFY.NS', 'WIPRO.NS'})
+        self.assertEqual(holdings['INFY.NS'].quantity, 3)
+        self.assertEqual(holdings['INFY.NS'].average_buy_price, Decimal('56.67'))
+        self.assertEqual(holdings['WIPRO.NS'].stock_name, 'Wipro')
+        self.assertEqual(Transaction.objects.filter(portfolio__user=self.user).count(), 5)
+    
+    def test_failing_leg_rolls_back_basket(self):
+        with self.assertRaises(InsufficientFundsError):
+            execute_basket(self.user, [
+                ('TCS.NS', Transaction.SELL, 1),
+                ('WIPRO.NS', Transaction.BUY, 10),
+            ], self.prices)
+        
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, Decimal('50.00'))
+        self.assertEqual(StockHolding.objects.get(portfolio__user=self.user, stock_symbol='TCS.NS').quantity, 4)
+        self.assertFalse(StockHolding.objects.filter(stock_symbol='WIPRO.NS').exists())
+        self.assertEqual(Transaction.objects.filter(portfolio__user=self.user).count(), 2)
+    
+    def test_api_prices_basket_in_one_lookup(self):
+        self.client.login(username='rebalancer', password='testpassword123')
+        infos = {symbol: {'name': symbol, 'current_price': float(price)} for symbol, price in self.prices.items()}
+        legs = [
+            {'symbol': 'TCS', 'transaction_type': Transaction.SELL, 'quantity': 2},
+            {'symbol': 'WIPRO', 'transaction_type': Transaction.BUY, 'quantity': 5},
+        ]
+        with patch('market.views.get_stock_infos', side_effect=lambda symbols: {s: infos[s] for s in symbols}) as mock_infos:
+            response = self.client.post(reverse('market:basket_api'), {'legs': legs}, content_type='application/json')
+            
+            self.assertEqual(response.status_code, 200)
+            mock_infos.assert_called_once_with(['TCS.NS', 'WIPRO.NS'])
+            self.assertEqual(response.json()['balance'], '140.00')
+            
+            # The first leg sells the last 2 TCS shares, so the second cannot fill
+            response = self.client.post(reverse('market:basket_api'), {'legs': [legs[0]] * 2}, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['error'], "You don't own any shares of TCS.NS.")
+            self.assertEqual(StockHolding.objects.get(portfolio__user=self.user, stock_symbol='TCS.NS').quantity, 2)
+    
+    def test_api_accepts_uppercase_transaction_types(self):
+        self.client.login(username='rebalancer', password='testpassword123')
+        legs = [{'symbol': 'TCS', 'transaction_type': 'SELL', 'quantity': 1}]
+        with patch('market.views.get_stock_infos', return_value={'TCS.NS': {'name': 'TCS', 'current_price': 120.0}}):
+            response = self.client.post(reverse('market:basket_api'), {'legs': legs}, content_type='application/json')
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['transactions'][0]['transaction_type'], Transaction.SELL)
+
+
+class OrderBookTest(TestCase):
+    def test_match_pops_only_crossed_orders(self):
+        book = OrderBook()
+        book.add(1, 'TCS.NS', 100.0, below=True)    # limit buy at 100
+        book.add(2, 'TCS.NS', 95.0, below=True)     # limit buy at 95
+        book.add(3, 'TCS.NS', 110.0, below=False)   # stop buy at 110
+        book.add(4, 'TCS.NS', 98.0, below=True)     # stop sell at 98
+        book.add(5, 'INFY.NS', 50.0, below=True)
+        
+        self.assertEqual(book.match('TCS.NS', 105.0), [])
+        self.assertEqual(book.match('TCS.NS', 97.5), [1, 4])
+        book.discard(2)
+        self.assertEqual(book.match('TCS.NS', 90.0), [])
+        self.assertEqual(book.match('TCS.NS', 110.0), [3])
+        self.assertEqual(book.symbols(), ['INFY.NS'])
+        self.assertEqual(len(book), 1)
+
+
+class OrderMatcherTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='limiter', password='testpassword123')
+        self.user.profile.balance = Decimal('1000.00')
+        self.user.profile.save()
+    
+    def place(self, transaction_type, order_type, quantity, trigger_price):
+        return Order.objects.create(
+            user=self.user, stock_symbol='TCS.NS', stock_name='TCS', transaction_type=transaction_type,
+            order_type=order_type, quantity=quantity, trigger_price=Decimal(trigger_price)
+        )
+    
+    def test_ticks_fill_and_reject_through_the_ledger(self):
+        limit_buy = self.place(Transaction.BUY, Order.LIMIT, 5, '100.00')
+        stop_sell = self.place(Transaction.SELL, Order.STOP, 5, '90.00')
+        too_big = self.place(Transaction.BUY, Order.LIMIT, 50, '95.00')
+        cancelled = self.place(Transaction.BUY, Order.LIMIT, 1, '99.00')
+        matcher = OrderMatcher()
+        
+        with patch('market.orderbook.get_current_stock_prices', return_value={'TCS.NS': Decimal('101.00')}):
+            self.assertEqual(matcher.run_cycle(), [])
+        cancelled.status = Order.CANCELLED
+        cancelled.save()
+        with patch('market.orderbook.get_current_stock_prices', return_value={'TCS.NS': Decimal('94.00')}):
+            processed = matcher.run_cycle()
+        
+        self.assertEqual([order.id for order in processed], [limit_buy.id, too_big.id])
+        limit_buy.refresh_from_db()
+        too_big.refresh_from_db()
+        self.assertEqual(limit_buy.status, Order.FILLED)
+        self.assertEqual(limit_buy.transaction.price, Decimal('94.00'))
+        self.assertEqual(too_big.status, Order.REJECTED)
+        self.assertIn('Insufficient funds', too_big.reason)
+        self.assertEqual(StockHolding.objects.get(portfolio__user=self.user).quantity, 5)
+        
+        with patch('market.orderbook.get_current_stock_prices', return_value={'TCS.NS': Decimal('89.00')}):
+            matcher.run_cycle()
+        
+        stop_sell.refresh_from_db()
+        self.assertEqual(stop_sell.status, Order.FILLED)
+        self.assertFalse(StockHolding.objects.filter(portfolio__user=self.user).exists())
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, Decimal('1000.00') - 5 * 94 + 5 * 89)
+        self.assertEqual(Order.objects.get(id=cancelled.id).status, Order.CANCELLED)
+        self.assertEqual(len(matcher.book), 0)
+    
+    def test_new_order_fills_at_an_unchanged_price(self):
+        matcher = OrderMatcher()
+        self.place(Transaction.BUY, Order.LIMIT, 1, '80.00')
+        with patch('market.orderbook.get_current_stock_prices', return_value={'TCS.NS': Decimal('95.00')}):
+            self.assertEqual(matcher.run_cycle(), [])
+            
+            # Placed while the price stays flat, already crossed
+            crossed = self.place(Transaction.BUY, Order.LIMIT, 2, '100.00')
+            processed = matcher.run_cycle()
+            self.assertEqual([order.id for order in processed], [crossed.id])
+            self.assertEqual(matcher.run_cycle(), [])
+    
+    def test_trade_view_places_and_cancels_orders(self):
+        self.client.login(username='limiter', password='testpassword123')
+        with patch('market.views.get_stock_info', return_value={'name': 'TCS', 'current_price': 120.0}):
+            self.client.post(reverse('market:trade'), {
+                'symbol': 'TCS.NS', 'quantity': 2, 'transaction_type': Transaction.BUY,
+                'order_type': Order.LIMIT, 'trigger_price': '110.50'
+            })
+        
+        order = Order.objects.get(user=self.user)
+        self.assertEqual((order.status, order.trigger_price), (Order.OPEN, Decimal('110.50')))
+        self.assertFalse(Transaction.objects.exists())
+        
+        self.client.post(reverse('market:cancel_order', args=[order.id]))
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.CANCELLED)
+    
+    def test_trade_view_rejects_non_finite_trigger_prices(self):
+        self.client.login(username='limiter', password='testpassword123')
+        with patch('market.views.get_stock_info', return_value={'name': 'TCS', 'current_price': 120.0}):
+            for trigger_price in ('NaN', 'sNaN', 'Infinity', '-inf'):
+                response = self.client.post(reverse('market:trade'), {
+                    'symbol': 'TCS.NS', 'quantity': 2, 'transaction_type': Transaction.BUY,
+                    'order_type': Order.LIMIT, 'trigger_price': trigger_price
+                })
+                self.assertRedirects(response, reverse('market:stock_detail', args=['TCS.NS']),
+                                     fetch_redirect_response=False)
+        
+        self.assertFalse(Order.objects.exists())
+
+
+class OrderQueueTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='queued', password='testpassword123')
+        self.user.profile.balance = Decimal('1000.00')
+        self.user.profile.save()
+    
+    def queue(self, user, transaction_type, quantity, symbol='TCS.NS'):
+        return Order.objects.create(user=user, stock_symbol=symbol, stock_name=symbol, order_type=Order.MARKET,
+                                    transaction_type=transaction_type, quantity=quantity)
+    
+    @override_settings(ORDER_INTAKE_ASYNC=True)
+    def test_intake_returns_before_execution(self):
+        self.client.login(username='queued', password='testpassword123')
+        quote = {'name': 'Tata Consultancy Services Ltd', 'current_price': 100.0}
+        with patch('market.views.get_stock_info', return_value=quote) as mock_info:
+            response = self.client.post(reverse('market:trade'), {
+                'symbol': 'TCS.NS', 'quantity': 2, 'transaction_type': Transaction.BUY
+            }, HTTP_ACCEPT='application/json')
+        
+        self.assertEqual(response.status_code, 202)
+        mock_info.assert_called_once_with('TCS.NS')
+        order = Order.objects.get(id=response.json()['order_id'])
+        self.assertEqual((order.order_type, order.status, order.stock_name), (Order.MARKET, Order.OPEN, 'Tata Consultancy Services Ltd'))
+        self.assertFalse(Transaction.objects.exists())
+        
+        status = self.client.get(response.json()['status_url']).json()
+        self.assertEqual((status['status'], status['fill_price']), (Order.OPEN, None))
+    
+    @override_settings(ORDER_INTAKE_ASYNC=True)
+    def test_intake_refuses_orders_that_cannot_fill(self):
+        self.client.login(username='queued', password='testpassword123')
+        with patch('market.views.get_stock_info', return_value={'name': 'TCS', 'current_price': 100.0}):
+            response = self.client.post(reverse('market:trade'), {
+                'symbol': 'TCS.NS', 'quantity': 11, 'transaction_type': Transaction.BUY
+            }, HTTP_ACCEPT='application/json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Insufficient funds', response.json()['error'])
+            
+            response = self.client.post(reverse('market:trade'), {
+                'symbol': 'TCS.NS', 'quantity': 1, 'transaction_type': Transaction.SELL
+            })
+            self.assertEqual(response.status_code, 302)
+            self.assertEqual(str(list(get_messages(response.wsgi_request))[0]), "You don't own any shares of TCS.NS.")
+        
+        self.assertFalse(Order.objects.exists())
+    
+    def test_drain_prices_each_batch_once(self):
+        other = User.objects.create_user(username='other', password='testpassword123')
+        orders = [
+            self.queue(self.user, Transaction.BUY, 5),
+            self.queue(other, Transaction.BUY, 2, 'INFY.NS'),
+            self.queue(self.user, Transaction.BUY, 50),
+            self.queue(self.user, Transaction.SELL, 5),
+        ]
+        # Limit orders belong to the matcher, not the executor
+        limit = Order.objects.create(user=self.user, stock_symbol='TCS.NS', stock_name='TCS', order_type=Order.LIMIT,
+                                     transaction_type=Transaction.BUY, quantity=1, trigger_price=Decimal('1.00'))
+        prices = {'TCS.NS': Decimal('100.00'), 'INFY.NS': Decimal('50.00')}
+        
+        with patch('market.order_queue.get_current_stock_prices', return_value=prices) as mock_prices:
+            processed = drain(batch_size=10)
+        
+        mock_prices.assert_called_once_with(['INFY.NS', 'TCS.NS'])
+        self.assertEqual([order.id for order in processed], [order.id for order in orders])
+        statuses = dict(Order.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[order.id] for order in orders], [Order.FILLED, Order.FILLED, Order.REJECTED, Order.FILLED])
+        self.assertEqual(statuses[limit.id], Order.OPEN)
+        self.assertIn('Insufficient funds', Order.objects.get(id=orders[2].id).reason)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.balance, Decimal('1000.00'))
+        self.assertEqual(Order.objects.get(id=orders[1].id).transaction.price, Decimal('50.00'))
+    
+    def test_stale_claims_are_requeued(self):
+        order = self.queue(self.user, Transaction.BUY, 1)
+        self.assertEqual([claimed.id for claimed in claim_batch()], [order.id])
+        self.assertEqual(claim_batch(), [])
+        
+        self.assertEqual(requeue_stale(older_than=60), 0)
+        Order.objects.filter(id=order.id).update(updated_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(requeue_stale(older_than=60), 1)
+        self.assertEqual(Order.objects.get(id=order.id).status, Order.OPEN)
+    
+    def test_database_error_only_rejects_its_own_order(self):
+        other = User.objects.create_user(username='deadlocked', password='testpassword123')
+        ok = self.queue(self.user, Transaction.BUY, 2)
+        failing = self.queue(other, Transaction.BUY, 1)
+        
+        def fill(user, *args):
+            if user.id == other.id:
+                raise DatabaseError('deadlock detected')
+            return execute_order(user, *args)
+        
+        with patch('market.order_queue.get_current_stock_prices', return_value={'TCS.NS': Decimal('100.00')}), \
+                patch('market.order_queue.execute_order', side_effect=fill), \
+                self.assertLogs('market.order_queue', 'ERROR'):
+            drain()
+        
+        self.assertEqual(Order.objects.get(id=ok.id).status, Order.FILLED)
+        self.assertEqual(Order.objects.get(id=failing.id).status, Order.REJECTED)
+        self.assertFalse(Transaction.objects.filter(portfolio__user=other).exists())
+        
+        with patch('market.order_queue.drain', side_effect=DatabaseError('database is locked')), \
+                self.assertLogs('market.order_queue', 'ERROR'):
+            self.assertEqual(run_executor(0, once=True), [])
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.server = FakeYahooServer()
+        self.settings_override = override_settings(
+            YAHOO_FINANCE_BASE_URL=self.server.start(),
+            UPSTREAM_BACKOFF_BASE=0,
+        )
+        self.settings_override.enable()
+        reset_quote_cache()
+        reset_upstream_client()
+        self.user = User.objects.create_user(username='asyncuser', password='testpassword123')
+        portfolio = Portfolio.objects.create(user=self.user)
+        StockHolding.objects.create(portfolio=portfolio, stock_symbol='TCS.NS', stock_name='TCS',
+                                    quantity=3, average_buy_price=Decimal('100.00'))
+    
+    def tearDown(self):
+        self.server.stop()
+        self.settings_override.disable()
+        reset_quote_cache()
+        reset_upstream_client()
+    
+    def request(self, path, **params):
+        request = AsyncRequestFactory().get(path, params)
+        request.user = self.user
+        
+        async def auser():
+            return self.user
+        request.auser = auser
+        return request
+    
+    async def test_quote_views_fetch_without_blocking(self):
+        response = await async_views.search_stock_api(self.request('/market/api/search-stock/', q='infosys'))
+        results = json.loads(response.content)['results']
+        self.assertEqual(results[0]['symbol'], 'INFY.NS')
+        self.assertIn('current_price', results[0])
+        
+        response = await async_views.stock_detail(self.request('/market/stock/TCS.NS/'), 'TCS.NS')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Tata Consultancy Services Ltd')
+        self.assertEqual(self.server.requests, 2)
+        
+        # Served from the quote cache the first lookup filled
+        infos = await aget_stock_infos(['TCS.NS', 'INFY.NS'])
+        self.assertEqual(set(infos), {'TCS.NS', 'INFY.NS'})
+        self.assertEqual(self.server.requests, 2)
+    
+    async def test_async_client_shares_breaker_with_sync_client(self):
+        self.server.error_rate = 1.0
+        client = AsyncUpstreamClient(get_upstream_client())
+        
+        for _ in range(get_upstream_client().breaker.failure_threshold):
+            with self.assertRaises(UpstreamError):
+                await client.get_json(f"{settings.YAHOO_FINANCE_BASE_URL}/v8/finance/quote?symbols=TCS.NS")
+        
+        self.assertEqual(get_upstream_client().breaker.state, 'open')
+        self.assertEqual(fetch_stock_infos(['TCS.NS']), {})
+        self.assertEqual(get_upstream_client().stats.snapshot()['rejected'], 1)
+        await client.http.aclose()
+    
+    async def test_blocking_cache_calls_run_off_the_event_loop(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        cache = SQLiteQuoteCache(path=os.path.join(tmpdir.name, 'quotes.sqlite3'))
+        loop_thread = threading.current_thread()
+        threads = []
+        get_many = cache.get_many
+        
+        def recording_get_many(symbols):
+            threads.append(threading.current_thread())
+            return get_many(symbols)
+        cache.get_many = recording_get_many
+        
+        with patch('market.async_quotes.get_quote_cache', return_value=cache):
+            await aget_stock_infos(['TCS.NS'])
+            infos = await aget_stock_infos(['TCS.NS'])
+        
+        self.assertIn('TCS.NS', infos)
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+
+class QuoteStreamTest(TestCase):
+    def setUp(self):
+        self.prices = {'TCS.NS': 100.0, 'INFY.NS': 50.0, 'SBIN.NS': 20.0}
+        self.lookups = []
+        
+        async def fake_stock_infos(symbols):
+            self.lookups.append(list(symbols))
+            return {symbol: {'current_price': self.prices[symbol], 'change_percent': 1.0} for symbol in symbols}
+        patcher = patch('market.streaming.aget_stock_infos', side_effect=fake_stock_infos)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    async def test_one_lookup_fans_out_changes_per_subscriber(self):
+        broadcaster = QuoteBroadcaster(interval=60)
+        first = broadcaster.subscribe(['TCS.NS', 'INFY.NS'])
+        second = broadcaster.subscribe(['INFY.NS', 'SBIN.NS'])
+        
+        # The poll loop starts with the first subscriber
+        self.assertEqual(set(await first.next(1)), {'TCS.NS', 'INFY.NS'})
+        self.assertEqual(set(await second.next(1)), {'INFY.NS', 'SBIN.NS'})
+        
+        self.prices['INFY.NS'] = 51.0
+        await broadcaster.poll_once()
+        self.assertEqual(await first.next(0), {'INFY.NS': {'price': 51.0, 'change_percent': 1.0}})
+        self.assertEqual(await second.next(0), {'INFY.NS': {'price': 51.0, 'change_percent': 1.0}})
+        
+        # Late subscribers get the last known quotes at once
+        third = broadcaster.subscribe(['TCS.NS'])
+        self.assertEqual(await third.next(0), {'TCS.NS': {'price': 100.0, 'change_percent': 1.0}})
+        
+        self.assertEqual(self.lookups, [['INFY.NS', 'SBIN.NS', 'TCS.NS']] * 2)
+        for subscription in (first, second, third):
+            broadcaster.unsubscribe(subscription)
+        self.assertEqual(broadcaster.symbols, [])
+    
+    def stream_request(self, **params):
+        request = AsyncRequestFactory().get('/api/quotes/stream/', params)
+        request.user = User(username='streamer')
+        
+        async def auser():
+            return request.user
+        request.auser = auser
+        return request
+    
+    @override_settings(ASYNC_VIEWS=True, STREAM_POLL_INTERVAL=0.01, STREAM_HEARTBEAT=5)
+    async def test_sse_endpoint_streams_changes(self):
+        response = await async_views.quote_stream(self.stream_request(symbols='tcs,INFY.NS'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        
+        events = response.streaming_content
+        self.assertEqual(await anext(events), b'retry: 5000\n\n')
+        data = (await anext(events)).decode()
+        self.assertTrue(data.startswith('data: '))
+        self.assertEqual(set(json.loads(data[len('data: '):])), {'TCS.NS', 'INFY.NS'})
+        await events.aclose()
+        
+        response = await async_views.quote_stream(self.stream_request())
+        self.assertEqual(response.status_code, 400)
+    
+    def test_stream_needs_login_and_async_views(self):
+        url = reverse('market:quote_stream')
+        self.assertEqual(self.client.get(url, {'symbols': 'TCS.NS'}).status_code, 302)
+        
+        User.objects.create_user(username='streamer', password='testpassword123')
+        self.client.login(username='streamer', password='testpassword123')
+        with override_settings(ASYNC_VIEWS=False):
+            self.assertEqual(self.client.get(url, {'symbols': 'TCS.NS'}).status_code, 404)
+
+class IndexFragmentCacheTest(TestCase):
+    def setUp(self):
+        reset_quote_cache()
+        self.addCleanup(reset_quote_cache)
+        self.quote = {'symbol': 'TCS.NS', 'name': 'Tata Consultancy Services Ltd', 'current_price': 3500.0, 'change_percent': 1.0}
+    
+    def test_version_changes_only_with_prices(self):
+        cache = MemoryQuoteCache(ttl=60)
+        cache.update_many({'TCS.NS': self.quote})
+        version = cache.quote_version()
+        
+        cache.update_many({'TCS.NS': dict(self.quote)})
+        self.assertEqual(cache.quote_version(), version)
+        
+        cache.update_many({'TCS.NS': dict(self.quote, current_price=3510.0)})
+        self.assertNotEqual(cache.quote_version(), version)
+    
+    def test_index_renders_market_tables_once_per_price_change(self):
+        nifty50 = [dict(self.quote)]
+        with patch('market.views.get_nifty50_stocks', side_effect=lambda: nifty50) as get_nifty50:
+            first = self.client.get(reverse('market:index'))
+            second = self.client.get(reverse('market:index'))
+            self.assertEqual(get_nifty50.call_count, 1)
+            self.assertEqual(second.content, first.content)
+            
+            nifty50 = [dict(self.quote, current_price=3600.0)]
+            get_quote_cache().update_many({'TCS.NS': nifty50[0]})
+            third = self.client.get(reverse('market:index'))
+        
+        self.assertEqual(get_nifty50.call_count, 2)
+        self.assertContains(third, '₹3600.00')
+    
+    def test_movers_rank_the_whole_nifty50_lookup(self):
+        nifty50 = [
+            dict(self.quote, symbol='A.NS', change_percent=5.0),
+            dict(self.quote, symbol='B.NS', change_percent=1.0),
+            dict(self.quote, symbol='C.NS', change_percent=-3.0),
+        ]
+        # Only B.NS was fetched recently enough to have a stored snapshot
+        StockQuote.objects.bulk_upsert([dict(nifty50[1], fetched_at=time.time())])
+        
+        with patch('market.views.get_nifty50_stocks', return_value=nifty50):
+            response = self.client.get(reverse('market:index'))
+        
+        self.assertEqual([stock['symbol'] for stock in response.context['gainers']], ['A.NS', 'B.NS', 'C.NS'])
+        self.assertEqual([stock['symbol'] for stock in response.context['losers']], ['C.NS', 'B.NS', 'A.NS'])
+    
+    @override_settings(INDEX_FRAGMENT_TIMEOUT=300, QUOTE_CACHE_TTL=60)
+    def test_fragments_expire_with_quotes_without_the_feed(self):
+        with override_settings(QUOTE_FEED_ENABLED=False):
+            self.assertEqual(index_fragment_timeout(), 60)
+        with override_settings(QUOTE_FEED_ENABLED=True):
+            self.assertEqual(index_fragment_timeout(), 300)
+    
+    async def test_async_index_skips_quote_lookup_when_cached(self):
+        request = AsyncRequestFactory().get('/')
+        request.user = AnonymousUser()
+        with patch('market.async_views.aget_nifty50_stocks', new=AsyncMock(return_value=[self.quote])) as get_nifty50:
+            await async_views.index(request)
+            response = await async_views.index(request)
+        
+        self.assertEqual(get_nifty50.await_count, 1)
+        self.assertContains(response, '₹3500.00')
+
+class PortfolioChartApiTest(TestCase):
+    def setUp(self):
+        reset_quote_cache()
+        self.addCleanup(reset_quote_cache)
+        self.user = User.objects.create_user(username='charter', password='testpassword123')
+        self.user.profile.balance = Decimal('10000.00')
+        self.user.profile.save()
+        execute_order(self.user, 'TCS.NS', 'TCS', Transaction.BUY, 10, Decimal('100.00'))
+        execute_order(self.user, 'INFY.NS', 'Infosys', Transaction.BUY, 10, Decimal('300.00'))
+        get_quote_cache().update_many({
+            'TCS.NS': {'symbol': 'TCS.NS', 'name': 'TCS', 'current_price': 100.0, 'change_percent': 0.0},
+            'INFY.NS': {'symbol': 'INFY.NS', 'name': 'Infosys', 'current_price': 300.0, 'change_percent': 0.0},
+        })
+        self.client.login(username='charter', password='testpassword123')
+    
+    def test_allocation_and_holdings(self):
+        allocation = self.client.get(reverse('market:portfolio_allocation_api')).json()
+        self.assertEqual(allocation['allocation'], [
+            {'symbol': 'INFY.NS', 'value': 3000.0, 'weight': 75.0},
+            {'symbol': 'TCS.NS', 'value': 1000.0, 'weight': 25.0},
+        ])
+        
+        holdings = self.client.get(reverse('market:portfolio_holdings_api')).json()
+        self.assertEqual([holding['symbol'] for holding in holdings['holdings']], ['INFY.NS', 'TCS.NS'])
+        self.assertEqual(holdings['cash_balance'], 6000.0)
+        self.assertEqual(holdings['net_worth'], 10000.0)
+    
+    def test_repeat_requests_are_not_modified_until_trades_or_prices_change(self):
+        url = reverse('market:portfolio_allocation_api')
+        first = self.client.get(url)
+        self.assertTrue(first.has_header('Last-Modified'))
+        
+        with patch('market.valuation.get_current_stock_prices') as get_prices:
+            repeat = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+        get_prices.assert_not_called()
+        
+        get_quote_cache().update_many({
+            'TCS.NS': {'symbol': 'TCS.NS', 'name': 'TCS', 'current_price': 110.0, 'change_percent': 10.0},
+        })
+        repriced = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(repriced.status_code, 200)
+        self.assertEqual(repriced.json()['allocation'][1]['value'], 1100.0)
+        
+        execute_order(self.user, 'TCS.NS', 'TCS', Transaction.SELL, 5, Decimal('110.00'))
+        traded = self.client.get(url, HTTP_IF_NONE_MATCH=repriced['ETag'])
+        self.assertEqual(traded.status_code, 200)
+        self.assertEqual(traded.json()['allocation'][1]['value'], 550.0)
@@ -0,0 +1,236 @@
+"""
+Order execution against the user's balance and holdings.
+
+Concurrent orders for the same user must not both pass the funds check or
+overwrite each other's quantity. Instead of reading values into Python and
+saving them back, execute_order:
+
+- debits cash with a conditional UPDATE (balance >= amount) and credits it
+  with an F() expression, so the check and the write are one statement
+- locks the holding row with select_for_update where the new average price
+  has to be computed from the current one, and decrements quantity with a
+  conditional UPDATE on sells
+- always touches the profile row before the holding row, so buys and sells
+  lock in the same order and cannot deadlock
+
+Only the rows of the user placing the order are locked; orders from
+different users never wait on each other.
+
+execute_basket fills many legs at once: it locks the profile and every
+holding the basket touches up front, checks the whole basket in Python and
+writes the results with bulk statements, so a rebalance is one transaction.
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from accounts.models import UserProfile
+
+from .models import Portfolio, StockHolding, Transaction
+
+
+CENT = Decimal('0.01')
+
+
+def average_price(total_value, quantity):
+    """Average cost per share, rounded to the paisa the way every holding stores it"""
+    return (total_value / quantity).quantize(CENT, ROUND_HALF_UP)
+
+
+class TradeError(Exception):
+    """Raised when an order cannot be executed"""
+
+
+class InsufficientFundsError(TradeError):
+    """Raised when a buy costs more than the available balance"""
+
+
+class InsufficientSharesError(TradeError):
+    """Raised when a sell is for more shares than are held"""
+
+
+def _locked_holding(portfolio, symbol, stock_name):
+    """Return the holding row for symbol locked for update, creating it if needed"""
+    holding = StockHolding.objects.select_for_update().filter(portfolio=portfolio, stock_symbol=symbol).first()
+    if holding is not None:
+        return holding
+    try:
+        with transaction.atomic():
+            return StockHolding.objects.create(
+                portfolio=portfolio, stock_symbol=symbol, stock_name=stock_name,
+                quantity=0, average_buy_price=0
+            )
+    except IntegrityError:
+        # Created by a concurrent order in the meantime
+        return StockHolding.objects.select_for_update().get(portfolio=portfolio, stock_symbol=symbol)
+
+
+def check_order(user, symbol, transaction_type, quantity, price):
+    """
+    Raise the TradeError execute_order would raise for this order right now,
+    without locking or writing anything. Used to refuse orders up front that
+    are only filled later; the fill still checks again under its locks.
+    """
+    if quantity <= 0:
+        raise TradeError("Quantity must be greater than zero.")
+    if transaction_type == Transaction.BUY:
+        total_amount = price * quantity
+        balance = UserProfile.objects.filter(user=user).values_list('balance', flat=True).first()
+        if balance is None or balance < total_amount:
+            raise InsufficientFundsError(f"Insufficient funds. You need ₹{total_amount} but have ₹{balance}.")
+    elif transaction_type == Transaction.SELL:
+        held = StockHolding.objects.filter(
+            portfolio__user=user, stock_symbol=symbol
+        ).values_list('quantity', flat=True).first()
+        if not held:
+            raise InsufficientSharesError(f"You don't own any shares of {symbol}.")
+        if held < quantity:
+            raise InsufficientSharesError(
+                f"You only have {held} shares of {symbol} but are trying to sell {quantity}."
+            )
+    else:
+        raise TradeError(f"Unknown transaction type: {transaction_type}")
+
+
+def execute_order(user, symbol, stock_name, transaction_type, quantity, price):
+    """
+    Execute a buy or sell of quantity shares at price for user and return the
+    recorded Transaction. Raises a TradeError subclass if it cannot be filled.
+    """
+    if quantity <= 0:
+        raise TradeError("Quantity must be greater than zero.")
+    if transaction_type not in (Transaction.BUY, Transaction.SELL):
+        raise TradeError(f"Unknown transaction type: {transaction_type}")
+    total_amount = price * quantity
+
+    with transaction.atomic():
+        portfolio, _ = Portfolio.objects.get_or_create(user=user)
+        profiles = UserProfile.objects.filter(user=user)
+
+        if transaction_type == Transaction.BUY:
+            if not profiles.filter(balance__gte=total_amount).update(balance=F('balance') - total_amount):
+                balance = profiles.values_list('balance', flat=True).first()
+                raise InsufficientFundsError(
+                    f"Insufficient funds. You need ₹{total_amount} but have ₹{balance}."
+                )
+            holding = _locked_holding(portfolio, symbol, stock_name)
+            total_value = holding.quantity * holding.average_buy_price + total_amount
+            holding.quantity += quantity
+            holding.average_buy_price = average_price(total_value, holding.quantity)
+            holding.save(update_fields=['quantity', 'average_buy_price', 'last_updated'])
+
+        else:
+            # Lock the profile first to keep the same lock order as buys
+            profiles.select_for_update().values_list('pk', flat=True).first()
+            holdings = StockHolding.objects.filter(portfolio=portfolio, stock_symbol=symbol)
+            if not holdings.filter(quantity__gte=quantity).update(
+                quantity=F('quantity') - quantity, last_updated=timezone.now()
+            ):
+                held = holdings.values_list('quantity', flat=True).first()
+                if held is None:
+                    raise InsufficientSharesError(f"You don't own any shares of {symbol}.")
+                raise InsufficientSharesError(
+                    f"You only have {held} shares of {symbol} but are trying to sell {quantity}."
+                )
+            holdings.filter(quantity=0).delete()
+            profiles.update(balance=F('balance') + total_amount)
+
+        return Transaction.objects.create(
+            portfolio=portfolio,
+            stock_symbol=symbol,
+            stock_name=stock_name,
+            transaction_type=transaction_type,
+            quantity=quantity,
+            price=price
+        )
+
+
+def execute_basket(user, legs, prices, names=None):
+    """
+    Execute a basket of (symbol, transaction_type, quantity) legs at prices
+    (symbol -> Decimal) as one all-or-nothing order and return the recorded
+    Transactions. Sells are filled before buys so their proceeds can fund
+    the buys; a TradeError for the first leg that cannot be filled aborts
+    the whole basket.
+    """
+    names = names or {}
+    if not legs:
+        raise TradeError("The basket is empty.")
+    for symbol, transaction_type, quantity in legs:
+        if quantity <= 0:
+            raise TradeError(f"Quantity for {symbol} must be greater than zero.")
+        if transaction_type not in (Transaction.BUY, Transaction.SELL):
+            raise TradeError(f"Unknown transaction type: {transaction_type}")
+        if symbol not in prices:
+            raise TradeError(f"No price available for {symbol}.")
+    legs = sorted(legs, key=lambda leg: leg[1] != Transaction.SELL)
+    symbols = sorted({symbol for symbol, _, _ in legs})
+
+    with transaction.atomic():
+        portfolio, _ = Portfolio.objects.get_or_create(user=user)
+        # Profile before holdings, the same lock order as execute_order
+        profile = UserProfile.objects.select_for_update().get(user=user)
+        holdings = {
+            holding.stock_symbol: holding
+            for holding in StockHolding.objects.select_for_update().filter(
+                portfolio=portfolio, stock_symbol__in=symbols
+            )
+        }
+        existing = set(holdings)
+        cash = profile.balance
+        now = timezone.now()
+
+        transactions = []
+        for symbol, transaction_type, quantity in legs:
+            price = prices[symbol]
+            total_amount = price * quantity
+            holding = holdings.get(symbol)
+            if transaction_type == Transaction.BUY:
+                if cash < total_amount:
+                    raise InsufficientFundsError(
+                        f"Insufficient funds for {quantity} {symbol}. The basket needs ₹{total_amount} "
+                        f"more but has ₹{cash} left."
+                    )
+                if holding is None:
+                    holding = holdings[symbol] = StockHolding(
+                        portfolio=portfolio, stock_symbol=symbol, stock_name=names.get(symbol, symbol),
+                        quantity=0, average_buy_price=0
+                    )
+                total_value = holding.quantity * holding.average_buy_price + total_amount
+                holding.quantity += quantity
+                holding.average_buy_price = average_price(total_value, holding.quantity)
+                cash -= total_amount
+            else:
+                if holding is None or holding.quantity == 0:
+                    raise InsufficientSharesError(f"You don't own any shares of {symbol}.")
+                if holding.quantity < quantity:
+                    raise InsufficientSharesError(
+                        f"You only have {holding.quantity} shares of {symbol} but are trying to sell {quantity}."
+                    )
+                holding.quantity -= quantity
+                cash += total_amount
+            holding.last_updated = now
+            transactions.append(Transaction(
+                portfolio=portfolio,
+                stock_symbol=symbol,
+                stock_name=holding.stock_name,
+                transaction_type=transaction_type,
+                quantity=quantity,
+                price=price
+            ))
+
+        UserProfile.objects.filter(pk=profile.pk).update(balance=cash)
+        StockHolding.objects.filter(
+            portfolio=portfolio, stock_symbol__in=[symbol for symbol in existing if holdings[symbol].quantity == 0]
+        ).delete()
+        StockHolding.objects.bulk_update(
+            [holdings[symbol] for symbol in existing if holdings[symbol].quantity > 0],
+            ['quantity', 'average_buy_price', 'last_updated']
+        )
+        StockHolding.objects.bulk_create(
+            [holding for symbol, holding in holdings.items() if symbol not in existing and holding.quantity > 0]
+        )
+        return Transaction.objects.bulk_create(transactions)
@@ -0,0 +1,264 @@
+"""
+Shared HTTP client for upstream market data (Yahoo Finance).
+
+One pooled requests.Session is reused by every call in the process so quotes
+don't pay a new TCP/TLS handshake each time. Failed calls are retried with
+jittered exponential backoff and a circuit breaker stops calling upstream
+for a cooldown period after repeated failures or a rate limit response.
+"""
+
+import logging
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamError(Exception):
+    """Raised when upstream could not provide a usable response"""
+
+
+class RateLimitedError(UpstreamError):
+    """Raised when upstream answers 429 Too Many Requests"""
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised when the circuit breaker rejects a call without trying upstream"""
+
+
+class UpstreamStats:
+    """Thread-safe counters describing upstream traffic"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.successes = 0
+            self.failures = 0
+            self.retries = 0
+            self.rejected = 0
+            self.trips = 0
+            self.latency_total = 0.0
+            self.latency_max = 0.0
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self.requests += 1
+            self.latency_total += seconds
+            self.latency_max = max(self.latency_max, seconds)
+
+    def snapshot(self):
+        """Return the counters as a plain dict"""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'successes': self.successes,
+                'failures': self.failures,
+                'retries': self.retries,
+                'rejected': self.rejected,
+                'trips': self.trips,
+                'latency_avg_ms': round(self.latency_total / self.requests * 1000, 2) if self.requests else 0,
+                'latency_max_ms': round(self.latency_max * 1000, 2),
+            }
+
+
+class CircuitBreaker:
+    """
+    Closed/open/half-open circuit breaker.
+
+    After failure_threshold consecutive failures (or an explicit trip) the
+    breaker opens and rejects calls for cooldown seconds. It then lets a single
+    probe call through; success closes it again, failure re-opens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, cooldown=30, stats=None):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.stats = stats or UpstreamStats()
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self):
+        """Return True if a call may go upstream now"""
+        return self.acquire()[0]
+
+    def acquire(self):
+        """Return (allowed, probe): whether a call may go upstream now and whether it is the half-open probe"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True, False
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False, False
+                self._state = self.HALF_OPEN
+            # Half-open: only one probe at a time
+            if self._probe_in_flight:
+                return False, False
+            self._probe_in_flight = True
+            return True, True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._open()
+
+    def release_probe(self):
+        """Free the half-open probe slot taken by a call that ended without recording an outcome"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def trip(self):
+        """Open the breaker immediately, e.g. after a rate limit response"""
+        with self._lock:
+            self._open()
+
+    def _open(self):
+        if self._state != self.OPEN:
+            self.stats.incr('trips')
+            logger.warning(f"Upstream circuit breaker opened for {self.cooldown}s")
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+
+class UpstreamClient:
+    """Pooled HTTP client with bounded retries and a circuit breaker"""
+
+    def __init__(self, timeout=5, max_retries=2, backoff_base=0.2, backoff_max=2.0,
+                 pool_size=10, failure_threshold=5, cooldown=30):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = UpstreamStats()
+        self.breaker = CircuitBreaker(failure_threshold, cooldown, stats=self.stats)
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = 'Mozilla/5.0 (compatible; StockSim)'
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def backoff(self, attempt):
+        """Full-jitter exponential backoff delay for a retry attempt"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get_json(self, url):
+        """GET url and return the decoded JSON body, raising UpstreamError on failure"""
+        allowed, probe = self.breaker.acquire()
+        if not allowed:
+            self.stats.incr('rejected')
+            raise CircuitOpenError(f"Circuit open, not calling {url}")
+        try:
+            return self._fetch(url)
+        finally:
+            # An unexpected exception must not leave the breaker half-open forever
+            if probe:
+                self.breaker.release_probe()
+
+    def _fetch(self, url):
+        """Run the retry loop for get_json, recording the outcome on the breaker"""
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats.incr('retries')
+                time.sleep(self.backoff(attempt - 1))
+
+            start = time.monotonic()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except requests.RequestException as e:
+                self.stats.record_latency(time.monotonic() - start)
+                last_error = e
+                continue
+            self.stats.record_latency(time.monotonic() - start)
+
+            if response.status_code == 429:
+                self.stats.incr('failures')
+                self.breaker.trip()
+                raise RateLimitedError(f"Rate limited by upstream for {url}")
+
+            if response.status_code >= 500:
+                last_error = UpstreamError(f"Upstream returned {response.status_code} for {url}")
+                continue
+
+            if response.status_code != 200:
+                # Client errors are not upstream health problems, don't retry or count them
+                self.breaker.record_success()
+                raise UpstreamError(f"Upstream returned {response.status_code} for {url}")
+
+            try:
+                data = response.json()
+            except ValueError as e:
+                last_error = e
+                continue
+            self.stats.incr('successes')
+            self.breaker.record_success()
+            return data
+
+        self.stats.incr('failures')
+        self.breaker.record_failure()
+        raise UpstreamError(f"Upstream request failed after {self.max_retries + 1} attempts: {last_error}")
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_upstream_client():
+    """Return the process-wide upstream client, creating it on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = UpstreamClient(
+                    timeout=getattr(settings, 'UPSTREAM_TIMEOUT', 5),
+                    max_retries=getattr(settings, 'UPSTREAM_MAX_RETRIES', 2),
+                    backoff_base=getattr(settings, 'UPSTREAM_BACKOFF_BASE', 0.2),
+                    backoff_max=getattr(settings, 'UPSTREAM_BACKOFF_MAX', 2.0),
+                    pool_size=getattr(settings, 'UPSTREAM_POOL_SIZE', 10),
+                    failure_threshold=getattr(settings, 'UPSTREAM_BREAKER_THRESHOLD', 5),
+                    cooldown=getattr(settings, 'UPSTREAM_BREAKER_COOLDOWN', 30),
+                )
+    return _client
+
+
+def reset_upstream_client():
+    """Drop the process-wide client so it is rebuilt from settings"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
@@ -1,15 +1,28 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
+
+# Pages that wait on upstream quotes, served by async views under ASGI
+quote_views = async_views if getattr(settings, 'ASYNC_VIEWS', False) else views
 
 app_name = 'market'
 
 urlpatterns = [
-    path('', views.index, name='index'),
+    path('', quote_views.index, name='index'),
     path('dashboard/', views.dashboard, name='dashboard'),
-    path('trade/', views.trade, name='trade'),
-    path('stock/<str:symbol>/', views.stock_detail, name='stock_detail'),
+    path('trade/', quote_views.trade, name='trade'),
+    path('orders/<int:order_id>/cancel/', views.cancel_order, name='cancel_order'),
+    path('stock/<str:symbol>/', quote_views.stock_detail, name='stock_detail'),
     path('leaderboard/', views.leaderboard, name='leaderboard'),
     path('challenges/', views.challenges, name='challenges'),
     path('challenges/<int:challenge_id>/', views.challenge_detail, name='challenge_detail'),
-    path('api/search-stock/', views.search_stock_api, name='search_stock_api'),
+    path('api/orders/<int:order_id>/', views.order_status_api, name='order_status_api'),
+    path('api/basket/', views.basket_api, name='basket_api'),
+    path('api/portfolio/history/', views.portfolio_history_api, name='portfolio_history_api'),
+    path('api/portfolio/allocation/', views.portfolio_allocation_api, name='portfolio_allocation_api'),
+    path('api/portfolio/holdings/', views.portfolio_holdings_api, name='portfolio_holdings_api'),
+    path('api/quotes/stream/', async_views.quote_stream, name='quote_stream'),
+    path('api/search-stock/', quote_views.search_stock_api, name='search_stock_api'),
+    path('api/stock/<str:symbol>/history/', views.stock_history_api, name='stock_history_api'),
+    path('api/upstream-stats/', views.upstream_stats_api, name='upstream_stats_api'),
 ]
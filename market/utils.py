@@ -1,13 +1,18 @@
 import os
-import requests
 import json
-from datetime import datetime, timedelta
 from decimal import Decimal
-import random
 import logging
-from django.utils import timezone
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import quote_plus
 from django.conf import settings
 
+from .instruments import get_instrument_index
+from .quote_cache import get_quote_cache
+from .simulation import get_market_simulator
+from .upstream import CircuitOpenError, RateLimitedError, get_upstream_client
+
 logger = logging.getLogger(__name__)
 
 # Define Nifty 50 stocks (as a fallback if API calls fail)
@@ -29,9 +34,9 @@ NIFTY50_STOCKS = [
     {"symbol": "BAJFINANCE.NS", "name": "Bajaj Finance Ltd"}
 ]
 
-def get_yahoo_finance_url(endpoint, params=None):
+def get_yahoo_finance_url(endpoint, params=None, version="v8"):
     """Construct and return Yahoo Finance API URL"""
-    base_url = "https://query1.finance.yahoo.com/v8/finance"
+    base_url = f"{getattr(settings, 'YAHOO_FINANCE_BASE_URL', 'https://query1.finance.yahoo.com')}/{version}/finance"
     url = f"{base_url}/{endpoint}"
     
     if params:
@@ -40,99 +45,254 @@ def get_yahoo_finance_url(endpoint, params=None):
     
     return url
 
+def normalize_symbol(symbol):
+    """Add the .NS suffix to symbols without an exchange suffix"""
+    if "." not in symbol:
+        return f"{symbol}.NS"
+    return symbol
+
 def get_stock_info(symbol):
     """Get detailed information about a stock"""
-    try:
-        # If the symbol doesn't have a suffix, add .NS for Indian stocks
-        if "." not in symbol:
-            symbol = f"{symbol}.NS"
-        
-        # Check if we're in a fallback situation (for rate limiting)
-        # In a real app, we'd check a Redis cache or similar
-        global _use_fallback
-        if globals().get('_use_fallback', False):
-            # Return fallback data directly instead of making API calls
-            return get_fallback_stock_info(symbol)
-            
-        url = get_yahoo_finance_url("quote", {"symbols": symbol})
-        response = requests.get(url, timeout=5)
-        
-        if response.status_code == 429:  # Rate limit exceeded
-            logger.warning(f"Rate limit exceeded for Yahoo Finance API. Using fallback data.")
-            # Set global flag to avoid more API calls in this session
-            globals()['_use_fallback'] = True
-            return get_fallback_stock_info(symbol)
-        
-        if response.status_code != 200:
-            logger.error(f"Failed to get stock info for {symbol}: {response.status_code}")
-            return get_fallback_stock_info(symbol)
-        
-        data = response.json()
+    return get_stock_infos([symbol])[symbol]
+
+def get_stock_infos(symbols, deadline=None):
+    """
+    Get detailed information about several stocks at once.
+    Returns a dict keyed by the symbols as passed in; cache misses are fetched
+    in batched upstream requests and anything upstream cannot price gets fallback data.
+    With a deadline (seconds), symbols still being fetched when it passes are
+    left out of the result instead of blocking the caller.
+    """
+    # If a symbol doesn't have a suffix, add .NS for Indian stocks
+    requested = {symbol: normalize_symbol(symbol) for symbol in symbols}
+    wanted = list(dict.fromkeys(requested.values()))
+    
+    # Serve from the quote cache so a page render costs at most one lookup per symbol
+    cache = get_quote_cache()
+    found = cache.get_many(wanted)
+    missing = [symbol for symbol in wanted if symbol not in found]
+    
+    if missing:
+        # Warm up from the persisted snapshots, e.g. after a worker restart
+        stored = load_stored_quotes(missing)
+        if stored:
+            cache.update_many(stored)
+            found.update(stored)
+            missing = [symbol for symbol in missing if symbol not in stored]
+    
+    if missing and quote_feed_enabled():
+        # The quote feed owns upstream traffic: serve fallback data now and
+        # ask the feed to track these symbols from its next cycle
+        record_requested_symbols(missing)
+        fallback = get_fallback_stock_infos(missing)
+        cache.update_many(fallback, ttl=getattr(settings, 'QUOTE_CACHE_FALLBACK_TTL', 15))
+        found.update(fallback)
+    elif missing:
+        if deadline is None:
+            fetched, pending = fetch_stock_infos(missing), set()
+        else:
+            fetched, pending = fetch_stock_infos_within(missing, deadline)
+        if fetched:
+            cache.update_many(fetched)
+            store_quotes(fetched.values())
+            found.update(fetched)
         
-        try:
-            quote_data = data['quoteResponse']['result'][0]
-            
-            return {
-                'symbol': quote_data.get('symbol', symbol),
-                'name': quote_data.get('longName', quote_data.get('shortName', symbol)),
-                'current_price': quote_data.get('regularMarketPrice', 0),
-                'change': quote_data.get('regularMarketChange', 0),
-                'change_percent': quote_data.get('regularMarketChangePercent', 0),
-                'previous_close': quote_data.get('regularMarketPreviousClose', 0),
-                'open': quote_data.get('regularMarketOpen', 0),
-                'day_high': quote_data.get('regularMarketDayHigh', 0),
-                'day_low': quote_data.get('regularMarketDayLow', 0),
-                'volume': quote_data.get('regularMarketVolume', 0),
-                'market_cap': quote_data.get('marketCap', 0),
-                'pe_ratio': quote_data.get('trailingPE', 0),
-                'dividend_yield': quote_data.get('dividendYield', 0) if 'dividendYield' in quote_data else 0,
-                'fifty_two_week_high': quote_data.get('fiftyTwoWeekHigh', 0),
-                'fifty_two_week_low': quote_data.get('fiftyTwoWeekLow', 0)
-            }
-        except (KeyError, IndexError) as e:
-            logger.error(f"Error parsing Yahoo Finance data for {symbol}: {e}")
-            return get_fallback_stock_info(symbol)
+        # Cache fallback data briefly so we retry upstream soon
+        fallback = get_fallback_stock_infos([
+            symbol for symbol in missing if symbol not in fetched and symbol not in pending
+        ])
+        if fallback:
+            cache.update_many(fallback, ttl=getattr(settings, 'QUOTE_CACHE_FALLBACK_TTL', 15))
+            found.update(fallback)
     
+    return {
+        symbol: found[normalized]
+        for symbol, normalized in requested.items() if normalized in found
+    }
+
+def quote_feed_enabled():
+    """Whether a run_quote_feed worker keeps the quote cache fresh for web requests"""
+    return getattr(settings, 'QUOTE_FEED_ENABLED', False)
+
+def record_requested_symbols(symbols):
+    """Remember recently searched or requested symbols so the quote feed tracks them"""
+    symbols = [normalize_symbol(symbol) for symbol in symbols]
+    if not symbols:
+        return
+    try:
+        cache = get_quote_cache()
+        limit = getattr(settings, 'QUOTE_FEED_RECENT_SYMBOLS', 200)
+
+        def merge(recent):
+            return (symbols + [symbol for symbol in recent if symbol not in symbols])[:limit]
+
+        cache.update_meta('recent_symbols', merge, default=[], ttl=24 * 3600)
     except Exception as e:
-        logger.error(f"Error fetching stock data for {symbol}: {e}")
-        return get_fallback_stock_info(symbol)
+        logger.error(f"Error recording requested symbols: {e}")
 
-def get_fallback_stock_info(symbol):
-    """Generate fallback data for a stock when API is unavailable"""
-    # Find stock in NIFTY50_STOCKS if possible
-    stock_name = symbol
-    for stock in NIFTY50_STOCKS:
-        if stock['symbol'] == symbol:
-            stock_name = stock['name']
-            break
-
-    # Seed random with symbol to get consistent results for same symbol
-    random.seed(hash(symbol) + int(datetime.now().timestamp()) // 3600)
+def get_recent_symbols():
+    """Return recently searched or requested symbols, most recent first"""
+    return get_quote_cache().get_meta('recent_symbols', [])
+
+def load_stored_quotes(symbols):
+    """
+    Load persisted quote snapshots that are still fresh enough to serve.
+    With the quote feed enabled anything younger than QUOTE_FEED_TTL is used,
+    otherwise snapshots must be within the regular QUOTE_CACHE_TTL.
+    """
+    from .models import StockQuote
+    try:
+        quotes = StockQuote.objects.fresh(stored_quote_max_age()).filter(symbol__in=symbols)
+        return {quote.symbol: quote.to_stock_info() for quote in quotes}
+    except Exception as e:
+        logger.error(f"Error loading stored quotes: {e}")
+        return {}
+
+def stored_quote_max_age():
+    """Seconds a persisted quote snapshot remains servable"""
+    if quote_feed_enabled():
+        return getattr(settings, 'QUOTE_FEED_TTL', 3600)
+    return getattr(settings, 'QUOTE_CACHE_TTL', 60)
+
+def store_quotes(stock_infos):
+    """Persist a batch of fetched quotes with one bulk upsert"""
+    from .models import StockQuote
+    try:
+        StockQuote.objects.bulk_upsert(stock_infos)
+    except Exception as e:
+        logger.error(f"Error storing quotes: {e}")
+
+def fetch_stock_info(symbol):
+    """Fetch a stock quote from Yahoo Finance, returning None if it is unavailable"""
+    return fetch_stock_infos([symbol]).get(symbol)
+
+def fetch_stock_infos(symbols):
+    """
+    Fetch quotes from Yahoo Finance for a list of normalized symbols.
+    Symbols are sent in chunks of QUOTE_BATCH_SIZE per request; symbols that
+    could not be fetched are left out of the returned dict.
+    """
+    return fetch_stock_infos_within(symbols, None)[0]
+
+def fetch_stock_infos_within(symbols, deadline):
+    """
+    Fetch quote chunks concurrently on the shared quote executor.
+    Returns (results, pending) where pending holds the symbols whose chunk had
+    not finished after deadline seconds. Those chunks keep running and cache
+    their quotes when they complete, so a later lookup can use them.
+    """
+    batch_size = getattr(settings, 'QUOTE_BATCH_SIZE', 50)
+    chunks = [symbols[start:start + batch_size] for start in range(0, len(symbols), batch_size)]
+    if len(chunks) == 1 and deadline is None:
+        return _fetch_quote_batch(chunks[0]), set()
+    
+    executor = get_quote_executor()
+    futures = {executor.submit(_fetch_quote_batch, chunk): chunk for chunk in chunks}
+    done, not_done = wait(futures, timeout=deadline)
     
-    # Create random but realistic looking stock data
-    base_price = random.uniform(500, 5000)
-    change_percent = random.uniform(-5, 5)
-    change = base_price * change_percent / 100
-    prev_close = base_price - change
+    results = {}
+    for future in done:
+        results.update(future.result())
+    
+    pending = set()
+    for future in not_done:
+        pending.update(futures[future])
+        future.add_done_callback(_cache_late_quotes)
+    return results, pending
+
+def _cache_late_quotes(future):
+    """Store quotes from a chunk that finished after its caller stopped waiting"""
+    try:
+        fetched = future.result()
+        if fetched:
+            get_quote_cache().update_many(fetched)
+    except Exception as e:
+        logger.error(f"Error caching late quotes: {e}")
+
+_quote_executor = None
+_quote_executor_lock = threading.Lock()
+
+def get_quote_executor():
+    """
+    Return the process-wide executor used for upstream quote fetches.
+    Its size (QUOTE_FETCH_CONCURRENCY) caps concurrent upstream calls across all requests.
+    """
+    global _quote_executor
+    if _quote_executor is None:
+        with _quote_executor_lock:
+            if _quote_executor is None:
+                _quote_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'QUOTE_FETCH_CONCURRENCY', 4),
+                    thread_name_prefix='quote-fetch'
+                )
+    return _quote_executor
+
+def _fetch_quote_batch(symbols):
+    """Fetch and parse one multi-symbol quote request"""
+    try:
+        url = get_yahoo_finance_url("quote", {"symbols": ",".join(symbols)})
+        data = get_upstream_client().get_json(url)
+        return parse_quote_response(data, symbols)
     
+    except CircuitOpenError:
+        # Upstream is cooling down after failures or rate limiting
+        return {}
+    except RateLimitedError:
+        logger.warning(f"Rate limit exceeded for Yahoo Finance API. Using fallback data.")
+        return {}
+    except Exception as e:
+        logger.error(f"Error fetching stock data for {','.join(symbols)}: {e}")
+        return {}
+
+def parse_quote_response(data, symbols):
+    """Parse a multi-symbol quote response into {symbol: stock info}"""
+    try:
+        fetched_at = time.time()
+        results = {}
+        for quote_data in data['quoteResponse']['result']:
+            stock_info = parse_quote(quote_data)
+            stock_info['fetched_at'] = fetched_at
+            results[stock_info['symbol']] = stock_info
+        return results
+    except (KeyError, TypeError) as e:
+        logger.error(f"Error parsing Yahoo Finance data for {','.join(symbols)}: {e}")
+        return {}
+
+def parse_quote(quote_data):
+    """Convert a Yahoo Finance quote result into our stock info dict"""
+    symbol = quote_data['symbol']
     return {
         'symbol': symbol,
-        'name': stock_name,
-        'current_price': base_price,
-        'change': change,
-        'change_percent': change_percent,
-        'previous_close': prev_close,
-        'open': prev_close * (1 + random.uniform(-1, 1) / 100),
-        'day_high': base_price * (1 + random.uniform(0, 2) / 100),
-        'day_low': base_price * (1 - random.uniform(0, 2) / 100),
-        'volume': random.randint(100000, 10000000),
-        'market_cap': base_price * random.randint(10000000, 1000000000),
-        'pe_ratio': random.uniform(5, 50),
-        'dividend_yield': random.uniform(0, 5),
-        'fifty_two_week_high': base_price * (1 + random.uniform(5, 25) / 100),
-        'fifty_two_week_low': base_price * (1 - random.uniform(5, 25) / 100)
+        'name': quote_data.get('longName', quote_data.get('shortName', symbol)),
+        'current_price': quote_data.get('regularMarketPrice', 0),
+        'change': quote_data.get('regularMarketChange', 0),
+        'change_percent': quote_data.get('regularMarketChangePercent', 0),
+        'previous_close': quote_data.get('regularMarketPreviousClose', 0),
+        'open': quote_data.get('regularMarketOpen', 0),
+        'day_high': quote_data.get('regularMarketDayHigh', 0),
+        'day_low': quote_data.get('regularMarketDayLow', 0),
+        'volume': quote_data.get('regularMarketVolume', 0),
+        'market_cap': quote_data.get('marketCap', 0),
+        'pe_ratio': quote_data.get('trailingPE', 0),
+        'dividend_yield': quote_data.get('dividendYield', 0) if 'dividendYield' in quote_data else 0,
+        'fifty_two_week_high': quote_data.get('fiftyTwoWeekHigh', 0),
+        'fifty_two_week_low': quote_data.get('fiftyTwoWeekLow', 0)
     }
 
+def get_fallback_stock_info(symbol):
+    """Generate fallback data for a stock when API is unavailable"""
+    return get_fallback_stock_infos([symbol])[symbol]
+
+def get_fallback_stock_infos(symbols):
+    """Price several stocks off the simulated market in one vectorized step"""
+    names = {stock['symbol']: stock['name'] for stock in NIFTY50_STOCKS}
+    index = get_instrument_index()
+    stock_infos = get_market_simulator().quotes(symbols)
+    for symbol, stock_info in stock_infos.items():
+        instrument = index.get(symbol)
+        stock_info['name'] = instrument.name if instrument else names.get(symbol, symbol)
+    return stock_infos
+
 def get_current_stock_price(symbol):
     """Get current stock price only"""
     try:
@@ -144,83 +304,100 @@ def get_current_stock_price(symbol):
         logger.error(f"Error getting current price for {symbol}: {e}")
         return Decimal('0.0')
 
+def get_current_stock_prices(symbols):
+    """Get current prices for several stocks with one batched lookup"""
+    try:
+        stock_infos = get_stock_infos(symbols)
+        return {
+            symbol: Decimal(str(stock_info['current_price']))
+            for symbol, stock_info in stock_infos.items()
+        }
+    except Exception as e:
+        logger.error(f"Error getting current prices for {symbols}: {e}")
+        return {symbol: Decimal('0.0') for symbol in symbols}
+
+def local_search_results(query):
+    """Search results for query from the local instrument list"""
+    return [
+        {'symbol': instrument.symbol, 'name': instrument.name, 'exchange': 'NSE'}
+        for instrument in get_instrument_index().search(query)
+    ]
+
+def get_search_url(query):
+    """Yahoo Finance search API URL for query"""
+    return get_yahoo_finance_url("search", {
+        "q": quote_plus(query), "quotesCount": 10, "newsCount": 0,
+        "enableFuzzyQuery": "false", "region": "IN"
+    }, version="v1")
+
+def parse_search_response(data):
+    """Search results from a Yahoo Finance search response, NSE listings only"""
+    return [
+        {
+            'symbol': quote.get('symbol', ''),
+            'name': quote.get('longname', quote.get('shortname', '')),
+            'exchange': quote.get('exchange', '')
+        }
+        for quote in data.get('quotes', [])
+        if 'symbol' in quote and 'NS' in quote['symbol']
+    ]
+
+def add_search_prices(results, stock_infos):
+    """Add current price and change to the search results that were priced"""
+    for stock_info in results:
+        detailed_info = stock_infos.get(stock_info['symbol'])
+        if detailed_info:
+            stock_info.update({
+                'current_price': detailed_info['current_price'],
+                'change_percent': detailed_info['change_percent']
+            })
+
 def search_stocks(query):
     """Search for stocks based on query"""
     try:
-        # If we're in fallback mode, return filtered fallback stocks
-        if globals().get('_use_fallback', False):
-            return search_fallback_stocks(query)
-            
-        # Construct URL for Yahoo Finance search API
-        url = f"https://query1.finance.yahoo.com/v1/finance/search?q={query}&quotesCount=10&newsCount=0&enableFuzzyQuery=false&region=IN"
-        response = requests.get(url, timeout=5)
+        # Match against the local instrument list first; Yahoo search is
+        # only needed for listings the list does not know about
+        results = local_search_results(query)
         
-        if response.status_code == 429:  # Rate limit exceeded
-            logger.warning(f"Rate limit exceeded when searching stocks. Using fallback data.")
-            globals()['_use_fallback'] = True
-            return search_fallback_stocks(query)
-            
-        if response.status_code != 200:
-            logger.error(f"Failed to search stocks for {query}: {response.status_code}")
-            return search_fallback_stocks(query)
-        
-        data = response.json()
+        if not results:
+            data = get_upstream_client().get_json(get_search_url(query))
+            results = parse_search_response(data)
         
-        results = []
-        for quote in data.get('quotes', []):
-            if 'symbol' in quote and 'NS' in quote['symbol']:  # Only include NSE stocks
-                stock_info = {
-                    'symbol': quote.get('symbol', ''),
-                    'name': quote.get('longname', quote.get('shortname', '')),
-                    'exchange': quote.get('exchange', '')
-                }
-                
-                # Get current price and other details
-                detailed_info = get_stock_info(stock_info['symbol'])
-                if detailed_info:
-                    stock_info.update({
-                        'current_price': detailed_info['current_price'],
-                        'change_percent': detailed_info['change_percent']
-                    })
-                
-                results.append(stock_info)
+        # Get current price and other details for all matches in one lookup.
+        # Matches not priced within the deadline are returned without prices.
+        detailed_infos = get_stock_infos(
+            [stock_info['symbol'] for stock_info in results],
+            deadline=getattr(settings, 'SEARCH_QUOTE_DEADLINE', 1.5)
+        )
+        add_search_prices(results, detailed_infos)
         
         if results:
+            record_requested_symbols([stock_info['symbol'] for stock_info in results])
             return results
         else:
             return search_fallback_stocks(query)
     
+    except CircuitOpenError:
+        return search_fallback_stocks(query)
+    except RateLimitedError:
+        logger.warning(f"Rate limit exceeded when searching stocks. Using fallback data.")
+        return search_fallback_stocks(query)
     except Exception as e:
         logger.error(f"Error searching stocks for {query}: {e}")
         return search_fallback_stocks(query)
 
 def search_fallback_stocks(query):
-    """Search fallback stocks based on query"""
-    query = query.lower()
-    results = []
-    
-    # Generate fallback data for all stocks in NIFTY50_STOCKS
-    all_stocks = get_fallback_nifty50_data()
-    
-    # Filter based on query
-    for stock in all_stocks:
-        if (query in stock['symbol'].lower() or 
-            query in stock['name'].lower()):
-            results.append(stock)
-    
-    # Return top 10 matches
-    return results[:10]
+    """Search the instrument list and price the matches off the simulated market"""
+    matches = get_instrument_index().search(query)
+    stock_infos = get_fallback_stock_infos([instrument.symbol for instrument in matches])
+    return [stock_infos[instrument.symbol] for instrument in matches]
 
 def get_nifty50_stocks():
     """Get Nifty 50 stocks data"""
     try:
-        nifty50_data = []
-        
-        # Try to get data for predefined Nifty 50 stocks
-        for stock in NIFTY50_STOCKS:
-            stock_info = get_stock_info(stock['symbol'])
-            if stock_info:
-                nifty50_data.append(stock_info)
+        # Get data for all predefined Nifty 50 stocks in one batched lookup
+        stock_infos = get_stock_infos([stock['symbol'] for stock in NIFTY50_STOCKS])
+        nifty50_data = [stock_info for stock_info in stock_infos.values() if stock_info]
         
         # If we got any real data, return it
         if nifty50_data:
@@ -236,87 +413,32 @@ def get_nifty50_stocks():
 
 def get_fallback_nifty50_data():
     """Generate fallback data for Nifty 50 stocks"""
-    # Seed the random generator for consistent results in a session
-    random.seed(int(datetime.now().timestamp()) // 3600)  # Change hourly
-    
-    # Create realistic fallback data
-    return [
-        {
-            'symbol': stock['symbol'],
-            'name': stock['name'],
-            'current_price': random.uniform(500, 5000),
-            'change_percent': random.uniform(-5, 5),
-            'previous_close': random.uniform(500, 5000),
-            'open': random.uniform(500, 5000),
-            'day_high': random.uniform(500, 5000),
-            'day_low': random.uniform(500, 5000),
-            'volume': random.randint(100000, 10000000),
-            'market_cap': random.randint(1000000000, 10000000000000),
-            'pe_ratio': random.uniform(5, 50),
-            'dividend_yield': random.uniform(0, 5),
-            'fifty_two_week_high': random.uniform(500, 5000),
-            'fifty_two_week_low': random.uniform(500, 5000)
-        }
-        for stock in NIFTY50_STOCKS
-    ]
+    stock_infos = get_fallback_stock_infos([stock['symbol'] for stock in NIFTY50_STOCKS])
+    return list(stock_infos.values())
 
-def calculate_portfolio_history(portfolio):
+def fetch_price_history(symbol, interval='1d', period='1y'):
     """
-    Calculate portfolio value history for charts
-    For demo purposes, this generates simulated historical data
-    In a real application, this would use stored historical transaction data
+    Fetch historical OHLCV bars from the Yahoo Finance chart API.
+    Returns a dict of column lists (timestamp, open, high, low, close, volume),
+    skipping bars upstream left incomplete, or None if the fetch failed.
     """
     try:
-        # Get all transactions sorted by time
-        from .models import Transaction
-        transactions = Transaction.objects.filter(portfolio=portfolio).order_by('timestamp')
-        
-        if not transactions:
-            return []
-        
-        # Start date is 30 days ago or first transaction, whichever is more recent
-        start_date = max(
-            transactions.first().timestamp.date(),
-            timezone.now().date() - timedelta(days=30)
-        )
-        
-        # End date is today
-        end_date = timezone.now().date()
-        
-        # Generate daily data points
-        history = []
-        current_date = start_date
-        
-        # For simplicity, we're simulating historical data
-        # In a real application, you would calculate each day's value based on 
-        # transaction history and historical stock prices
-        
-        # Get current portfolio value
-        current_value = portfolio.net_worth
-        
-        # Generate a somewhat realistic growth curve going backward from current value
-        while current_date <= end_date:
-            # Calculate a modifier for this day (random variation around a trend)
-            days_ago = (end_date - current_date).days
-            
-            if days_ago > 0:
-                # Simulate a general upward or downward trend with random variations
-                # This is simplified and would be replaced with actual calculations
-                trend_factor = 1 - (days_ago * 0.005)  # Gradual trend
-                random_factor = 1 + (random.uniform(-0.02, 0.02))  # Daily noise
-                value = current_value * trend_factor * random_factor
-            else:
-                value = current_value
-            
-            history.append({
-                'date': current_date.strftime('%Y-%m-%d'),
-                'value': round(value, 2)
-            })
-            
-            current_date += timedelta(days=1)
+        url = get_yahoo_finance_url(f"chart/{normalize_symbol(symbol)}", {"range": period, "interval": interval})
+        data = get_upstream_client().get_json(url)
+        result = data['chart']['result'][0]
+        quote = result['indicators']['quote'][0]
         
-        return history
+        bars = {column: [] for column in ('timestamp', 'open', 'high', 'low', 'close', 'volume')}
+        for i, timestamp in enumerate(result.get('timestamp') or []):
+            row = [quote[column][i] for column in ('open', 'high', 'low', 'close')]
+            if None in row or (bars['timestamp'] and timestamp <= bars['timestamp'][-1]):
+                continue
+            bars['timestamp'].append(timestamp)
+            for column, value in zip(('open', 'high', 'low', 'close'), row):
+                bars[column].append(value)
+            bars['volume'].append(quote['volume'][i] or 0)
+        return bars
     
     except Exception as e:
-        logger.error(f"Error calculating portfolio history: {e}")
-        return []
+        logger.error(f"Error fetching price history for {symbol}: {e}")
+        return None
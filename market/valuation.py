@@ -0,0 +1,217 @@
+"""
+Portfolio valuation.
+
+value_portfolio loads a portfolio's holdings with one query, prices them
+with one batched quote lookup and computes every per-holding and aggregate
+figure up front. The result is immutable, so views and templates can read
+it as often as they like without triggering more queries or price lookups.
+
+HoldingsMatrix does the same for every portfolio at once (leaderboards,
+challenge rankings, snapshots), using NumPy arrays instead of Decimals.
+"""
+
+from dataclasses import dataclass
+from decimal import Decimal
+
+import numpy as np
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Cast, Coalesce
+
+from .utils import get_current_stock_prices
+
+ZERO = Decimal('0.00')
+
+
+@dataclass(frozen=True)
+class HoldingValuation:
+    """A holding priced at one point in time"""
+    stock_symbol: str
+    stock_name: str
+    quantity: int
+    average_buy_price: Decimal
+    current_price: Decimal
+    current_value: Decimal
+    invested_value: Decimal
+    profit_loss: Decimal
+    profit_loss_percentage: Decimal
+
+
+@dataclass(frozen=True)
+class PortfolioValuation:
+    """Holdings and aggregate figures of a portfolio priced at one point in time"""
+    holdings: tuple
+    cash_balance: Decimal
+    total_value: Decimal
+    invested_value: Decimal
+    total_profit: Decimal
+    net_worth: Decimal
+
+    def get(self, symbol):
+        """Return the HoldingValuation for a symbol, or None"""
+        for holding in self.holdings:
+            if holding.stock_symbol == symbol:
+                return holding
+        return None
+
+
+def value_holding(holding, price):
+    """Value a single StockHolding at the given price"""
+    current_value = holding.quantity * price
+    invested_value = holding.quantity * holding.average_buy_price
+    profit_loss = current_value - invested_value
+    if invested_value > 0:
+        profit_loss_percentage = profit_loss / invested_value * 100
+    else:
+        profit_loss_percentage = ZERO
+    return HoldingValuation(
+        stock_symbol=holding.stock_symbol,
+        stock_name=holding.stock_name,
+        quantity=holding.quantity,
+        average_buy_price=holding.average_buy_price,
+        current_price=price,
+        current_value=current_value,
+        invested_value=invested_value,
+        profit_loss=profit_loss,
+        profit_loss_percentage=profit_loss_percentage,
+    )
+
+
+def value_holdings(holdings, cash_balance=ZERO):
+    """Value already-loaded StockHoldings with one batched price lookup"""
+    holdings = list(holdings)
+    prices = get_current_stock_prices([holding.stock_symbol for holding in holdings]) if holdings else {}
+    valuations = tuple(
+        value_holding(holding, prices.get(holding.stock_symbol, ZERO))
+        for holding in holdings
+    )
+    total_value = sum((holding.current_value for holding in valuations), ZERO)
+    invested_value = sum((holding.invested_value for holding in valuations), ZERO)
+    return PortfolioValuation(
+        holdings=valuations,
+        cash_balance=cash_balance,
+        total_value=total_value,
+        invested_value=invested_value,
+        total_profit=total_value - invested_value,
+        net_worth=total_value + cash_balance,
+    )
+
+
+def value_portfolio(portfolio, cash_balance=None):
+    """
+    Value a Portfolio. Pass cash_balance when the owner's profile is already
+    loaded to skip looking it up.
+    """
+    if cash_balance is None:
+        cash_balance = portfolio.user.profile.balance
+    return value_holdings(portfolio.holdings.order_by('stock_symbol'), cash_balance)
+
+
+class HoldingsMatrix:
+    """
+    Every holding of a set of portfolios as a sparse portfolio x symbol
+    quantity matrix (coordinate form: one row/column/quantity triple per
+    holding) plus per-holding cost basis and per-portfolio cash.
+
+    Valuing all portfolios is then one sparse matrix-vector product with the
+    price vector, done with np.bincount.
+    """
+
+    def __init__(self, portfolio_ids, user_ids, usernames, cash, symbols, rows, cols, quantities, cost_basis):
+        self.portfolio_ids = np.asarray(portfolio_ids, dtype=np.int64)
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.usernames = list(usernames)
+        self.cash = np.asarray(cash, dtype=np.float64)
+        self.symbols = list(symbols)
+        self.rows = np.asarray(rows, dtype=np.intp)
+        self.cols = np.asarray(cols, dtype=np.intp)
+        self.quantities = np.asarray(quantities, dtype=np.float64)
+        self.cost_basis = np.asarray(cost_basis, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.portfolio_ids)
+
+    @classmethod
+    def load(cls, portfolio_ids=None, user_ids=None):
+        """
+        Load holdings and cash balances for all portfolios, or only those with
+        the given ids or owned by the given users (either may be a subquery)
+        """
+        from .models import Portfolio, StockHolding
+
+        portfolios = Portfolio.objects.all()
+        holdings = StockHolding.objects.filter(quantity__gt=0)
+        if portfolio_ids is not None:
+            portfolios = portfolios.filter(id__in=portfolio_ids)
+            holdings = holdings.filter(portfolio_id__in=portfolio_ids)
+        if user_ids is not None:
+            portfolios = portfolios.filter(user_id__in=user_ids)
+            holdings = holdings.filter(portfolio__user_id__in=user_ids)
+
+        # Cast to float in SQL so a million rows skip Decimal construction
+        owners = portfolios.order_by('id').values_list(
+            'id', 'user_id', 'user__username',
+            Cast(Coalesce('user__profile__balance', Value(0)), FloatField()),
+        )
+        portfolio_ids, user_ids, usernames, cash = zip(*owners) if owners else ((), (), (), ())
+        row_index = {portfolio_id: row for row, portfolio_id in enumerate(portfolio_ids)}
+
+        symbol_index = {}
+        rows, cols, quantities, cost_basis = [], [], [], []
+        for portfolio_id, symbol, quantity, cost in holdings.values_list(
+            'portfolio_id', 'stock_symbol', 'quantity',
+            Cast(F('quantity') * F('average_buy_price'), FloatField()),
+        ).iterator(chunk_size=10000):
+            rows.append(row_index[portfolio_id])
+            cols.append(symbol_index.setdefault(symbol, len(symbol_index)))
+            quantities.append(quantity)
+            cost_basis.append(cost)
+
+        return cls(portfolio_ids, user_ids, usernames, cash, list(symbol_index),
+                   rows, cols, quantities, cost_basis)
+
+    def price_vector(self, prices):
+        """Prices for the matrix columns from a symbol -> price mapping; missing prices are 0"""
+        return np.array([float(prices.get(symbol, 0)) for symbol in self.symbols], dtype=np.float64)
+
+    def value(self, prices):
+        """Mark every portfolio to market in one vectorized pass"""
+        price_vector = prices if isinstance(prices, np.ndarray) else self.price_vector(prices)
+        n = len(self.portfolio_ids)
+        portfolio_value = np.bincount(self.rows, weights=self.quantities * price_vector[self.cols], minlength=n)
+        invested_value = np.bincount(self.rows, weights=self.cost_basis, minlength=n)
+        profit = portfolio_value - invested_value
+        with np.errstate(divide='ignore', invalid='ignore'):
+            profit_percentage = np.where(invested_value > 0, profit / invested_value * 100, 0.0)
+        return BulkValuation(
+            portfolio_ids=self.portfolio_ids,
+            user_ids=self.user_ids,
+            usernames=self.usernames,
+            cash_balance=self.cash,
+            portfolio_value=portfolio_value,
+            invested_value=invested_value,
+            profit=profit,
+            profit_percentage=profit_percentage,
+            net_worth=portfolio_value + self.cash,
+        )
+
+
+@dataclass(frozen=True)
+class BulkValuation:
+    """Per-portfolio figures from HoldingsMatrix.value, as aligned float arrays"""
+    portfolio_ids: np.ndarray
+    user_ids: np.ndarray
+    usernames: list
+    cash_balance: np.ndarray
+    portfolio_value: np.ndarray
+    invested_value: np.ndarray
+    profit: np.ndarray
+    profit_percentage: np.ndarray
+    net_worth: np.ndarray
+
+    def __len__(self):
+        return len(self.portfolio_ids)
+
+
+def to_money(value):
+    """Round a float amount from the bulk kernel to a two-place Decimal"""
+    return Decimal(f"{value:.2f}")
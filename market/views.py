@@ -1,31 +1,90 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.http import JsonResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, etag, require_POST
 from django.contrib import messages
 from django.utils import timezone
-from django.db.models import F, Sum, Q
-from django.db import transaction
-from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import F, Max, Sum, Q
+from decimal import Decimal, InvalidOperation
+import json
 
-from .models import Portfolio, StockHolding, Transaction, Challenge, ChallengeParticipant
+from .models import Portfolio, StockHolding, Transaction, Challenge, ChallengeParticipant, LeaderboardEntry, Order
+from .charts import (
+    allocation_data, chart_state, history_etag, holdings_data, holdings_etag, holdings_last_modified,
+    portfolio_history_data
+)
+from .history import get_bar_store
+from .leaderboard import LeaderboardRefresher
+from .quote_cache import get_quote_cache
+from .rankings import challenge_standings, invalidate_standings
+from .trading import TradeError, check_order, execute_basket, execute_order
+from .upstream import get_upstream_client
+from .valuation import value_holding, value_holdings
 from .utils import (
-    get_stock_info, get_current_stock_price, search_stocks,
-    get_nifty50_stocks, calculate_portfolio_history
+    get_stock_info, get_stock_infos, get_current_stock_price, search_stocks,
+    get_nifty50_stocks, quote_feed_enabled,
+    normalize_symbol
 )
 
+# Cached blocks of market/index.html, keyed on the quote version
+INDEX_FRAGMENTS = ('market_overview', 'top_gainers', 'top_losers')
+
+def index_fragment_keys(version):
+    return [make_template_fragment_key(name, [version]) for name in INDEX_FRAGMENTS]
+
+def index_fragment_timeout():
+    """
+    Seconds the market tables stay cached. Without the quote feed nothing
+    refreshes quotes while the fragments are served, so the version cannot
+    move on its own and the tables must expire with the quotes they show
+    """
+    timeout = getattr(settings, 'INDEX_FRAGMENT_TIMEOUT', 300)
+    if quote_feed_enabled():
+        return timeout
+    return min(timeout, getattr(settings, 'QUOTE_CACHE_TTL', 60))
+
+def index_context(version):
+    """Context shared by both index views; the market tables are left for the caller to fill"""
+    return {
+        'quote_version': version,
+        'fragment_timeout': index_fragment_timeout(),
+        'nifty50_data': None,
+        'gainers': None,
+        'losers': None,
+    }
+
+def top_movers(nifty50_data, count=5):
+    """
+    Top gainers and losers of the full Nifty 50 lookup. Stored snapshots only
+    cover recently fetched symbols, so ranking them would vary with traffic
+    """
+    ranked = sorted(nifty50_data, key=lambda x: x['change_percent'], reverse=True)
+    return ranked[:count], ranked[::-1][:count]
+
 def index(request):
     """Home page view"""
+    # Read the version before any quotes so fragments are never cached under a newer one
+    version = get_quote_cache().quote_version()
+    context = index_context(version)
+    if len(cache.get_many(index_fragment_keys(version))) == len(INDEX_FRAGMENTS):
+        # Prices haven't changed since the market tables were last rendered
+        return render(request, 'market/index.html', context)
+    
     nifty50_data = get_nifty50_stocks()
     
-    # Get top gainers and losers from Nifty 50
-    gainers = sorted(nifty50_data, key=lambda x: x['change_percent'], reverse=True)[:5]
-    losers = sorted(nifty50_data, key=lambda x: x['change_percent'])[:5]
+    gainers, losers = top_movers(nifty50_data)
     
-    context = {
+    context.update({
         'nifty50_data': nifty50_data[:10],  # Show top 10 stocks
         'gainers': gainers,
         'losers': losers
-    }
+    })
     return render(request, 'market/index.html', context)
 
 @login_required
@@ -33,28 +92,33 @@ def dashboard(request):
     """User dashboard view"""
     try:
         portfolio = Portfolio.objects.get(user=request.user)
-        holdings = StockHolding.objects.filter(portfolio=portfolio)
         
-        # Get portfolio history for charts
-        portfolio_history = calculate_portfolio_history(portfolio)
+        # Price every holding once; the template reads figures off the result
+        valuation = portfolio.valuation(request.user.profile.balance)
         
         # Get latest transactions
         transactions = Transaction.objects.filter(portfolio=portfolio).order_by('-timestamp')[:5]
         
+        # The charts fetch their data from the portfolio APIs; history is
+        # built from the ledger there if the snapshot job hasn't run yet
+        has_history = bool(transactions) or portfolio.snapshots.exists()
+        
     except Portfolio.DoesNotExist:
         # Create portfolio if it doesn't exist
         portfolio = Portfolio.objects.create(user=request.user)
-        holdings = []
-        portfolio_history = []
+        valuation = value_holdings([], request.user.profile.balance)
         transactions = []
+        has_history = False
     
     context = {
         'portfolio': portfolio,
-        'holdings': holdings,
-        'portfolio_history': portfolio_history,
+        'valuation': valuation,
+        'holdings': valuation.holdings,
+        'has_history': has_history,
         'transactions': transactions,
-        'balance': request.user.profile.balance,
-        'net_worth': portfolio.net_worth
+        'open_orders': Order.objects.filter(user=request.user, status__in=[Order.OPEN, Order.EXECUTING])[:10],
+        'balance': valuation.cash_balance,
+        'net_worth': valuation.net_worth
     }
     return render(request, 'market/dashboard.html', context)
 
@@ -72,6 +136,8 @@ def stock_detail(request, symbol):
         portfolio = Portfolio.objects.get(user=request.user)
         try:
             holding = StockHolding.objects.get(portfolio=portfolio, stock_symbol=symbol)
+            # Value the holding at the price already fetched for this page
+            holding = value_holding(holding, Decimal(str(stock_info['current_price'])))
         except StockHolding.DoesNotExist:
             holding = None
     except Portfolio.DoesNotExist:
@@ -85,6 +151,46 @@ def stock_detail(request, symbol):
     }
     return render(request, 'market/stock_detail.html', context)
 
+def _queue_market_order(request, symbol, transaction_type, quantity):
+    """
+    Record a market order for the order executor and respond at once. The
+    funds or shares are checked against the current (usually cached) quote
+    first, so an order that cannot fill is refused instead of queued
+    """
+    if not symbol or transaction_type not in (Transaction.BUY, Transaction.SELL):
+        messages.error(request, "Invalid order.")
+        return redirect('market:trade')
+    
+    stock_info = get_stock_info(symbol)
+    if not stock_info:
+        messages.error(request, "Invalid stock symbol or could not retrieve stock information.")
+        return redirect('market:trade')
+    try:
+        check_order(request.user, symbol, transaction_type, quantity, Decimal(str(stock_info['current_price'])))
+    except TradeError as e:
+        if 'application/json' in request.headers.get('Accept', ''):
+            return JsonResponse({'error': str(e)}, status=400)
+        messages.error(request, str(e))
+        return redirect('market:trade')
+    
+    order = Order.objects.create(
+        user=request.user,
+        stock_symbol=symbol,
+        stock_name=stock_info['name'],
+        transaction_type=transaction_type,
+        order_type=Order.MARKET,
+        quantity=quantity
+    )
+    if 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'order_id': order.id,
+            'status': order.status,
+            'status_url': reverse('market:order_status_api', args=[order.id])
+        }, status=202)
+    
+    messages.info(request, f"Your order to {transaction_type} {quantity} shares of {symbol} is queued.")
+    return redirect('market:dashboard')
+
 @login_required
 def trade(request):
     """View for trading stocks"""
@@ -97,92 +203,55 @@ def trade(request):
             messages.error(request, "Quantity must be greater than zero.")
             return redirect('market:trade')
         
+        order_type = request.POST.get('order_type', Order.MARKET)
+        if order_type == Order.MARKET and getattr(settings, 'ORDER_INTAKE_ASYNC', False):
+            return _queue_market_order(request, symbol, transaction_type, quantity)
+        
         # Get stock info and validate
         stock_info = get_stock_info(symbol)
         if not stock_info:
             messages.error(request, "Invalid stock symbol or could not retrieve stock information.")
             return redirect('market:trade')
         
+        # Limit and stop orders rest until the order matcher sees their price
+        if order_type in (Order.LIMIT, Order.STOP):
+            try:
+                trigger_price = Decimal(request.POST.get('trigger_price', ''))
+            except InvalidOperation:
+                trigger_price = None
+            # NaN and Infinity parse fine but cannot be compared or stored
+            if trigger_price is not None and not trigger_price.is_finite():
+                trigger_price = None
+            if not trigger_price or trigger_price <= 0 or transaction_type not in (Transaction.BUY, Transaction.SELL):
+                messages.error(request, "Please enter a valid trigger price.")
+                return redirect('market:stock_detail', symbol=symbol)
+            
+            Order.objects.create(
+                user=request.user,
+                stock_symbol=symbol,
+                stock_name=stock_info['name'],
+                transaction_type=transaction_type,
+                order_type=order_type,
+                quantity=quantity,
+                trigger_price=trigger_price
+            )
+            messages.success(request, f"Placed {order_type} order to {transaction_type} {quantity} shares of {symbol} at ₹{trigger_price}.")
+            return redirect('market:dashboard')
+        
         current_price = Decimal(str(stock_info['current_price']))
-        total_amount = current_price * quantity
         
-        # Get or create portfolio
-        portfolio, created = Portfolio.objects.get_or_create(user=request.user)
+        # Balance and holding are updated with row locks and conditional
+        # updates, so concurrent orders cannot overspend or oversell
+        try:
+            execute_order(request.user, symbol, stock_info['name'], transaction_type, quantity, current_price)
+        except TradeError as e:
+            messages.error(request, str(e))
+            return redirect('market:trade')
         
-        # Execute transaction based on type
-        with transaction.atomic():
-            if transaction_type == Transaction.BUY:
-                # Check if user has enough balance
-                if request.user.profile.balance < total_amount:
-                    messages.error(request, f"Insufficient funds. You need ₹{total_amount} but have ₹{request.user.profile.balance}.")
-                    return redirect('market:trade')
-                
-                # Update user balance
-                request.user.profile.balance -= total_amount
-                request.user.profile.save()
-                
-                # Update or create holding
-                holding, created = StockHolding.objects.get_or_create(
-                    portfolio=portfolio,
-                    stock_symbol=symbol,
-                    defaults={
-                        'stock_name': stock_info['name'],
-                        'quantity': 0,
-                        'average_buy_price': 0
-                    }
-                )
-                
-                # Update average buy price
-                total_value = (holding.quantity * holding.average_buy_price) + total_amount
-                holding.quantity += quantity
-                holding.average_buy_price = total_value / holding.quantity if holding.quantity > 0 else 0
-                holding.save()
-                
-                # Create transaction record
-                Transaction.objects.create(
-                    portfolio=portfolio,
-                    stock_symbol=symbol,
-                    stock_name=stock_info['name'],
-                    transaction_type=Transaction.BUY,
-                    quantity=quantity,
-                    price=current_price
-                )
-                
-                messages.success(request, f"Successfully bought {quantity} shares of {symbol} at ₹{current_price} per share.")
-                
-            elif transaction_type == Transaction.SELL:
-                # Check if user has the stock and enough quantity
-                try:
-                    holding = StockHolding.objects.get(portfolio=portfolio, stock_symbol=symbol)
-                    if holding.quantity < quantity:
-                        messages.error(request, f"You only have {holding.quantity} shares of {symbol} but are trying to sell {quantity}.")
-                        return redirect('market:trade')
-                except StockHolding.DoesNotExist:
-                    messages.error(request, f"You don't own any shares of {symbol}.")
-                    return redirect('market:trade')
-                
-                # Update user balance
-                request.user.profile.balance += total_amount
-                request.user.profile.save()
-                
-                # Update holding
-                holding.quantity -= quantity
-                if holding.quantity == 0:
-                    holding.delete()
-                else:
-                    holding.save()
-                
-                # Create transaction record
-                Transaction.objects.create(
-                    portfolio=portfolio,
-                    stock_symbol=symbol,
-                    stock_name=stock_info['name'],
-                    transaction_type=Transaction.SELL,
-                    quantity=quantity,
-                    price=current_price
-                )
-                
-                messages.success(request, f"Successfully sold {quantity} shares of {symbol} at ₹{current_price} per share.")
+        if transaction_type == Transaction.BUY:
+            messages.success(request, f"Successfully bought {quantity} shares of {symbol} at ₹{current_price} per share.")
+        else:
+            messages.success(request, f"Successfully sold {quantity} shares of {symbol} at ₹{current_price} per share.")
         
         return redirect('market:dashboard')
     
@@ -203,6 +272,80 @@ def trade(request):
     }
     return render(request, 'market/trade.html', context)
 
+@login_required
+def order_status_api(request, order_id):
+    """API endpoint reporting the progress of one of the user's orders"""
+    order = get_object_or_404(Order.objects.select_related('transaction'), id=order_id, user=request.user)
+    return JsonResponse({
+        'id': order.id,
+        'symbol': order.stock_symbol,
+        'order_type': order.order_type,
+        'transaction_type': order.transaction_type,
+        'quantity': order.quantity,
+        'trigger_price': str(order.trigger_price) if order.trigger_price is not None else None,
+        'status': order.status,
+        'fill_price': str(order.transaction.price) if order.transaction else None,
+        'reason': order.reason,
+        'updated_at': order.updated_at.isoformat()
+    })
+
+@login_required
+@require_POST
+def cancel_order(request, order_id):
+    """Cancel one of the user's open limit or stop orders"""
+    # Conditional on status, so an order the matcher has just filled stays filled
+    cancelled = Order.objects.filter(id=order_id, user=request.user, status=Order.OPEN).update(
+        status=Order.CANCELLED, updated_at=timezone.now()
+    )
+    if cancelled:
+        messages.success(request, "Order cancelled.")
+    else:
+        messages.error(request, "That order is no longer open.")
+    return redirect('market:dashboard')
+
+@login_required
+@require_POST
+def basket_api(request):
+    """
+    API endpoint executing a basket of orders in one transaction. Expects
+    {"legs": [{"symbol": ..., "transaction_type": "buy"|"sell", "quantity": ...}]}
+    where transaction_type is matched case-insensitively
+    """
+    try:
+        legs = [
+            (normalize_symbol(leg['symbol']), str(leg['transaction_type']).lower(), int(leg['quantity']))
+            for leg in json.loads(request.body)['legs']
+        ]
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': "Expected a JSON body with a list of legs."}, status=400)
+    
+    max_legs = getattr(settings, 'BASKET_MAX_LEGS', 100)
+    if len(legs) > max_legs:
+        return JsonResponse({'error': f"A basket can have at most {max_legs} legs."}, status=400)
+    
+    # Price every symbol in the basket with one batched lookup
+    stock_infos = get_stock_infos([symbol for symbol, _, _ in legs])
+    prices = {symbol: Decimal(str(info['current_price'])) for symbol, info in stock_infos.items() if info}
+    names = {symbol: info['name'] for symbol, info in stock_infos.items() if info}
+    try:
+        transactions = execute_basket(request.user, legs, prices, names)
+    except TradeError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    request.user.profile.refresh_from_db(fields=['balance'])
+    return JsonResponse({
+        'transactions': [
+            {
+                'symbol': txn.stock_symbol,
+                'transaction_type': txn.transaction_type,
+                'quantity': txn.quantity,
+                'price': str(txn.price),
+            }
+            for txn in transactions
+        ],
+        'balance': str(request.user.profile.balance)
+    })
+
 @login_required
 def search_stock_api(request):
     """API endpoint for searching stocks"""
@@ -213,30 +356,91 @@ def search_stock_api(request):
     results = search_stocks(query)
     return JsonResponse({'results': results})
 
+@login_required
+def stock_history_api(request, symbol):
+    """API endpoint serving stored OHLCV bars for the price chart"""
+    interval = request.GET.get('interval', '1d')
+    try:
+        start = int(request.GET['start']) if 'start' in request.GET else None
+        end = int(request.GET['end']) if 'end' in request.GET else None
+        bars = get_bar_store().read(normalize_symbol(symbol), interval, start, end)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    return JsonResponse({
+        'symbol': normalize_symbol(symbol),
+        'interval': interval,
+        'bars': {column: values.tolist() for column, values in bars.items()}
+    })
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@etag(history_etag)
+def portfolio_history_api(request):
+    """API endpoint serving daily net worth for the portfolio chart"""
+    portfolio = chart_state(request)[0]
+    return JsonResponse({'history': portfolio_history_data(portfolio) if portfolio else []})
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=holdings_etag, last_modified_func=holdings_last_modified)
+def portfolio_allocation_api(request):
+    """API endpoint serving holding values for the composition chart"""
+    portfolio = chart_state(request)[0]
+    valuation = portfolio.valuation(request.user.profile.balance) if portfolio else value_holdings([])
+    return JsonResponse({'allocation': allocation_data(valuation), 'total_value': float(valuation.total_value)})
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=holdings_etag, last_modified_func=holdings_last_modified)
+def portfolio_holdings_api(request):
+    """API endpoint serving priced holdings and portfolio totals"""
+    portfolio = chart_state(request)[0]
+    if portfolio is None:
+        valuation = value_holdings([], request.user.profile.balance)
+    else:
+        valuation = portfolio.valuation(request.user.profile.balance)
+    return JsonResponse(holdings_data(valuation))
+
+@staff_member_required
+def upstream_stats_api(request):
+    """API endpoint exposing upstream client counters for this worker"""
+    client = get_upstream_client()
+    return JsonResponse({
+        'circuit': client.breaker.state,
+        'stats': client.stats.snapshot()
+    })
+
 @login_required
 def leaderboard(request):
     """View leaderboard of all users"""
-    # Get all users with portfolios and calculate net worth
-    users_data = []
+    # Entries are precomputed by the refresh_leaderboard command; build them
+    # inline only if it has never run
+    if not LeaderboardEntry.objects.exists():
+        LeaderboardRefresher().refresh()
     
-    for portfolio in Portfolio.objects.all():
-        users_data.append({
-            'username': portfolio.user.username,
-            'net_worth': portfolio.net_worth,
-            'portfolio_value': portfolio.total_value,
-            'cash_balance': portfolio.user.profile.balance
-        })
-    
-    # Sort by net worth (highest first)
-    users_data = sorted(users_data, key=lambda x: x['net_worth'], reverse=True)
+    page_size = getattr(settings, 'LEADERBOARD_PAGE_SIZE', 50)
+    last_rank = LeaderboardEntry.objects.aggregate(last_rank=Max('rank'))['last_rank'] or 0
+    num_pages = max(1, -(-last_rank // page_size))
+    try:
+        page = min(max(int(request.GET.get('page', 1)), 1), num_pages)
+    except ValueError:
+        page = 1
     
-    # Add ranking
-    for i, user in enumerate(users_data):
-        user['rank'] = i + 1
+    # A range scan on the rank index, however deep the page
+    first_rank = (page - 1) * page_size + 1
+    entries = LeaderboardEntry.objects.filter(rank__gte=first_rank, rank__lt=first_rank + page_size)
+    my_entry = LeaderboardEntry.objects.filter(user=request.user).first()
     
     context = {
-        'users': users_data,
-        'user_rank': next((user['rank'] for user in users_data if user['username'] == request.user.username), None)
+        'users': entries,
+        'user_rank': my_entry.rank if my_entry else None,
+        'user_entry': my_entry,
+        'user_page': -(-my_entry.rank // page_size) if my_entry else None,
+        'page': page,
+        'num_pages': num_pages,
+        'previous_page': page - 1 if page > 1 else None,
+        'next_page': page + 1 if page < num_pages else None,
     }
     return render(request, 'market/leaderboard.html', context)
 
@@ -271,6 +475,7 @@ def challenges(request):
                 user=request.user,
                 challenge=challenge
             )
+            invalidate_standings(challenge)
             
             messages.success(request, f"Challenge '{name}' created successfully!")
         except Exception as e:
@@ -309,47 +514,28 @@ def challenge_detail(request, challenge_id):
     
     # Handle join challenge request
     if request.method == 'POST' and 'join' in request.POST:
+        if challenge.status not in (Challenge.PENDING, Challenge.ACTIVE):
+            messages.error(request, f"The challenge '{challenge.name}' is no longer open to new participants.")
+            return redirect('market:challenge_detail', challenge_id=challenge.id)
         if not is_participant:
             ChallengeParticipant.objects.create(
                 user=request.user,
                 challenge=challenge
             )
+            invalidate_standings(challenge)
             messages.success(request, f"You have joined the challenge '{challenge.name}'!")
             return redirect('market:challenge_detail', challenge_id=challenge.id)
     
-    # Get all participants with their rankings
-    participants = ChallengeParticipant.objects.filter(challenge=challenge)
-    
-    participants_data = []
-    for p in participants:
-        # For completed challenges, use the stored final value
-        if challenge.status == Challenge.COMPLETED and p.final_portfolio_value:
-            portfolio_value = p.final_portfolio_value
-        else:
-            # For active challenges, calculate the current portfolio value
-            try:
-                portfolio = Portfolio.objects.get(user=p.user)
-                portfolio_value = portfolio.net_worth
-            except Portfolio.DoesNotExist:
-                portfolio_value = challenge.initial_balance
-        
-        participants_data.append({
-            'username': p.user.username,
-            'join_date': p.join_date,
-            'portfolio_value': portfolio_value
-        })
-    
-    # Sort by portfolio value
-    participants_data = sorted(participants_data, key=lambda x: x['portfolio_value'], reverse=True)
-    
-    # Add ranking
-    for i, p in enumerate(participants_data):
-        p['rank'] = i + 1
+    # Ranked in SQL once completed, otherwise served from cached standings
+    standings = challenge_standings(challenge)
+    my_standing = standings.get(request.user.id)
     
     context = {
         'challenge': challenge,
         'is_participant': is_participant,
-        'participants': participants_data,
-        'user_rank': next((p['rank'] for p in participants_data if p['username'] == request.user.username), None)
+        'participants': standings.top(getattr(settings, 'CHALLENGE_STANDINGS_LIMIT', 50)),
+        'participant_count': challenge.participants.count(),
+        'user_rank': my_standing.rank if my_standing else None,
+        'now': timezone.now()
     }
     return render(request, 'market/challenge_detail.html', context)
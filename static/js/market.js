@@ -23,6 +23,9 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Auto-dismiss alerts after 5 seconds
     setupAlertDismissal();
+    
+    // Keep prices on the page live
+    setupQuoteStream();
 });
 
 /**
@@ -121,6 +124,83 @@ function setupAlertDismissal() {
     });
 }
 
+/**
+ * Subscribe to the live quote stream for every symbol shown on the page.
+ * Elements marked with data-quote="SYMBOL" and data-quote-field are updated
+ * in place as prices change; holding rows carry data-quantity and
+ * data-average-price so their value and profit can be recomputed.
+ */
+function setupQuoteStream() {
+    const streamUrl = document.body.dataset.quoteStreamUrl;
+    const elements = document.querySelectorAll('[data-quote]');
+    if (!streamUrl || elements.length === 0 || typeof EventSource === 'undefined') {
+        return;
+    }
+    
+    const symbols = [...new Set(Array.from(elements, element => element.dataset.quote))];
+    const source = new EventSource(`${streamUrl}?symbols=${encodeURIComponent(symbols.join(','))}`);
+    source.onmessage = function(event) {
+        const changes = JSON.parse(event.data);
+        Object.entries(changes).forEach(([symbol, quote]) => {
+            document.querySelectorAll(`[data-quote="${CSS.escape(symbol)}"]`).forEach(element => {
+                updateQuoteElement(element, quote);
+            });
+        });
+    };
+}
+
+/**
+ * Show a streamed quote in one element
+ * @param {Element} element - Element with data-quote-field
+ * @param {Object} quote - {price, change_percent}
+ */
+function updateQuoteElement(element, quote) {
+    const row = element.closest('[data-quantity]');
+    const quantity = row ? parseFloat(row.dataset.quantity) : 0;
+    const cost = row ? quantity * parseFloat(row.dataset.averagePrice) : 0;
+    const value = quantity * quote.price;
+    let text;
+    let sign;
+    
+    switch (element.dataset.quoteField) {
+        case 'price':
+            text = formatCurrency(quote.price);
+            break;
+        case 'change_percent':
+            sign = quote.change_percent;
+            text = quote.change_percent.toFixed(2) + '%';
+            break;
+        case 'value':
+            text = formatCurrency(value);
+            break;
+        case 'profit_loss':
+            sign = value - cost;
+            text = formatCurrency(value - cost);
+            break;
+        case 'profit_loss_percentage':
+            sign = cost ? (value - cost) / cost * 100 : 0;
+            text = sign.toFixed(2) + '%';
+            break;
+        default:
+            return;
+    }
+    
+    if (element.textContent.trim() === text) {
+        return;
+    }
+    element.textContent = text;
+    if (sign !== undefined) {
+        const signed = element.closest('[data-quote-sign]') || element;
+        signed.classList.toggle('text-success', sign >= 0);
+        signed.classList.toggle('text-danger', sign < 0);
+    }
+    
+    // Restart the highlight animation
+    element.classList.remove('quote-flash');
+    void element.offsetWidth;
+    element.classList.add('quote-flash');
+}
+
 /**
  * Format currency amounts with ₹ symbol
  * @param {number} amount - The amount to format
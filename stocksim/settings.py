@@ -56,6 +56,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'market.context_processors.quote_stream',
             ],
         },
     },
@@ -83,6 +84,13 @@ else:
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
             'NAME': BASE_DIR / 'db.sqlite3',
+            # Take the write lock when a transaction begins, so concurrent
+            # trades queue on the busy timeout instead of failing to upgrade
+            # a read lock with "database is locked"
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
         }
     }
 
@@ -134,9 +142,103 @@ LOGIN_REDIRECT_URL = '/dashboard/'
 LOGIN_URL = '/accounts/login/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Yahoo Finance host; point at manage.py run_fake_yahoo for offline testing and benchmarks
+YAHOO_FINANCE_BASE_URL = os.environ.get('YAHOO_FINANCE_BASE_URL', 'https://query1.finance.yahoo.com')
+
 # Yahoo Finance API key (can be None, as basic endpoints work without it)
 YAHOO_FINANCE_API_KEY = os.environ.get('YAHOO_FINANCE_API_KEY', None)
 
+# Quote cache: 'memory' (per process), 'django' (QUOTE_CACHE_ALIAS) or 'sqlite' (shared file)
+QUOTE_CACHE_BACKEND = os.environ.get('QUOTE_CACHE_BACKEND', 'memory')
+QUOTE_CACHE_ALIAS = os.environ.get('QUOTE_CACHE_ALIAS', 'default')
+QUOTE_CACHE_PATH = os.environ.get('QUOTE_CACHE_PATH', str(BASE_DIR / 'quote_cache.sqlite3'))
+QUOTE_CACHE_TTL = int(os.environ.get('QUOTE_CACHE_TTL', 60))  # seconds
+QUOTE_CACHE_FALLBACK_TTL = int(os.environ.get('QUOTE_CACHE_FALLBACK_TTL', 15))  # seconds
+QUOTE_CACHE_MAX_ENTRIES = int(os.environ.get('QUOTE_CACHE_MAX_ENTRIES', 1000))
+
+# Upper bound on how long the home page market tables stay cached; they are
+# re-rendered sooner whenever a cached price changes (capped at
+# QUOTE_CACHE_TTL when the quote feed is disabled)
+INDEX_FRAGMENT_TIMEOUT = int(os.environ.get('INDEX_FRAGMENT_TIMEOUT', 300))  # seconds
+
+# Maximum number of symbols sent in one Yahoo Finance quote request
+QUOTE_BATCH_SIZE = int(os.environ.get('QUOTE_BATCH_SIZE', 50))
+
+# Worker threads shared by all upstream quote fetches in a process
+QUOTE_FETCH_CONCURRENCY = int(os.environ.get('QUOTE_FETCH_CONCURRENCY', 4))
+
+# Serve the quote-bound pages with async views; only useful under an ASGI
+# server such as uvicorn (see the README)
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'false').lower() == 'true'
+
+# Live quote stream (ASYNC_VIEWS only): seconds between quote polls shared by
+# all clients of a worker, idle keepalive seconds, and symbols per client
+STREAM_POLL_INTERVAL = float(os.environ.get('STREAM_POLL_INTERVAL', 2))
+STREAM_HEARTBEAT = float(os.environ.get('STREAM_HEARTBEAT', 15))
+STREAM_MAX_SYMBOLS = int(os.environ.get('STREAM_MAX_SYMBOLS', 100))
+
+# Quote feed (manage.py run_quote_feed). When enabled, web requests only read the
+# shared quote cache and never call Yahoo Finance for quotes themselves.
+QUOTE_FEED_ENABLED = os.environ.get('QUOTE_FEED_ENABLED', 'false').lower() == 'true'
+QUOTE_FEED_INTERVAL = float(os.environ.get('QUOTE_FEED_INTERVAL', 15))  # seconds
+QUOTE_FEED_TTL = int(os.environ.get('QUOTE_FEED_TTL', 3600))  # seconds a fed quote stays servable
+QUOTE_FEED_RECENT_SYMBOLS = int(os.environ.get('QUOTE_FEED_RECENT_SYMBOLS', 200))
+
+# Simulated market used for fallback quotes; same seed gives the same prices in every worker
+MARKET_SIM_SEED = int(os.environ.get('MARKET_SIM_SEED', 42))
+MARKET_SIM_TICK_SECONDS = int(os.environ.get('MARKET_SIM_TICK_SECONDS', 60))
+
+# Directory of the memory-mapped OHLCV history store (manage.py load_price_history)
+HISTORY_ROOT = os.environ.get('HISTORY_ROOT', str(BASE_DIR / 'history'))
+
+# Seconds search results wait for prices before being returned without them
+SEARCH_QUOTE_DEADLINE = float(os.environ.get('SEARCH_QUOTE_DEADLINE', 1.5))
+
+# Materialized leaderboard (see manage.py refresh_leaderboard)
+LEADERBOARD_REFRESH_INTERVAL = float(os.environ.get('LEADERBOARD_REFRESH_INTERVAL', 60))
+LEADERBOARD_BATCH_SIZE = int(os.environ.get('LEADERBOARD_BATCH_SIZE', 1000))
+LEADERBOARD_PAGE_SIZE = int(os.environ.get('LEADERBOARD_PAGE_SIZE', 50))
+
+# Seconds between challenge scheduler passes (see manage.py run_challenge_scheduler)
+CHALLENGE_SCHEDULER_INTERVAL = float(os.environ.get('CHALLENGE_SCHEDULER_INTERVAL', 60))
+
+# Seconds between limit/stop order matching passes (see manage.py run_order_matcher)
+ORDER_MATCHER_INTERVAL = float(os.environ.get('ORDER_MATCHER_INTERVAL', 5))
+
+# Queue market orders for the order executor instead of filling them in the
+# request (see manage.py run_order_executor), and executor tuning
+ORDER_INTAKE_ASYNC = os.environ.get('ORDER_INTAKE_ASYNC', 'false').lower() == 'true'
+ORDER_EXECUTOR_INTERVAL = float(os.environ.get('ORDER_EXECUTOR_INTERVAL', 0.5))
+ORDER_EXECUTOR_BATCH_SIZE = int(os.environ.get('ORDER_EXECUTOR_BATCH_SIZE', 100))
+ORDER_EXECUTOR_STALE_AFTER = int(os.environ.get('ORDER_EXECUTOR_STALE_AFTER', 300))
+
+# Daily portfolio snapshots (see manage.py snapshot_portfolios) and days shown on the dashboard chart
+SNAPSHOT_BATCH_SIZE = int(os.environ.get('SNAPSHOT_BATCH_SIZE', 500))
+PORTFOLIO_HISTORY_DAYS = int(os.environ.get('PORTFOLIO_HISTORY_DAYS', 30))
+
+# Transactions between saved ledger replay checkpoints (see manage.py rebuild_ledger)
+LEDGER_CHECKPOINT_INTERVAL = int(os.environ.get('LEDGER_CHECKPOINT_INTERVAL', 500))
+
+# Basket orders: most legs accepted in one request
+BASKET_MAX_LEGS = int(os.environ.get('BASKET_MAX_LEGS', 100))
+
+# Challenge standings: seconds active-challenge rankings are cached, and rows shown
+CHALLENGE_STANDINGS_TTL = int(os.environ.get('CHALLENGE_STANDINGS_TTL', 60))
+CHALLENGE_STANDINGS_LIMIT = int(os.environ.get('CHALLENGE_STANDINGS_LIMIT', 50))
+
+# Instrument master list for symbol search, in NSE EQUITY_L.csv format.
+# Defaults to the short list bundled in market/data/instruments.csv
+INSTRUMENTS_PATH = os.environ.get('INSTRUMENTS_PATH')
+
+# Upstream HTTP client: connection pool, retries and circuit breaker
+UPSTREAM_TIMEOUT = float(os.environ.get('UPSTREAM_TIMEOUT', 5))  # seconds
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 10))
+UPSTREAM_MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', 2))
+UPSTREAM_BACKOFF_BASE = float(os.environ.get('UPSTREAM_BACKOFF_BASE', 0.2))  # seconds
+UPSTREAM_BACKOFF_MAX = float(os.environ.get('UPSTREAM_BACKOFF_MAX', 2.0))  # seconds
+UPSTREAM_BREAKER_THRESHOLD = int(os.environ.get('UPSTREAM_BREAKER_THRESHOLD', 5))  # consecutive failures
+UPSTREAM_BREAKER_COOLDOWN = float(os.environ.get('UPSTREAM_BREAKER_COOLDOWN', 30))  # seconds
+
 # Initial User Balance
 INITIAL_BALANCE = 100000  # ₹1,00,000
 